@@ -11,15 +11,27 @@ import sys
 # Add current directory to path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from model import model, dataset, transform, device, predict
-from face_detector import FaceDetector
+from inference import model, class_names, device, model_version, model_transform_spec
+from face_detector import create_detector_pool_from_env
+from batching import create_batcher_from_env
+from image_io import read_image_upload, decode_image_array, upload_digest, ImageTooLargeError
+from prediction_cache import create_cache_from_env
+from perceptual_hash import dhash, create_near_duplicate_index_from_env
+from preprocessing import FusedPreprocessor, TensorPool
 
 app = Flask(__name__, static_folder='static', static_url_path='/static')
 CORS(app)
 
 # Initialize model and face detector
 print("Initializing model and face detector...")
-face_detector = FaceDetector()
+face_detector = create_detector_pool_from_env()
+batcher = create_batcher_from_env(model, device)
+prediction_cache = create_cache_from_env(model_version)
+near_duplicates = create_near_duplicate_index_from_env()
+# Crop only when a face is found, then resize and normalize into pooled buffers
+preprocessor = FusedPreprocessor(model_transform_spec, face_detector, letterbox_size=None,
+                                 crop_without_face=False)
+input_buffers = TensorPool(preprocessor.shape)
 print("✅ Model and face detector initialized successfully!")
 
 # Character data for additional info
@@ -162,61 +174,66 @@ def index():
 def predict_route():
     try:
         print("Request received: Starting image processing...")
-        data = request.get_json()
         
-        if not data or 'image' not in data:
+        # Read the uploaded image (raw body, multipart or base64 JSON)
+        try:
+            upload = read_image_upload(request)
+        except ValueError as e:
+            print(f"Error decoding image: {e}")
+            return jsonify({'error': 'Failed to decode image data'}), 400
+        if upload is None:
             return jsonify({'error': 'No image data provided'}), 400
         
-        # Decode Base64 image
-        print("Decoding Base64 image...")
-        image_data = data['image']
+        # Serve repeated uploads of the same image from the cache
+        image_digest = upload_digest(upload)
+        cached_response = prediction_cache.get(image_digest)
+        if cached_response is not None:
+            print("Cache hit, returning stored prediction")
+            return jsonify(cached_response)
+        
+        print("Decoding image...")
         try:
-            if ',' in image_data:
-                base64_data = image_data.split(",")[1]
-            else:
-                base64_data = image_data
-            image = Image.open(io.BytesIO(base64.b64decode(base64_data))).convert("RGB")
+            image = decode_image_array(upload)
             print("Image successfully decoded")
+        except ImageTooLargeError as e:
+            print(f"Rejected image: {e}")
+            return jsonify({'error': str(e)}), 413
         except Exception as e:
             print(f"Error decoding image: {e}")
             return jsonify({'error': 'Failed to decode image data'}), 400
         
-        # Face detection
-        print("Attempting face detection...")
-        try:
-            # Convert PIL to OpenCV format
-            opencv_image = cv2.cvtColor(np.array(image), cv2.COLOR_RGB2BGR)
-            face_detected, cropped_image = face_detector.detect_face(opencv_image)
-            
-            if face_detected:
-                print("Face detection successful, using cropped image")
-                # Convert back to PIL for model
-                image = Image.fromarray(cv2.cvtColor(cropped_image, cv2.COLOR_BGR2RGB))
-            else:
-                print("No face detected, using original image")
-        except Exception as e:
-            print(f"Face detection error: {e}, using original image")
-        
-        # Transform image for model
-        print("Transforming image for model...")
-        try:
-            transformed_image = transform(image).unsqueeze(0).to(device)
-            print("Image successfully transformed")
-        except Exception as e:
-            print(f"Error transforming image: {e}")
-            return jsonify({'error': 'Failed to process image for model'}), 400
+        # Serve near-duplicates of earlier uploads without face detection or inference
+        image_hash = None
+        if near_duplicates is not None:
+            image_hash = dhash(image)
+            match = near_duplicates.find(image_hash)
+            if match is not None:
+                response_data, distance = match
+                print(f"Near-duplicate of an earlier upload ({distance} bits apart), returning its prediction")
+                prediction_cache.put(image_digest, response_data)
+                return jsonify(response_data)
         
-        # Run prediction
-        print("Running model prediction...")
-        try:
-            probabilities = predict(model, transformed_image, device)
-            class_names = dataset.data.classes
-            predicted_class = class_names[probabilities.argmax().item()]
-            print(f"Prediction probabilities: {probabilities.cpu().numpy()}")
-            print(f"Predicted class: {predicted_class}")
-        except Exception as e:
-            print(f"Error during prediction: {e}")
-            return jsonify({'error': 'Failed to run prediction'}), 500
+        with input_buffers.acquire() as buffer:
+            # Face detection, crop, resize and normalize in one pass
+            print("Preprocessing image for model...")
+            try:
+                transformed_image, face_detected = preprocessor(image, out=buffer)
+                print("Face detection successful, using cropped image" if face_detected
+                      else "No face detected, using original image")
+            except Exception as e:
+                print(f"Error transforming image: {e}")
+                return jsonify({'error': 'Failed to process image for model'}), 400
+            
+            # Run prediction
+            print("Running model prediction...")
+            try:
+                probabilities = batcher.predict(transformed_image.unsqueeze(0).to(device))
+                predicted_class = class_names[probabilities.argmax().item()]
+                print(f"Prediction probabilities: {probabilities.cpu().numpy()}")
+                print(f"Predicted class: {predicted_class}")
+            except Exception as e:
+                print(f"Error during prediction: {e}")
+                return jsonify({'error': 'Failed to run prediction'}), 500
         
         # Get character info
         character_info = CHARACTER_DATA.get(predicted_class, {})
@@ -224,13 +241,18 @@ def predict_route():
         # Calculate confidence (max probability)
         confidence = probabilities.max().item()
         
-        return jsonify({
+        response_data = {
             'success': True,
             'character': predicted_class,
             'confidence': confidence,
             'probabilities': probabilities.cpu().numpy().tolist(),
             'character_info': character_info
-        })
+        }
+        prediction_cache.put(image_digest, response_data)
+        if near_duplicates is not None:
+            near_duplicates.add(image_hash, response_data)
+        
+        return jsonify(response_data)
         
     except Exception as e:
         print(f"Unexpected error: {e}")
@@ -241,17 +263,22 @@ def model_info():
     return jsonify({
         'model_path': 'One_Piece_Model.pth',
         'model_type': 'MobileNetV2',
-        'num_classes': len(dataset.data.classes),
-        'classes': dataset.data.classes,
+        'num_classes': len(class_names),
+        'classes': class_names,
         'device': str(device)
     })
 
+@app.route('/api/cache-stats')
+def cache_stats():
+    return jsonify(prediction_cache.stats())
+
 @app.route('/api/health')
 def health():
     return jsonify({
         'status': 'healthy',
         'model_loaded': model is not None,
-        'face_detector_loaded': face_detector is not None
+        'face_detector_loaded': face_detector is not None,
+        'batching': batcher.stats()
     })
 
 @app.route('/api/process_face', methods=['POST'])
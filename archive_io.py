@@ -0,0 +1,234 @@
+#!/usr/bin/env python3
+"""
+Archive sources for One Piece Character Classifier
+Lists and reads images stored in zip and tar archives without extracting
+them. A member is addressed as '<archive path>!<member name>', which is used
+as its image path everywhere a plain file path is
+"""
+
+import os
+import tarfile
+import zipfile
+import threading
+
+ARCHIVE_SUFFIXES = ('.zip', '.tar', '.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+# Compressed tars, which can only be read front to back
+STREAMED_SUFFIXES = ('.tar.gz', '.tgz', '.tar.bz2', '.tbz2', '.tar.xz', '.txz')
+MEMBER_SEPARATOR = '!'
+
+# Members larger than this are reported as errors instead of being read into memory
+MAX_MEMBER_BYTES = int(os.environ.get('ARCHIVE_MAX_MEMBER_BYTES', 256 * 1024 * 1024))
+
+# Open archives by path, per thread (and per process: DataLoader workers
+# open their own), as reading moves an archive's position
+_local = threading.local()
+
+
+def is_archive(path):
+    """Whether path names a zip or tar archive, judging by its suffix"""
+    return str(path).lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def is_streamed_archive(path):
+    """Whether path names a compressed tar, judging by its suffix"""
+    return str(path).lower().endswith(STREAMED_SUFFIXES)
+
+
+def member_path(archive_path, member):
+    return f"{archive_path}{MEMBER_SEPARATOR}{member}"
+
+
+def split_member_path(path):
+    """Split '<archive>!<member>' into (archive, member), or return None for a plain path
+
+    The archive part must be an existing archive file, so plain file names
+    containing '!' are left alone.
+    """
+    path = str(path)
+    start = 0
+    while True:
+        index = path.find(MEMBER_SEPARATOR, start)
+        if index < 0:
+            return None
+        archive = path[:index]
+        if is_archive(archive) and os.path.isfile(archive):
+            return archive, path[index + 1:]
+        start = index + 1
+
+
+class _ZipArchive:
+    def __init__(self, path):
+        self._zip = zipfile.ZipFile(path)
+
+    def members(self):
+        for info in self._zip.infolist():
+            if not info.is_dir():
+                yield info.filename, info.file_size
+
+    def size(self, member):
+        return self._zip.getinfo(member).file_size
+
+    def read(self, member):
+        info = self._zip.getinfo(member)
+        if info.file_size > MAX_MEMBER_BYTES:
+            raise ValueError(f"Archive member is {info.file_size} bytes, limit is {MAX_MEMBER_BYTES}")
+        return self._zip.read(info)
+
+    def close(self):
+        self._zip.close()
+
+
+class _TarArchive:
+    # Uncompressed tars seek freely: the index is built from the headers alone
+    def __init__(self, path):
+        self._tar = tarfile.open(path, 'r:*')
+        self._index = {info.name: info for info in self._tar.getmembers() if info.isfile()}
+
+    def members(self):
+        for name, info in self._index.items():
+            yield name, info.size
+
+    def _info(self, member):
+        info = self._index.get(member)
+        if info is None:
+            raise KeyError(f"There is no item named '{member}' in the archive")
+        return info
+
+    def size(self, member):
+        return self._info(member).size
+
+    def read(self, member):
+        info = self._info(member)
+        if info.size > MAX_MEMBER_BYTES:
+            raise ValueError(f"Archive member is {info.size} bytes, limit is {MAX_MEMBER_BYTES}")
+        with self._tar.extractfile(info) as f:
+            return f.read()
+
+    def close(self):
+        self._tar.close()
+
+
+class _TarStream:
+    # Seeking back in a gzip, bzip2 or xz stream decompresses it again from
+    # the start, so compressed tars are read in stream mode, front to back:
+    # members() yields each member while it is the current one, when size()
+    # and read() take it without moving. Asking for a member further on
+    # reads ahead to it, one already passed starts a new pass.
+    def __init__(self, path):
+        self.path = path
+        self._tar = None
+        self._current = None
+        self._data = None
+
+    def _restart(self):
+        self.close()
+        self._tar = tarfile.open(self.path, 'r|*')
+
+    def _next(self):
+        """Move to the next regular file, False at the end of the archive"""
+        self._current = self._data = None
+        if self._tar is None:
+            return False
+        while True:
+            info = self._tar.next()
+            if info is None:
+                self.close()
+                return False
+            if info.isfile():
+                self._current = info
+                return True
+
+    def _seek(self, member):
+        if self._current is not None and self._current.name == member:
+            return self._current
+        for restart in (False, True):
+            if restart:
+                self._restart()
+            while self._next():
+                if self._current.name == member:
+                    return self._current
+        raise KeyError(f"There is no item named '{member}' in the archive")
+
+    def members(self):
+        self._restart()
+        while self._next():
+            yield self._current.name, self._current.size
+
+    def size(self, member):
+        return self._seek(member).size
+
+    def read(self, member):
+        info = self._seek(member)
+        if info.size > MAX_MEMBER_BYTES:
+            raise ValueError(f"Archive member is {info.size} bytes, limit is {MAX_MEMBER_BYTES}")
+        if self._data is None:
+            # A stream member can be extracted only once
+            with self._tar.extractfile(info) as f:
+                self._data = f.read()
+        return self._data
+
+    def close(self):
+        if self._tar is not None:
+            self._tar.close()
+        self._tar = self._current = self._data = None
+
+
+def open_archive(path):
+    """This thread's open handle on an archive, reopened if the file changed"""
+    path = os.path.abspath(path)
+    stat = os.stat(path)
+    key = (stat.st_size, stat.st_mtime_ns)
+    if getattr(_local, 'pid', None) != os.getpid():
+        # Handles inherited from the parent process are left to it
+        _local.archives = {}
+        _local.pid = os.getpid()
+    cached = _local.archives.get(path)
+    if cached is not None and cached[0] == key:
+        return cached[1]
+    if cached is not None:
+        cached[1].close()
+    if zipfile.is_zipfile(path):
+        archive = _ZipArchive(path)
+    elif is_streamed_archive(path):
+        archive = _TarStream(path)
+    else:
+        archive = _TarArchive(path)
+    _local.archives[path] = (key, archive)
+    return archive
+
+
+def iter_archive_members(archive_path):
+    """Yield (member name, size) for the regular files of an archive, in archive order
+
+    For compressed tars this is the pass that reads them: read_source() of the
+    member just yielded, from the same thread, costs no extra decompression.
+    """
+    yield from open_archive(archive_path).members()
+
+
+def read_source(path):
+    """Bytes of an image file or of an '<archive>!<member>' path"""
+    split = split_member_path(path)
+    if split is None:
+        with open(path, 'rb') as f:
+            return f.read()
+    archive, member = split
+    return open_archive(archive).read(member)
+
+
+def source_stat(path):
+    """(size, mtime_ns) of an image file or archive member
+
+    Members have no mtime of their own and take the archive's, so touching or
+    growing an archive makes its members look modified, not changed in size.
+    """
+    split = split_member_path(path)
+    if split is None:
+        stat = os.stat(path)
+        return stat.st_size, stat.st_mtime_ns
+    archive, member = split
+    try:
+        size = open_archive(archive).size(member)
+    except KeyError as e:
+        raise FileNotFoundError(str(e))
+    return size, os.stat(archive).st_mtime_ns
@@ -5,22 +5,58 @@ Processes multiple images and generates detailed reports
 """
 
 import os
+import sys
 import json
+import time
+import html
+import signal
 import argparse
+import subprocess
+from contextlib import ExitStack
 import pandas as pd
 from datetime import datetime
 from pathlib import Path
 from PIL import Image
 import torch
-from model import model, transform, device, predict, dataset
+from torch.utils.data import DataLoader
+from inference import model, class_names, transform, device, predict, model_version, model_transform_spec
+from preprocessing import ImageFileDataset, PathBatches, collate_images, limit_worker_threads
+from batch_results import JsonlResultsWriter, ParquetResultsWriter, SummaryStats, read_results
+from job_manifest import JobManifest
+from file_discovery import IMAGE_EXTENSIONS, SYMLINK_POLICIES, ImageFileScanner
+from watch_folder import FolderWatcher
+from archive_io import is_archive
+from perceptual_hash import MultiIndexHashIndex
+
+# Detailed report rows are rendered and written this many at a time
+REPORT_CHUNK_ROWS = 10000
+
+
+def parse_shard(spec):
+    """Parse a shard spec 'i/N' (0 <= i < N) into (i, N)"""
+    try:
+        index, count = (int(part) for part in spec.split('/'))
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{spec}', expected i/N")
+    if count < 1 or not 0 <= index < count:
+        raise argparse.ArgumentTypeError(f"Invalid shard '{spec}', need 0 <= i < N")
+    return index, count
+
+
+def shard_name(shard):
+    index, count = shard
+    return f"shard-{index:04d}-of-{count:04d}"
 
 class BatchProcessor:
+    # Face crop stage options, matching the /predict route of app.py
+    FACE_CROP_OPTIONS = {'letterbox_size': None, 'crop_without_face': False}
+    
     def __init__(self, model_path=None):
         """Initialize the batch processor"""
         self.model = model
         self.transform = transform
         self.device = device
-        self.class_names = dataset.data.classes
+        self.class_names = class_names
         
         # Character data for reports
         self.character_data = {
@@ -52,113 +88,428 @@ class BatchProcessor:
             
             # Get prediction
             probabilities = predict(self.model, transformed_image, self.device)
-            predicted_class = self.class_names[probabilities.argmax()]
-            confidence = float(probabilities.max())
-            
-            return {
-                'image_path': str(image_path),
-                'predicted_class': predicted_class,
-                'confidence': confidence,
-                'probabilities': probabilities.tolist(),
-                'success': True
-            }
+            return self._prediction_result(image_path, probabilities)
         except Exception as e:
-            return {
-                'image_path': str(image_path),
-                'error': str(e),
-                'success': False
-            }
-    
-    def process_directory(self, input_dir, output_dir=None, file_extensions=None):
-        """Process all images in a directory"""
-        if file_extensions is None:
-            file_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
-        
-        input_path = Path(input_dir)
-        if not input_path.exists():
-            raise ValueError(f"Input directory {input_dir} does not exist")
+            return self._error_result(image_path, e)
+    
+    def _prediction_result(self, image_path, probabilities):
+        """Result dict for one image's (1, num_classes) probabilities"""
+        predicted_class = self.class_names[probabilities.argmax()]
+        confidence = float(probabilities.max())
         
-        # Find all image files
-        image_files = []
-        for ext in file_extensions:
-            image_files.extend(input_path.glob(f"*{ext}"))
-            image_files.extend(input_path.glob(f"*{ext.upper()}"))
+        return {
+            'image_path': str(image_path),
+            'predicted_class': predicted_class,
+            'confidence': confidence,
+            'probabilities': probabilities.tolist(),
+            'success': True
+        }
+    
+    def _error_result(self, image_path, error):
+        return {
+            'image_path': str(image_path),
+            'error': str(error),
+            'success': False
+        }
+    
+    def scan_images(self, input_dir, file_extensions=None, recursive=True, include=None, exclude=None,
+                    symlinks='files', shard=None, archives=False):
+        """Lazy, re-iterable view of the image files under input_dir (see file_discovery)
         
+        The tree is walked once per iteration with os.scandir, so batches start
+        as soon as the first files are found and the list is never held in memory.
+        input_dir may also be a zip or tar archive, and with archives the
+        archives inside the tree are read too; their images are classified
+        without being extracted, keyed as '<archive>!<member>'.
+        """
+        if not (os.path.isdir(input_dir) or (is_archive(input_dir) and os.path.isfile(input_dir))):
+            raise ValueError(f"Input directory {input_dir} does not exist")
+        return ImageFileScanner(input_dir, file_extensions or IMAGE_EXTENSIONS, recursive=recursive,
+                                include=include, exclude=exclude, symlinks=symlinks, shard=shard,
+                                archives=archives)
+    
+    def find_images(self, input_dir, file_extensions=None, **scan_options):
+        """List the image files under input_dir (see scan_images for the options)"""
+        image_files = [Path(f) for f in self.scan_images(input_dir, file_extensions, **scan_options)]
         print(f"Found {len(image_files)} images to process")
+        return image_files
+    
+    def open_manifest(self, output_dir=None, shard=None, face_crop=False):
+        """Open the processed-file manifest of an output directory (one per shard)"""
+        output_path = Path(output_dir or "batch_reports")
+        output_path.mkdir(parents=True, exist_ok=True)
+        name = f"manifest_{shard_name(shard)}.sqlite" if shard else "manifest.sqlite"
+        # Face-cropped results aren't interchangeable with full-image ones
+        return JobManifest(output_path / name, f"{model_version}+face" if face_crop else model_version)
+    
+    def open_parquet(self, output_dir, suffix):
+        """Open a Parquet results writer for results_<suffix>.parquet"""
+        results_file = Path(output_dir or "batch_reports") / f"results_{suffix}.parquet"
+        print(f"Writing Parquet results to: {results_file}")
+        return ParquetResultsWriter(results_file, self.class_names)
+    
+    def process_directory(self, input_dir, output_dir=None, file_extensions=None, batch_size=1, workers=0,
+                          resume=True, parquet=False, face_crop=False, dedup_distance=None, **scan_options):
+        """Process all images under a directory, recursively by default
+        
+        Files are discovered lazily (see scan_images, which takes the recursive,
+        include, exclude and symlinks scan_options), decoded by workers
+        background processes (0 decodes in this process) and classified
+        batch_size at a time; see iter_result_batches(). Every result is
+        recorded in the output directory's manifest, and with resume, files
+        classified by an earlier run are not classified again: their stored
+        results are returned instead. Results come back in discovery order.
+        
+        With parquet, results are also written to results_<timestamp>.parquet
+        in the output directory as batches finish. face_crop adds the web
+        server's face crop stage and dedup_distance the near-duplicate stage
+        (see iter_result_batches).
+        """
+        image_files = self.scan_images(input_dir, file_extensions, **scan_options)
         
-        # Process each image
         results = []
-        for i, image_file in enumerate(image_files, 1):
-            print(f"Processing {i}/{len(image_files)}: {image_file.name}")
-            result = self.process_image(image_file)
-            results.append(result)
+        with ExitStack() as stack:
+            manifest = stack.enter_context(self.open_manifest(output_dir, face_crop=face_crop))
+            parquet_writer = None
+            if parquet:
+                timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+                parquet_writer = stack.enter_context(self.open_parquet(output_dir, timestamp))
+            
+            for batch_results in self.iter_result_batches(image_files, batch_size, workers, face_crop,
+                                                          manifest, resume, dedup_distance):
+                if parquet_writer is not None:
+                    parquet_writer.write_batch(batch_results)
+                results.extend(batch_results)
         
+        if not results:
+            print("No image files found")
         return results
     
-    def generate_report(self, results, output_dir=None):
-        """Generate detailed report from batch processing results"""
-        if output_dir is None:
-            output_dir = Path("batch_reports")
+    def process_files(self, image_files, batch_size=1, workers=0, face_crop=False, dedup_distance=None):
+        """Classify image files in batches, returning one result per file in input order"""
+        results = []
+        for batch_results in self.iter_result_batches(image_files, batch_size, workers, face_crop,
+                                                      dedup_distance=dedup_distance):
+            results.extend(batch_results)
+        return results
+    
+    def iter_result_batches(self, image_files, batch_size=1, workers=0, face_crop=False, manifest=None,
+                            resume=True, dedup_distance=None, dedup_index=None):
+        """Classify image files in batches, yielding each batch's results in input order
         
-        output_path = Path(output_dir)
-        output_path.mkdir(exist_ok=True)
+        image_files may be a list or a lazy scan_images() view, which is walked
+        once, in this process, as the decode workers need more files. A file that fails to decode only fails its own
+        result; a failed forward pass fails the results of its batch. With
+        face_crop, images are cropped to the detected face as on the web,
+        detection running in the decode workers, and each result records
+        'face_detected'.
+        
+        With a manifest, fresh results are recorded in it as batches finish, and
+        with resume the workers check it first, so files it already holds are
+        neither read nor classified and their stored results are yielded instead.
+        
+        With dedup_distance, an image whose perceptual hash is within that many
+        bits (of 64) of an image already classified in this run reuses its
+        result, marked with 'duplicate_of' and 'hash_distance', without going
+        through face detection or the model (see ImageFileDataset). Passing a
+        MultiIndexHashIndex as dedup_index instead keeps using (and filling) it
+        across calls, its max_distance taking the place of dedup_distance.
+        """
+        # Classified results by perceptual hash, across all workers
+        classified = dedup_index
+        if classified is None and dedup_distance is not None:
+            classified = MultiIndexHashIndex(dedup_distance)
+        
+        dataset = ImageFileDataset(
+            self.transform,
+            face_crop=self.FACE_CROP_OPTIONS if face_crop else None,
+            transform_spec=model_transform_spec,
+            lookup=manifest.lookup if manifest is not None and resume else None,
+            dedup_distance=classified.max_distance if classified is not None else None
+        )
+        loader = DataLoader(
+            dataset,
+            batch_sampler=PathBatches(image_files, batch_size),
+            num_workers=max(0, workers),
+            collate_fn=collate_images,
+            worker_init_fn=limit_worker_threads if workers > 0 else None,
+            pin_memory=self.device.type == 'cuda'
+        )
+        total = len(image_files) if hasattr(image_files, '__len__') else None
+        
+        processed = 0
+        reused = 0
+        duplicates = 0
+        start_time = time.perf_counter()
+        stage_seconds = {}
+        stage_counts = {}
+        
+        for batch, items in loader:
+            # Batch rows belong to the files that were actually decoded, in order
+            decoded = [item for item in items
+                       if item[2] is None and 'result' not in item[3] and 'near_duplicate' not in item[3]]
+            matches = {}
+            if classified is not None:
+                for position, path, error, info in items:
+                    stored = info.get('result')
+                    if stored and stored['success'] and 'dhash' in stored and 'duplicate_of' not in stored:
+                        classified.add(int(stored['dhash'], 16), stored)
+                # Duplicates of images classified in an earlier batch skip the forward pass
+                keep = []
+                for row, (position, _, _, info) in enumerate(decoded):
+                    match = classified.find(int(info['dhash'], 16))
+                    if match is None:
+                        keep.append(row)
+                    else:
+                        matches[position] = match
+                if len(keep) < len(decoded):
+                    batch = batch[keep] if keep else None
+                    decoded = [decoded[row] for row in keep]
+            
+            predictions = {}
+            if batch is not None:
+                try:
+                    inference_start = time.perf_counter()
+                    probabilities = predict(self.model, batch.to(self.device, non_blocking=True), self.device)
+                    stage_seconds['inference'] = (stage_seconds.get('inference', 0.0) +
+                                                  time.perf_counter() - inference_start)
+                    stage_counts['inference'] = stage_counts.get('inference', 0) + len(decoded)
+                    for row, (position, path, _, info) in enumerate(decoded):
+                        predictions[position] = self._prediction_result(path, probabilities[row:row + 1])
+                        if classified is not None:
+                            # Same dict as the yielded result, which gets info merged below
+                            classified.add(int(info['dhash'], 16), predictions[position])
+                except Exception as e:
+                    for position, path, _, _ in decoded:
+                        predictions[position] = self._error_result(path, e)
+            
+            results = []
+            fresh = []
+            for position, path, error, info in items:
+                for stage, seconds in info.pop('timings').items():
+                    stage_seconds[stage] = stage_seconds.get(stage, 0.0) + seconds
+                    stage_counts[stage] = stage_counts.get(stage, 0) + 1
+                if 'result' in info:
+                    results.append(info['result'])
+                    reused += 1
+                    continue
+                if error is not None:
+                    result = self._error_result(path, error)
+                elif position in predictions:
+                    result = predictions[position]
+                else:
+                    # Near-duplicate, of an earlier batch or of this one
+                    match = matches.get(position) or classified.find(int(info['dhash'], 16))
+                    if match is None:
+                        result = self._error_result(path, "Near-duplicate of an image that could not be classified")
+                    else:
+                        result = self._duplicate_result(path, *match)
+                        duplicates += 1
+                info.pop('near_duplicate', None)
+                result.update(info)
+                results.append(result)
+                fresh.append(result)
+            
+            if manifest is not None:
+                manifest.record(fresh)
+            
+            processed += len(results)
+            elapsed = time.perf_counter() - start_time
+            progress = f"{processed}/{total}" if total is not None else f"{processed}"
+            skipped = f", {reused} already classified" if reused else ""
+            skipped += f", {duplicates} near-duplicates" if duplicates else ""
+            print(f"Processed {progress} ({processed / elapsed:.1f} images/sec{skipped})")
+            
+            yield results
         
+        self._print_stage_throughput(stage_seconds, stage_counts, workers)
+    
+    def _duplicate_result(self, image_path, original, distance):
+        """Result of a near-duplicate, copied from the original's"""
+        result = {key: value for key, value in original.items()
+                  if key not in ('sha256', 'dhash', 'file_size', 'file_mtime_ns')}
+        result['image_path'] = str(image_path)
+        result['duplicate_of'] = original['image_path']
+        result['hash_distance'] = distance
+        return result
+    
+    def _print_stage_throughput(self, stage_seconds, stage_counts, workers):
+        """Images per second each pipeline stage sustains on its own"""
+        if not stage_seconds:
+            return
+        print("Stage throughput:")
+        for stage in ('decode', 'perceptual_hash', 'face_detection', 'preprocess', 'inference'):
+            if stage_seconds.get(stage):
+                rate = stage_counts[stage] / stage_seconds[stage]
+                where = f" per worker ({workers} workers)" if workers > 0 and stage != 'inference' else ""
+                print(f"  {stage.replace('_', ' ')}: {rate:.1f} images/sec{where}")
+    
+    def stream_directory(self, input_dir, output_dir=None, file_extensions=None, batch_size=1, workers=0,
+                         resume=True, shard=None, parquet=False, face_crop=False, dedup_distance=None,
+                         **scan_options):
+        """Process a directory, appending results to a JSON Lines file as each batch completes
+        
+        Unlike process_directory() + generate_report(), no results are kept in
+        memory: the summary is accumulated incrementally and written at the end.
+        Results reused from the manifest (see process_directory) are written in
+        discovery order along with the fresh ones.
+        
+        With shard=(i, N) only the files of that shard are processed, into
+        results_shard-i-of-N.jsonl (rewritten on every run) for merge_partials().
+        With parquet, a results_<suffix>.parquet file is written alongside.
+        Returns (summary, results_file).
+        """
+        output_path = Path(output_dir or "batch_reports")
+        output_path.mkdir(parents=True, exist_ok=True)
         timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        suffix = shard_name(shard) if shard else timestamp
+        results_file = output_path / f"results_{suffix}.jsonl"
         
-        # Filter successful results
-        successful_results = [r for r in results if r['success']]
-        failed_results = [r for r in results if not r['success']]
+        image_files = self.scan_images(input_dir, file_extensions, shard=shard, **scan_options)
+        if shard:
+            print(f"Shard {shard[0]}/{shard[1]}")
         
-        # Create summary statistics
-        summary = {
-            'total_images': len(results),
-            'successful_predictions': len(successful_results),
-            'failed_predictions': len(failed_results),
-            'success_rate': len(successful_results) / len(results) if results else 0,
-            'timestamp': timestamp
-        }
+        with ExitStack() as stack:
+            manifest = stack.enter_context(self.open_manifest(output_path, shard, face_crop))
+            writer = stack.enter_context(JsonlResultsWriter(results_file, append=shard is None))
+            writers = [writer]
+            if parquet:
+                writers.append(stack.enter_context(self.open_parquet(output_path, suffix)))
+            
+            for batch_results in self.iter_result_batches(image_files, batch_size, workers, face_crop,
+                                                          manifest, resume, dedup_distance):
+                for w in writers:
+                    w.write_batch(batch_results)
+        
+        summary = writer.stats.to_summary(timestamp)
+        summary_file = output_path / f"summary_{suffix}.json"
+        with open(summary_file, 'w') as f:
+            json.dump(summary, f, indent=2)
         
-        # Character distribution
-        character_counts = {}
-        confidence_scores = []
+        print(f"\nBatch processing completed!")
+        print(f"Total images: {summary['total_images']}")
+        print(f"Successful predictions: {summary['successful_predictions']}")
+        print(f"Success rate: {summary['success_rate']:.2%}")
+        print(f"Average confidence: {summary['average_confidence']:.2%}")
+        print(f"\nResults saved to: {output_path}")
+        print(f"- Summary: {summary_file}")
+        print(f"- Results (JSON Lines): {results_file}")
         
-        for result in successful_results:
-            char = result['predicted_class']
-            character_counts[char] = character_counts.get(char, 0) + 1
-            confidence_scores.append(result['confidence'])
+        return summary, results_file
+    
+    def watch_directories(self, directories, output_dir=None, file_extensions=None, batch_size=1, workers=0,
+                          face_crop=False, dedup_distance=None, interval=2.0, settle_seconds=2.0,
+                          queue_size=1024, **scan_options):
+        """Classify new images as they land in directories, until interrupted
         
-        summary['character_distribution'] = character_counts
-        summary['average_confidence'] = sum(confidence_scores) / len(confidence_scores) if confidence_scores else 0
-        summary['min_confidence'] = min(confidence_scores) if confidence_scores else 0
-        summary['max_confidence'] = max(confidence_scores) if confidence_scores else 0
+        The model stays loaded while a FolderWatcher polls the directories and
+        queues files once they stop changing. Queued files are classified in
+        batches through iter_result_batches(). Small trickles are decoded in
+        this process, while bursts larger than a batch use the workers. Results
+        are appended to results_watch.jsonl in the output directory and
+        recorded in its manifest, which the watcher checks, so files classified
+        before a restart are not queued again (touched but unchanged ones are
+        queued, then skipped once their hash matches). summary_watch.json covers the whole
+        results file and is rewritten after every chunk. The near-duplicate index, with
+        dedup_distance, lives as long as the daemon.
+        """
+        output_path = Path(output_dir or "batch_reports")
+        output_path.mkdir(parents=True, exist_ok=True)
+        results_file = output_path / "results_watch.jsonl"
+        summary_file = output_path / "summary_watch.json"
+        max_files = max(1, batch_size) * max(1, workers) * 4
+        dedup_index = MultiIndexHashIndex(dedup_distance) if dedup_distance is not None else None
         
-        # Create detailed results DataFrame
-        df_results = []
-        for result in results:
-            row = {
-                'image_path': result['image_path'],
-                'success': result['success']
-            }
+        with ExitStack() as stack:
+            manifest = stack.enter_context(self.open_manifest(output_path, face_crop=face_crop))
+            # Carry on the summary of earlier runs
+            stats = SummaryStats()
+            if results_file.exists():
+                for result in read_results(results_file):
+                    stats.add(result)
+            writer = stack.enter_context(JsonlResultsWriter(results_file, append=True))
+            writer.stats = stats
+            watcher = stack.enter_context(FolderWatcher(directories, interval=interval,
+                                                        settle_seconds=settle_seconds, queue_size=queue_size,
+                                                        is_handled=manifest.holds,
+                                                        extensions=file_extensions or IMAGE_EXTENSIONS,
+                                                        **scan_options))
+            print(f"Watching {', '.join(str(d) for d in directories)} (Ctrl+C to stop)")
+            print(f"Appending results to: {results_file}")
             
-            if result['success']:
-                row.update({
-                    'predicted_class': result['predicted_class'],
-                    'confidence': result['confidence'],
-                    'character_name': self.character_data.get(result['predicted_class'], {}).get('name', result['predicted_class']),
-                    'crew': self.character_data.get(result['predicted_class'], {}).get('crew', 'Unknown')
-                })
+            try:
+                while True:
+                    # Checked here rather than by the workers, so skipped files aren't appended again
+                    image_files = [path for path in watcher.get_files(max_files, timeout=interval)
+                                   if manifest.lookup(path) is None]
+                    if not image_files:
+                        continue
+                    chunk_workers = workers if len(image_files) > batch_size else 0
+                    for batch_results in self.iter_result_batches(image_files, batch_size, chunk_workers,
+                                                                  face_crop, manifest, resume=False,
+                                                                  dedup_index=dedup_index):
+                        writer.write_batch(batch_results)
+                    with open(summary_file, 'w') as f:
+                        json.dump(stats.to_summary(datetime.now().strftime("%Y%m%d_%H%M%S")), f, indent=2)
+            except KeyboardInterrupt:
+                print("\nStopping watcher")
+        
+        print(f"Total images: {stats.total}")
+        print(f"- Summary: {summary_file}")
+        print(f"- Results (JSON Lines): {results_file}")
+        return stats.to_summary(datetime.now().strftime("%Y%m%d_%H%M%S")), results_file
+    
+    def merge_partials(self, paths, output_dir=None, **report_options):
+        """Combine shard results files (or directories holding them) into the full set of reports
+        
+        report_options are passed on to generate_report().
+        """
+        results_files = []
+        for path in map(Path, paths):
+            if path.is_dir():
+                results_files.extend(sorted(path.glob("results_shard-*.jsonl")))
             else:
-                row.update({
-                    'error': result['error'],
-                    'predicted_class': None,
-                    'confidence': None,
-                    'character_name': None,
-                    'crew': None
-                })
-            
-            df_results.append(row)
+                results_files.append(path)
+        if not results_files:
+            raise ValueError("No shard results files found")
+        
+        # Warn about shards that never wrote their results
+        seen = {}
+        for results_file in results_files:
+            parts = results_file.stem.split('-')
+            if len(parts) == 4 and parts[0] == 'results_shard':
+                seen.setdefault(int(parts[3]), set()).add(int(parts[1]))
+        for count, indices in seen.items():
+            missing = sorted(set(range(count)) - indices)
+            if missing:
+                print(f"⚠️  Missing results for {len(missing)} of {count} shards: {missing}")
         
-        df = pd.DataFrame(df_results)
+        print(f"Merging {len(results_files)} results files")
+        results = [result for results_file in results_files for result in read_results(results_file)]
+        results.sort(key=lambda r: r['image_path'])
+        return self.generate_report(results, output_dir, **report_options)
+    
+    def generate_report(self, results, output_dir=None, rows_per_page=1000, text_summary_only=False):
+        """Generate detailed report from batch processing results
+        
+        The HTML report is paginated at rows_per_page images; text_summary_only
+        leaves the per-image section out of the text report.
+        """
+        if output_dir is None:
+            output_dir = Path("batch_reports")
+        
+        output_path = Path(output_dir)
+        output_path.mkdir(exist_ok=True)
+        
+        timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
+        
+        # Create summary statistics
+        stats = SummaryStats()
+        stats.update(results)
+        summary = stats.to_summary(timestamp)
+        
+        # Create detailed results DataFrame
+        df = self._results_frame(results)
         
         # Save reports
         # 1. Summary JSON
@@ -172,11 +523,11 @@ class BatchProcessor:
         
         # 3. HTML Report
         html_file = output_path / f"report_{timestamp}.html"
-        self._generate_html_report(summary, df, html_file)
+        self._generate_html_report(summary, df, html_file, rows_per_page)
         
         # 4. Text Report
         txt_file = output_path / f"report_{timestamp}.txt"
-        self._generate_text_report(summary, df, txt_file)
+        self._generate_text_report(summary, df, txt_file, summary_only=text_summary_only)
         
         print(f"\nBatch processing completed!")
         print(f"Total images: {summary['total_images']}")
@@ -191,19 +542,37 @@ class BatchProcessor:
         
         return summary, df
     
-    def _generate_html_report(self, summary, df, output_file):
-        """Generate HTML report"""
-        html_content = f"""
+    def _results_frame(self, results):
+        """One row per result with the character name and crew, built column-wise"""
+        columns = ['image_path', 'success', 'predicted_class', 'confidence', 'error']
+        df = pd.DataFrame.from_records(results, columns=columns)
+        if df.empty:
+            return df.drop(columns='error')
+        
+        df['success'] = df['success'].astype(bool)
+        names = df['predicted_class'].map({c: d['name'] for c, d in self.character_data.items()})
+        crews = df['predicted_class'].map({c: d['crew'] for c, d in self.character_data.items()})
+        df['character_name'] = names.fillna(df['predicted_class']).where(df['success'], None)
+        df['crew'] = crews.fillna('Unknown').where(df['success'], None)
+        
+        columns = ['image_path', 'success', 'predicted_class', 'confidence', 'character_name', 'crew']
+        if not df['success'].all():
+            columns.append('error')
+        return df[columns]
+    
+    def _html_page_start(self, title):
+        return f"""
         <!DOCTYPE html>
         <html>
         <head>
-            <title>One Piece Classifier - Batch Report</title>
+            <title>{title}</title>
             <style>
                 body {{ font-family: Arial, sans-serif; margin: 20px; }}
                 .header {{ background: linear-gradient(135deg, #667eea 0%, #764ba2 100%); color: white; padding: 20px; border-radius: 10px; }}
                 .summary {{ background: #f8f9fa; padding: 20px; border-radius: 10px; margin: 20px 0; }}
                 .stats {{ display: grid; grid-template-columns: repeat(auto-fit, minmax(200px, 1fr)); gap: 20px; margin: 20px 0; }}
                 .stat-card {{ background: white; padding: 15px; border-radius: 10px; box-shadow: 0 2px 10px rgba(0,0,0,0.1); }}
+                .pages a {{ display: inline-block; margin: 4px 8px 4px 0; }}
                 table {{ width: 100%; border-collapse: collapse; margin: 20px 0; }}
                 th, td {{ padding: 10px; text-align: left; border-bottom: 1px solid #ddd; }}
                 th {{ background: #f8f9fa; }}
@@ -212,6 +581,51 @@ class BatchProcessor:
             </style>
         </head>
         <body>
+        """
+    
+    def _html_result_rows(self, df):
+        """Render the detailed-results table rows of a chunk of the results frame"""
+        success = df['success']
+        status = success.map({True: '<td class="success">Success</td>', False: '<td class="error">Failed</td>'})
+        predicted = df['predicted_class'].where(success, 'N/A').astype(str).map(html.escape)
+        confidence = df['confidence'].map(lambda c: f"{c:.2%}").where(success, 'N/A')
+        crew = df['crew'].where(success, 'N/A').astype(str).map(html.escape)
+        rows = ('<tr><td>' + df['image_path'].astype(str).map(html.escape) + '</td>' + status +
+                '<td>' + predicted + '</td><td>' + confidence + '</td><td>' + crew + '</td></tr>\n')
+        return rows.tolist()
+    
+    def _write_html_results_table(self, f, df):
+        f.write("""
+            <table>
+                <tr>
+                    <th>Image Path</th>
+                    <th>Status</th>
+                    <th>Predicted Character</th>
+                    <th>Confidence</th>
+                    <th>Crew</th>
+                </tr>
+        """)
+        for start in range(0, len(df), REPORT_CHUNK_ROWS):
+            f.writelines(self._html_result_rows(df.iloc[start:start + REPORT_CHUNK_ROWS]))
+        f.write("""
+            </table>
+        """)
+    
+    def _generate_html_report(self, summary, df, output_file, rows_per_page=1000):
+        """Generate HTML report
+        
+        Runs of more than rows_per_page images get an index page holding the
+        summary and links to the detailed results, split across pages in a
+        sibling <report>_pages directory, so no single file is too big to open.
+        """
+        output_file = Path(output_file)
+        rows_per_page = max(1, rows_per_page)
+        page_count = (len(df) + rows_per_page - 1) // rows_per_page
+        pages_dir = output_file.with_name(output_file.stem + "_pages")
+        
+        with open(output_file, 'w') as f:
+            f.write(self._html_page_start("One Piece Classifier - Batch Report"))
+            f.write(f"""
             <div class="header">
                 <h1>One Piece Character Classifier - Batch Report</h1>
                 <p>Generated on {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}</p>
@@ -242,54 +656,75 @@ class BatchProcessor:
             <h2>Character Distribution</h2>
             <table>
                 <tr><th>Character</th><th>Count</th><th>Percentage</th></tr>
-        """
-        
-        for char, count in summary['character_distribution'].items():
-            percentage = count / summary['successful_predictions'] * 100
-            html_content += f"<tr><td>{char}</td><td>{count}</td><td>{percentage:.1f}%</td></tr>"
-        
-        html_content += """
+            """)
+            for char, count in summary['character_distribution'].items():
+                percentage = count / summary['successful_predictions'] * 100
+                f.write(f"<tr><td>{html.escape(char)}</td><td>{count}</td><td>{percentage:.1f}%</td></tr>")
+            f.write("""
             </table>
             
             <h2>Detailed Results</h2>
-            <table>
-                <tr>
-                    <th>Image Path</th>
-                    <th>Status</th>
-                    <th>Predicted Character</th>
-                    <th>Confidence</th>
-                    <th>Crew</th>
-                </tr>
-        """
-        
-        for _, row in df.iterrows():
-            status_class = "success" if row['success'] else "error"
-            status_text = "Success" if row['success'] else "Failed"
-            predicted = row['predicted_class'] if row['success'] else "N/A"
-            confidence = f"{row['confidence']:.2%}" if row['success'] else "N/A"
-            crew = row['crew'] if row['success'] else "N/A"
+            """)
             
-            html_content += f"""
-                <tr>
-                    <td>{row['image_path']}</td>
-                    <td class="{status_class}">{status_text}</td>
-                    <td>{predicted}</td>
-                    <td>{confidence}</td>
-                    <td>{crew}</td>
-                </tr>
-            """
-        
-        html_content += """
-            </table>
+            if page_count <= 1:
+                self._write_html_results_table(f, df)
+            else:
+                f.write('<div class="pages">\n')
+                for page in range(page_count):
+                    first = page * rows_per_page
+                    last = min(len(df), first + rows_per_page)
+                    f.write(f'<a href="{pages_dir.name}/page-{page + 1:05d}.html">'
+                            f'Page {page + 1} (images {first + 1}-{last})</a>\n')
+                f.write('</div>\n')
+            
+            f.write("""
         </body>
         </html>
-        """
+        """)
         
-        with open(output_file, 'w') as f:
-            f.write(html_content)
+        if page_count <= 1:
+            return
+        
+        pages_dir.mkdir(exist_ok=True)
+        for page in range(page_count):
+            nav = [f'<a href="../{output_file.name}">Index</a>']
+            if page > 0:
+                nav.append(f'<a href="page-{page:05d}.html">Previous</a>')
+            if page + 1 < page_count:
+                nav.append(f'<a href="page-{page + 2:05d}.html">Next</a>')
+            
+            with open(pages_dir / f"page-{page + 1:05d}.html", 'w') as f:
+                f.write(self._html_page_start(f"One Piece Classifier - Batch Report - Page {page + 1}"))
+                f.write(f"""
+            <div class="header">
+                <h1>Detailed Results - Page {page + 1} of {page_count}</h1>
+            </div>
+            <div class="pages">{' '.join(nav)}</div>
+                """)
+                self._write_html_results_table(f, df.iloc[page * rows_per_page:(page + 1) * rows_per_page])
+                f.write(f"""
+            <div class="pages">{' '.join(nav)}</div>
+        </body>
+        </html>
+        """)
+    
+    def _text_result_rows(self, df):
+        """Render the detailed-results entries of a chunk of the results frame"""
+        separator = "-" * 30 + "\n"
+        success = df['success']
+        head = "Image: " + df['image_path'].astype(str) + "\n"
+        ok = df[success]
+        ok_rows = (head[success] + "Status: Success\nPredicted: " + ok['predicted_class'].astype(str) +
+                   "\nConfidence: " + ok['confidence'].map(lambda c: f"{c:.2%}") +
+                   "\nCrew: " + ok['crew'].astype(str) + "\n" + separator)
+        if success.all():
+            return ok_rows.tolist()
+        failed_rows = (head[~success] + "Status: Failed\nError: " + df.loc[~success, 'error'].astype(str) +
+                       "\n" + separator)
+        return pd.concat([ok_rows, failed_rows]).sort_index().tolist()
     
-    def _generate_text_report(self, summary, df, output_file):
-        """Generate text report"""
+    def _generate_text_report(self, summary, df, output_file, summary_only=False):
+        """Generate text report, optionally without the per-image section"""
         with open(output_file, 'w') as f:
             f.write("One Piece Character Classifier - Batch Report\n")
             f.write("=" * 50 + "\n\n")
@@ -312,37 +747,235 @@ class BatchProcessor:
                 f.write(f"{char}: {count} ({percentage:.1f}%)\n")
             f.write("\n")
             
+            if summary_only:
+                return
+            
             f.write("DETAILED RESULTS\n")
             f.write("-" * 17 + "\n")
-            for _, row in df.iterrows():
-                f.write(f"Image: {row['image_path']}\n")
-                f.write(f"Status: {'Success' if row['success'] else 'Failed'}\n")
-                if row['success']:
-                    f.write(f"Predicted: {row['predicted_class']}\n")
-                    f.write(f"Confidence: {row['confidence']:.2%}\n")
-                    f.write(f"Crew: {row['crew']}\n")
-                else:
-                    f.write(f"Error: {row['error']}\n")
-                f.write("-" * 30 + "\n")
+            for start in range(0, len(df), REPORT_CHUNK_ROWS):
+                f.writelines(self._text_result_rows(df.iloc[start:start + REPORT_CHUNK_ROWS]))
+
+def run_processes(args):
+    """Run args.processes local shards as independent inference processes, then merge them"""
+    count = args.processes
+    base_index, base_count = args.shard or (0, 1)
+    threads = args.threads or max(1, (os.cpu_count() or 1) // count)
+    workers = args.workers // count if args.workers else 0
+    output_dir = args.output_dir or "batch_reports"
+    
+    children, results_files = [], []
+    for local_index in range(count):
+        # Sub-shard this node's shard, so several nodes can each run several processes
+        shard_index = base_index * count + local_index
+        shard = f"{shard_index}/{base_count * count}"
+        results_files.append(Path(output_dir) / f"results_{shard_name((shard_index, base_count * count))}.jsonl")
+        command = [
+            sys.executable, os.path.abspath(__file__), args.input_dir,
+            '--output-dir', output_dir, '--shard', shard,
+            '--batch-size', str(args.batch_size), '--workers', str(workers),
+            '--threads', str(threads), '--extensions', *args.extensions,
+            '--symlinks', args.symlinks
+        ]
+        if args.no_recursive:
+            command.append('--no-recursive')
+        if args.archives:
+            command.append('--archives')
+        for pattern in args.include or []:
+            command += ['--include', pattern]
+        for pattern in args.exclude or []:
+            command += ['--exclude', pattern]
+        if args.no_resume:
+            command.append('--no-resume')
+        if args.parquet:
+            command.append('--parquet')
+        if args.face_crop:
+            command.append('--face-crop')
+        if args.dedup_distance is not None:
+            command += ['--dedup-distance', str(args.dedup_distance)]
+        print(f"Starting shard {shard} ({threads} torch threads, {workers} decode workers)")
+        children.append(subprocess.Popen(command))
+    
+    failed = [child.args[child.args.index('--shard') + 1] for child in children if child.wait() != 0]
+    if failed:
+        print(f"Error: shards {failed} failed")
+        return 1
+    if args.shard:
+        # Other nodes still have to finish, merge later with the merge subcommand
+        return 0
+    
+    BatchProcessor().merge_partials(results_files, output_dir, rows_per_page=args.rows_per_page,
+                                    text_summary_only=args.text_summary_only)
+    return 0
+
+
+def add_scan_arguments(parser):
+    parser.add_argument('--extensions', nargs='+', default=list(IMAGE_EXTENSIONS),
+                       help='File extensions to process (case-insensitive)')
+    parser.add_argument('--no-recursive', action='store_true',
+                       help='Only process images directly inside input_dir, not its subdirectories')
+    parser.add_argument('--include', action='append', metavar='PATTERN',
+                       help='Only process files whose relative path or name matches this glob '
+                            '(repeatable)')
+    parser.add_argument('--exclude', action='append', metavar='PATTERN',
+                       help='Skip files and directories whose relative path or name matches this glob '
+                            '(repeatable)')
+    parser.add_argument('--symlinks', choices=SYMLINK_POLICIES, default='files',
+                       help='skip: ignore symlinks; files: follow symlinked files only; follow: also '
+                            'descend into symlinked directories (default: files)')
+
+
+def scan_options_from_args(args):
+    return {'recursive': not args.no_recursive, 'include': args.include, 'exclude': args.exclude,
+            'symlinks': args.symlinks}
+
+
+def add_report_arguments(parser):
+    parser.add_argument('--rows-per-page', type=int, default=1000,
+                       help='Images per page of the HTML report; larger runs get an index page (default: 1000)')
+    parser.add_argument('--text-summary-only', action='store_true',
+                       help='Leave the per-image results out of the text report')
+
+
+def merge_main(argv):
+    parser = argparse.ArgumentParser(prog='batch_processor.py merge',
+                                     description='Merge shard results into the standard batch reports')
+    parser.add_argument('paths', nargs='+',
+                        help='Shard results files, or output directories containing results_shard-*.jsonl')
+    parser.add_argument('--output-dir', help='Output directory for reports (default: batch_reports)')
+    add_report_arguments(parser)
+    
+    args = parser.parse_args(argv)
+    
+    try:
+        BatchProcessor().merge_partials(args.paths, args.output_dir, rows_per_page=args.rows_per_page,
+                                        text_summary_only=args.text_summary_only)
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
+
+def watch_main(argv):
+    parser = argparse.ArgumentParser(prog='batch_processor.py watch',
+                                     description='Keep the model loaded and classify new images as they '
+                                                 'land in one or more directories')
+    parser.add_argument('directories', nargs='+', help='Directories to watch')
+    parser.add_argument('--output-dir', help='Output directory for results (default: batch_reports)')
+    add_scan_arguments(parser)
+    parser.add_argument('--interval', type=float, default=2.0,
+                       help='Seconds between directory scans (default: 2)')
+    parser.add_argument('--settle', type=float, default=2.0,
+                       help='Seconds a new file\'s size and mtime must stay unchanged before it is '
+                            'classified, so partially written files are skipped (default: 2)')
+    parser.add_argument('--queue-size', type=int, default=1024,
+                       help='Most files waiting to be classified; scanning pauses while the queue '
+                            'is full (default: 1024)')
+    parser.add_argument('--face-crop', action='store_true',
+                       help='Crop each image to the detected face before classifying, as the web app does')
+    parser.add_argument('--dedup-distance', type=int, metavar='BITS',
+                       help='Reuse results for near-duplicates within BITS of a perceptual hash (default: off)')
+    parser.add_argument('--batch-size', type=int, default=32,
+                       help='Images per forward pass (default: 32)')
+    parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1),
+                       help='Background decode/transform processes for bursts of new files '
+                            '(default: min(8, CPU count))')
+    parser.add_argument('--threads', type=int, help='Torch intra-op threads for inference')
+    
+    args = parser.parse_args(argv)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    # Stop cleanly on SIGTERM (docker stop, systemd) as on Ctrl+C
+    signal.signal(signal.SIGTERM, signal.default_int_handler)
+    
+    try:
+        BatchProcessor().watch_directories(args.directories, args.output_dir, file_extensions=args.extensions,
+                                           batch_size=args.batch_size, workers=args.workers,
+                                           face_crop=args.face_crop, dedup_distance=args.dedup_distance,
+                                           interval=args.interval, settle_seconds=args.settle,
+                                           queue_size=args.queue_size, **scan_options_from_args(args))
+    except Exception as e:
+        print(f"Error: {e}")
+        return 1
+    return 0
+
 
 def main():
-    parser = argparse.ArgumentParser(description='Batch process images for One Piece character classification')
-    parser.add_argument('input_dir', help='Directory containing images to process')
+    if len(sys.argv) > 1 and sys.argv[1] == 'merge':
+        return merge_main(sys.argv[2:])
+    if len(sys.argv) > 1 and sys.argv[1] == 'watch':
+        return watch_main(sys.argv[2:])
+    
+    parser = argparse.ArgumentParser(description='Batch process images for One Piece character classification',
+                                     epilog='Use "%(prog)s merge <paths>" to combine shard results into reports, '
+                                            'or "%(prog)s watch <dirs>" to classify new images as they arrive.')
+    parser.add_argument('input_dir', help='Directory containing images to process, or a zip/tar archive of them')
     parser.add_argument('--output-dir', help='Output directory for reports (default: batch_reports)')
-    parser.add_argument('--extensions', nargs='+', default=['.jpg', '.jpeg', '.png', '.bmp', '.tiff'],
-                       help='File extensions to process')
+    add_scan_arguments(parser)
+    parser.add_argument('--archives', action='store_true',
+                       help='Also classify the images inside zip/tar archives found in input_dir, '
+                            'reading them in memory without extracting')
+    parser.add_argument('--stream', action='store_true',
+                       help='Append results to a JSON Lines file as batches finish and only write '
+                            'the summary at the end (constant memory, no CSV/HTML/text reports)')
+    parser.add_argument('--parquet', action='store_true',
+                       help='Also write results as Parquet (one float32 column per class probability), '
+                            'a row group per batch; requires pyarrow (pip install -r requirements-batch.txt)')
+    parser.add_argument('--face-crop', action='store_true',
+                       help='Crop each image to the detected face before classifying, as the web app does '
+                            '(detection runs in the --workers processes, see FACE_DETECTION_MODE)')
+    parser.add_argument('--dedup-distance', type=int, metavar='BITS',
+                       help='Reuse the result of an already classified image for images whose 64-bit '
+                            'perceptual hash differs by at most BITS (re-encoded or resized copies); '
+                            '0 only matches identical hashes (default: off)')
+    parser.add_argument('--no-resume', action='store_true',
+                       help='Classify every file again instead of skipping those already in the '
+                            'output directory\'s manifest')
+    parser.add_argument('--batch-size', type=int, default=32,
+                       help='Images per forward pass (default: 32)')
+    parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1),
+                       help='Background decode/transform processes, 0 decodes in the main process '
+                            '(default: min(8, CPU count))')
+    parser.add_argument('--shard', type=parse_shard, metavar='I/N',
+                       help='Only process shard I of N (0 <= I < N), partitioned by a stable hash of '
+                            'each file\'s relative path; writes partial results for the merge subcommand')
+    parser.add_argument('--processes', type=int, default=1,
+                       help='Run this many independent inference processes, each on its own shard, '
+                            'and merge their results')
+    parser.add_argument('--threads', type=int,
+                       help='Torch intra-op threads for inference (default: CPU count, divided '
+                            'between --processes)')
+    add_report_arguments(parser)
     
     args = parser.parse_args()
     
+    if args.processes > 1:
+        return run_processes(args)
+    if args.threads:
+        torch.set_num_threads(args.threads)
+    
     # Initialize processor
     processor = BatchProcessor()
+    scan_options = dict(scan_options_from_args(args), archives=args.archives)
     
     try:
+        if args.stream or args.shard:
+            processor.stream_directory(args.input_dir, args.output_dir, file_extensions=args.extensions,
+                                       batch_size=args.batch_size, workers=args.workers,
+                                       resume=not args.no_resume, shard=args.shard, parquet=args.parquet,
+                                       face_crop=args.face_crop, dedup_distance=args.dedup_distance,
+                                       **scan_options)
+            return 0
+        
         # Process images
-        results = processor.process_directory(args.input_dir, file_extensions=args.extensions)
+        results = processor.process_directory(args.input_dir, args.output_dir, file_extensions=args.extensions,
+                                              batch_size=args.batch_size, workers=args.workers,
+                                              resume=not args.no_resume, parquet=args.parquet,
+                                              face_crop=args.face_crop, dedup_distance=args.dedup_distance,
+                                              **scan_options)
         
         # Generate reports
-        summary, df = processor.generate_report(results, args.output_dir)
+        summary, df = processor.generate_report(results, args.output_dir, rows_per_page=args.rows_per_page,
+                                                text_summary_only=args.text_summary_only)
         
     except Exception as e:
         print(f"Error: {e}")
@@ -0,0 +1,192 @@
+#!/usr/bin/env python3
+"""
+Streaming batch results for One Piece Character Classifier
+Appends prediction results to a JSON Lines or Parquet file as batches
+complete and keeps the report summary up to date incrementally, so memory
+stays flat however many images are processed
+"""
+
+import os
+import json
+import numpy as np
+
+
+class SummaryStats:
+    """Running totals behind the batch report summary"""
+
+    def __init__(self):
+        self.total = 0
+        self.successful = 0
+        self.character_counts = {}
+        self.confidence_sum = 0.0
+        self.min_confidence = None
+        self.max_confidence = None
+
+    def add(self, result):
+        self.total += 1
+        if not result['success']:
+            return
+        self.successful += 1
+        char = result['predicted_class']
+        self.character_counts[char] = self.character_counts.get(char, 0) + 1
+
+        confidence = result['confidence']
+        self.confidence_sum += confidence
+        self.min_confidence = confidence if self.min_confidence is None else min(self.min_confidence, confidence)
+        self.max_confidence = confidence if self.max_confidence is None else max(self.max_confidence, confidence)
+
+    def update(self, results):
+        for result in results:
+            self.add(result)
+
+    def to_summary(self, timestamp):
+        """Summary dict in the format written by BatchProcessor.generate_report()"""
+        return {
+            'total_images': self.total,
+            'successful_predictions': self.successful,
+            'failed_predictions': self.total - self.successful,
+            'success_rate': self.successful / self.total if self.total else 0,
+            'timestamp': timestamp,
+            'character_distribution': dict(self.character_counts),
+            'average_confidence': self.confidence_sum / self.successful if self.successful else 0,
+            'min_confidence': self.min_confidence or 0,
+            'max_confidence': self.max_confidence or 0
+        }
+
+
+def truncate_partial_line(path, chunk_size=1 << 16):
+    """Cut a file back to its last newline, dropping an unterminated last line"""
+    try:
+        f = open(path, 'r+b')
+    except FileNotFoundError:
+        return
+    with f:
+        end = f.seek(0, os.SEEK_END)
+        position = end
+        while position > 0:
+            start = max(0, position - chunk_size)
+            f.seek(start)
+            chunk = f.read(position - start)
+            newline = chunk.rfind(b'\n')
+            if newline >= 0:
+                position = start + newline + 1
+                break
+            position = start
+        if position < end:
+            f.truncate(position)
+
+
+class JsonlResultsWriter:
+    """Append-only JSON Lines file of per-image results, flushed after every batch
+
+    If the run dies part way, every batch written so far is still on disk.
+    When appending, a partial last line left by such a run is cut off first,
+    so new records never get glued onto it. With append=False an existing
+    file is replaced.
+    """
+
+    def __init__(self, path, append=True):
+        self.path = path
+        self.stats = SummaryStats()
+        if append:
+            truncate_partial_line(path)
+        self._file = open(path, 'a' if append else 'w', encoding='utf-8')
+
+    def write_batch(self, results):
+        for result in results:
+            self._file.write(json.dumps(result) + '\n')
+        self._file.flush()
+        self.stats.update(results)
+
+    def close(self):
+        self._file.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+class ParquetResultsWriter:
+    """Columnar results file with one Parquet row group per batch
+
+    Columns: image_path, success, predicted_index, predicted_class, confidence,
+    one float32 prob_<class> column per class in checkpoint order, error and
+    sha256. The class list is also stored in the schema metadata. Needs pyarrow.
+    """
+
+    def __init__(self, path, class_names):
+        # Optional dependency, only needed for Parquet output (requirements-batch.txt)
+        import pyarrow as pa
+        import pyarrow.parquet as pq
+
+        self.pa = pa
+        self.path = path
+        self.class_names = list(class_names)
+        self.class_index = {name: i for i, name in enumerate(self.class_names)}
+        self.stats = SummaryStats()
+
+        fields = [
+            pa.field('image_path', pa.string()),
+            pa.field('success', pa.bool_()),
+            pa.field('predicted_index', pa.int16()),
+            pa.field('predicted_class', pa.string()),
+            pa.field('confidence', pa.float32()),
+        ]
+        fields += [pa.field(f'prob_{name}', pa.float32()) for name in self.class_names]
+        fields += [pa.field('error', pa.string()), pa.field('sha256', pa.string())]
+        self.schema = pa.schema(fields, metadata={'class_names': json.dumps(self.class_names)})
+        self._writer = pq.ParquetWriter(path, self.schema, compression='zstd')
+
+    def write_batch(self, results):
+        if not results:
+            return
+        pa = self.pa
+        success = np.array([r['success'] for r in results], dtype=bool)
+        failed = ~success
+
+        probabilities = np.zeros((len(results), len(self.class_names)), dtype=np.float32)
+        for row, result in enumerate(results):
+            if result['success']:
+                probabilities[row] = np.asarray(result['probabilities'], dtype=np.float32).reshape(-1)
+
+        arrays = [
+            pa.array([r['image_path'] for r in results], pa.string()),
+            pa.array(success),
+            pa.array([self.class_index.get(r.get('predicted_class')) for r in results], pa.int16()),
+            pa.array([r.get('predicted_class') for r in results], pa.string()),
+            pa.array(np.array([r.get('confidence', 0.0) for r in results], dtype=np.float32), mask=failed),
+        ]
+        arrays += [pa.array(probabilities[:, column], mask=failed) for column in range(len(self.class_names))]
+        arrays += [
+            pa.array([r.get('error') for r in results], pa.string()),
+            pa.array([r.get('sha256') for r in results], pa.string()),
+        ]
+        self._writer.write_table(pa.Table.from_arrays(arrays, schema=self.schema))
+        self.stats.update(results)
+
+    def close(self):
+        self._writer.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+
+def read_results(path):
+    """Yield the results stored in a JSON Lines file one at a time
+
+    A partially written last line, left by a run that was killed, is skipped.
+    """
+    with open(path, encoding='utf-8') as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            try:
+                yield json.loads(line)
+            except json.JSONDecodeError:
+                continue
@@ -0,0 +1,127 @@
+#!/usr/bin/env python3
+"""
+Dynamic micro-batching for One Piece Character Classifier
+Coalesces concurrent single-image predictions into batched forward passes
+"""
+
+import os
+import queue
+import threading
+import time
+from concurrent.futures import Future
+
+import torch
+from model import predict
+
+
+class MicroBatcher:
+    """Gather pending image tensors into one forward pass and fan the results back out
+
+    Request threads call predict() with a preprocessed (1, 3, H, W) tensor and
+    block until their row of the batched softmax is ready. A single background
+    thread waits at most max_wait_ms after the first pending request for more
+    to arrive, up to max_batch_size, then runs them through the model together.
+    """
+
+    def __init__(self, model, device, max_batch_size=8, max_wait_ms=5.0):
+        self.model = model
+        self.device = device
+        self.max_batch_size = max(1, int(max_batch_size))
+        self.max_wait = max(0.0, float(max_wait_ms)) / 1000.0
+
+        self._queue = queue.Queue()
+        self._lock = threading.Lock()
+        self._thread = None
+        self._pid = None
+
+        # Statistics
+        self.batches_run = 0
+        self.images_run = 0
+
+    def _ensure_worker(self):
+        """Start the batching thread, again after a fork (e.g. gunicorn --preload)"""
+        if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+            return
+        with self._lock:
+            if self._thread is not None and self._pid == os.getpid() and self._thread.is_alive():
+                return
+            if self._pid != os.getpid():
+                # Requests queued in the parent process can never be served here
+                self._queue = queue.Queue()
+            self._pid = os.getpid()
+            self._thread = threading.Thread(target=self._run, name='MicroBatcher', daemon=True)
+            self._thread.start()
+
+    def submit(self, image_tensor):
+        """Queue a (1, 3, H, W) or (3, H, W) tensor and return a Future for its probabilities"""
+        if image_tensor.dim() == 3:
+            image_tensor = image_tensor.unsqueeze(0)
+        self._ensure_worker()
+        future = Future()
+        self._queue.put((image_tensor, future))
+        return future
+
+    def predict(self, image_tensor, timeout=None):
+        """Blocking equivalent of model.predict() that shares forward passes with other threads"""
+        return self.submit(image_tensor).result(timeout=timeout)
+
+    def _collect_batch(self):
+        """Block for the first request, then gather more until the batch is full or the wait expires"""
+        batch = [self._queue.get()]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            if remaining <= 0:
+                break
+            try:
+                batch.append(self._queue.get(timeout=remaining))
+            except queue.Empty:
+                break
+        return batch
+
+    def _run(self):
+        while True:
+            batch = self._collect_batch()
+            # Skip requests whose callers already gave up
+            batch = [(tensor, future) for tensor, future in batch if future.set_running_or_notify_cancel()]
+            if not batch:
+                continue
+
+            try:
+                tensors = [tensor.to(self.device) for tensor, _ in batch]
+                probabilities = predict(self.model, torch.cat(tensors), self.device)
+            except Exception as e:
+                for _, future in batch:
+                    future.set_exception(e)
+                continue
+
+            self.batches_run += 1
+            self.images_run += len(batch)
+
+            # Fan the rows back out, keeping each caller's (1, num_classes) shape
+            start = 0
+            for tensor, future in batch:
+                end = start + tensor.shape[0]
+                future.set_result(probabilities[start:end])
+                start = end
+
+    def stats(self):
+        """Return batching statistics"""
+        return {
+            'max_batch_size': self.max_batch_size,
+            'max_wait_ms': self.max_wait * 1000.0,
+            'batches_run': self.batches_run,
+            'images_run': self.images_run,
+            'average_batch_size': self.images_run / self.batches_run if self.batches_run else 0,
+            'pending': self._queue.qsize()
+        }
+
+
+def create_batcher_from_env(model, device):
+    """Build a MicroBatcher configured by PREDICT_MAX_BATCH_SIZE / PREDICT_MAX_WAIT_MS"""
+    return MicroBatcher(
+        model,
+        device,
+        max_batch_size=int(os.environ.get('PREDICT_MAX_BATCH_SIZE', 8)),
+        max_wait_ms=float(os.environ.get('PREDICT_MAX_WAIT_MS', 5.0))
+    )
@@ -0,0 +1,117 @@
+#!/usr/bin/env python3
+"""
+Face detection benchmark for One Piece Character Classifier
+Compares latency and agreement of the fast cascade mode against the
+exhaustive sweep on the bundled dataset images
+"""
+
+import os
+import sys
+import time
+import argparse
+from pathlib import Path
+
+import cv2
+import numpy as np
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from face_detector import FaceDetector
+
+
+def box_iou(a, b):
+    """Intersection over union of two (x, y, w, h) boxes"""
+    ax, ay, aw, ah = a
+    bx, by, bw, bh = b
+    overlap_x = max(0, min(ax + aw, bx + bw) - max(ax, bx))
+    overlap_y = max(0, min(ay + ah, by + bh) - max(ay, by))
+    intersection = overlap_x * overlap_y
+    union = aw * ah + bw * bh - intersection
+    return intersection / union if union > 0 else 0.0
+
+
+def largest(faces):
+    return max(faces, key=lambda f: f[2] * f[3]) if len(faces) else None
+
+
+def time_call(func, image, repeats):
+    """Run func(image) repeats times, return (last result, best time in ms)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func(image)
+        best = min(best, (time.perf_counter() - start) * 1000)
+    return result, best
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark fast vs exhaustive cascade face detection')
+    parser.add_argument('--data-dir', default='static/op_dateset/Data/Data',
+                        help='Directory of images to benchmark (searched recursively)')
+    parser.add_argument('--repeats', type=int, default=1, help='Timed runs per image (best is kept)')
+    parser.add_argument('--iou', type=float, default=0.3,
+                        help='IoU above which the largest faces of both modes count as the same face')
+
+    args = parser.parse_args()
+
+    detector = FaceDetector()
+    if not detector.face_cascades:
+        print("❌ No cascade classifiers available, nothing to benchmark")
+        return 1
+
+    image_paths = sorted(p for p in Path(args.data_dir).rglob('*')
+                         if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.bmp'))
+    print(f"📊 Benchmarking {len(image_paths)} images from {args.data_dir}")
+    print(f"{'image':40} {'pixels':>10} {'exhaustive':>12} {'fast':>9} {'faces':>7}  agree")
+
+    exhaustive_times, fast_times = [], []
+    detected_both = detected_neither = same_face = 0
+
+    for path in image_paths:
+        image = cv2.imread(str(path))
+        if image is None:
+            continue
+
+        slow_faces, slow_ms = time_call(lambda img: detector.detect_faces_cascade(img, mode='exhaustive'),
+                                        image, args.repeats)
+        fast_faces, fast_ms = time_call(lambda img: detector.detect_faces_cascade(img, mode='fast'),
+                                        image, args.repeats)
+        exhaustive_times.append(slow_ms)
+        fast_times.append(fast_ms)
+
+        if len(slow_faces) and len(fast_faces):
+            detected_both += 1
+            agree = box_iou(largest(slow_faces), largest(fast_faces)) >= args.iou
+            same_face += agree
+        elif not len(slow_faces) and not len(fast_faces):
+            detected_neither += 1
+            agree = True
+        else:
+            agree = False
+
+        name = str(path.relative_to(args.data_dir))
+        print(f"{name:40} {image.shape[0] * image.shape[1]:>10} {slow_ms:>10.1f}ms {fast_ms:>7.1f}ms "
+              f"{len(slow_faces):>3}/{len(fast_faces):<3}  {'yes' if agree else 'no'}")
+
+    if not exhaustive_times:
+        print("❌ No readable images found")
+        return 1
+
+    total = len(exhaustive_times)
+    agreement = (same_face + detected_neither) / total
+    print("\n📈 SUMMARY")
+    print("=" * 40)
+    print(f"Images: {total}")
+    print(f"Exhaustive: median {np.median(exhaustive_times):.1f}ms, p95 {np.percentile(exhaustive_times, 95):.1f}ms")
+    print(f"Fast:       median {np.median(fast_times):.1f}ms, p95 {np.percentile(fast_times, 95):.1f}ms")
+    print(f"Speedup (median): {np.median(exhaustive_times) / max(np.median(fast_times), 1e-6):.1f}x")
+    print(f"Both found a face: {detected_both}, same largest face: {same_face}")
+    print(f"Neither found a face: {detected_neither}")
+    print(f"Agreement: {agreement:.1%}")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
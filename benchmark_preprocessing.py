@@ -0,0 +1,110 @@
+#!/usr/bin/env python3
+"""
+Preprocessing benchmark for One Piece Character Classifier
+Compares latency, allocations and output of the fused preprocessor against
+the decode -> crop_face -> PIL -> transform chain used by /predict before
+"""
+
+import io
+import os
+import sys
+import time
+import argparse
+import tracemalloc
+from pathlib import Path
+
+import cv2
+import numpy as np
+from PIL import Image
+
+# Add current directory to path for imports
+sys.path.append(os.path.dirname(os.path.abspath(__file__)))
+
+from model import build_transform, transform_spec
+from face_detector import FaceDetector
+from image_io import decode_image, decode_image_array
+from preprocessing import FusedPreprocessor
+
+
+def measure(func, repeats):
+    """Run func() repeats times, return (last result, best time in ms, peak traced bytes)"""
+    best = float('inf')
+    result = None
+    for _ in range(repeats):
+        start = time.perf_counter()
+        result = func()
+        best = min(best, (time.perf_counter() - start) * 1000)
+
+    tracemalloc.start()
+    func()
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, best, peak
+
+
+def main():
+    parser = argparse.ArgumentParser(description='Benchmark fused vs chained image preprocessing')
+    parser.add_argument('--data-dir', default='static/op_dateset/Data/Data',
+                        help='Directory of images to benchmark (searched recursively)')
+    parser.add_argument('--limit', type=int, default=50, help='Maximum number of images')
+    parser.add_argument('--repeats', type=int, default=5, help='Timed runs per image (best is kept)')
+
+    args = parser.parse_args()
+
+    detector = FaceDetector(mode='fast')
+    transform = build_transform(transform_spec)
+    preprocessor = FusedPreprocessor(transform_spec, letterbox_size=(300, 400))
+    buffer = preprocessor.new_tensor()
+
+    image_paths = sorted(p for p in Path(args.data_dir).rglob('*')
+                         if p.suffix.lower() in ('.jpg', '.jpeg', '.png', '.bmp'))[:args.limit]
+    print(f"📊 Benchmarking {len(image_paths)} images from {args.data_dir}")
+    print("   Face boxes are detected once per image and shared, only preprocessing is timed\n"
+          "   (both paths decode at full resolution)")
+
+    chain_times, fused_times, chain_peaks, fused_peaks, errors = [], [], [], [], []
+
+    for path in image_paths:
+        data = path.read_bytes()
+        try:
+            image = decode_image_array(io.BytesIO(data), min_side=0)
+        except Exception:
+            continue
+        faces = detector.detect_faces(image)
+
+        def chain():
+            pil_image = decode_image(io.BytesIO(data))
+            image_cv = cv2.cvtColor(np.array(pil_image), cv2.COLOR_RGB2BGR)
+            cropped = detector.crop_face(image_cv, faces=faces)
+            return transform(Image.fromarray(cv2.cvtColor(cropped, cv2.COLOR_BGR2RGB)))
+
+        def fused():
+            decoded = decode_image_array(io.BytesIO(data), min_side=0)
+            region = detector._get_optimal_crop(decoded, faces)
+            return preprocessor(region, out=buffer)[0]
+
+        expected, chain_ms, chain_peak = measure(chain, args.repeats)
+        actual, fused_ms, fused_peak = measure(fused, args.repeats)
+
+        chain_times.append(chain_ms)
+        fused_times.append(fused_ms)
+        chain_peaks.append(chain_peak)
+        fused_peaks.append(fused_peak)
+        errors.append((actual - expected).abs().mean().item())
+
+    if not chain_times:
+        print("❌ No readable images found")
+        return 1
+
+    print("\n📈 SUMMARY")
+    print("=" * 40)
+    print(f"Images: {len(chain_times)}")
+    print(f"Chain: median {np.median(chain_times):.2f}ms, peak allocations {np.median(chain_peaks) / 1024:.0f} KiB")
+    print(f"Fused: median {np.median(fused_times):.2f}ms, peak allocations {np.median(fused_peaks) / 1024:.0f} KiB")
+    print(f"Speedup (median): {np.median(chain_times) / max(np.median(fused_times), 1e-6):.1f}x")
+    print(f"Mean absolute difference of normalized inputs: {np.mean(errors):.4f} (max {np.max(errors):.4f})")
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -10,15 +10,27 @@ import argparse
 from pathlib import Path
 from PIL import Image
 import torch
-from model import model, transform, device, predict, dataset
+from inference import model, class_names, transform, device, predict, model_transform_spec
+from image_io import decode_image_array
+from face_detector import FaceDetector, detector_options_from_env
+from preprocessing import FusedPreprocessor
+from batch_processor import BatchProcessor
 
 class OnePieceCLI:
-    def __init__(self):
-        """Initialize the CLI"""
+    def __init__(self, face_crop=False, batch_size=32, workers=0):
+        """Initialize the CLI
+        
+        face_crop crops images to the detected face before classifying, like the
+        web app; batch_size and workers configure batch_process().
+        """
         self.model = model
         self.transform = transform
         self.device = device
-        self.class_names = dataset.data.classes
+        self.class_names = class_names
+        self.face_crop = face_crop
+        self.batch_size = batch_size
+        self.workers = workers
+        self._face_preprocessor = None
         
         # Character information
         self.character_info = {
@@ -143,24 +155,42 @@ class OnePieceCLI:
             }
         }
     
+    def face_preprocessor(self):
+        """Face crop preprocessing shared by every prediction, built on first use"""
+        if self._face_preprocessor is None:
+            detector = FaceDetector(**detector_options_from_env())
+            self._face_preprocessor = FusedPreprocessor(model_transform_spec, detector,
+                                                        **BatchProcessor.FACE_CROP_OPTIONS)
+        return self._face_preprocessor
+    
     def predict_image(self, image_path):
         """Predict character from image path"""
         try:
             # Load and preprocess image
-            image = Image.open(image_path).convert("RGB")
-            transformed_image = self.transform(image).unsqueeze(0).to(self.device)
+            face_detected = None
+            if self.face_crop:
+                with open(image_path, 'rb') as f:
+                    image = decode_image_array(f)
+                transformed_image, face_detected = self.face_preprocessor()(image)
+                transformed_image = transformed_image.unsqueeze(0).to(self.device)
+            else:
+                image = Image.open(image_path).convert("RGB")
+                transformed_image = self.transform(image).unsqueeze(0).to(self.device)
             
             # Get prediction
             probabilities = predict(self.model, transformed_image, self.device)
             predicted_class = self.class_names[probabilities.argmax()]
             confidence = float(probabilities.max())
             
-            return {
+            result = {
                 'predicted_class': predicted_class,
                 'confidence': confidence,
                 'probabilities': probabilities.tolist(),
                 'success': True
             }
+            if face_detected is not None:
+                result['face_detected'] = face_detected
+            return result
         except Exception as e:
             return {
                 'error': str(e),
@@ -182,6 +212,8 @@ class OnePieceCLI:
         print(f"📁 Image: {image_path}")
         print(f"🎯 Character: {predicted_class}")
         print(f"📊 Confidence: {confidence:.2%}")
+        if 'face_detected' in result:
+            print(f"🙂 Face detected: {'yes' if result['face_detected'] else 'no, used the full image'}")
         print(f"👤 Name: {char_info.get('name', 'Unknown')}")
         print(f"⚓ Crew: {char_info.get('crew', 'Unknown')}")
         print(f"💰 Bounty: {char_info.get('bounty', 'Unknown')}")
@@ -190,7 +222,9 @@ class OnePieceCLI:
         
         # Show top 3 predictions
         print(f"\n🏆 TOP PREDICTIONS:")
-        sorted_probs = sorted(enumerate(result['probabilities']), key=lambda x: x[1], reverse=True)
+        # Probabilities are stored as a (1, num_classes) nested list
+        probabilities = result['probabilities'][0]
+        sorted_probs = sorted(enumerate(probabilities), key=lambda x: x[1], reverse=True)
         for i, (idx, prob) in enumerate(sorted_probs[:3], 1):
             char_name = self.class_names[idx]
             print(f"  {i}. {char_name}: {prob:.2%}")
@@ -261,35 +295,38 @@ class OnePieceCLI:
             except Exception as e:
                 print(f"❌ Error: {e}")
     
-    def batch_process(self, directory):
-        """Process all images in a directory"""
+    def batch_process(self, directory, recursive=True):
+        """Process all images in a directory (and its subdirectories unless recursive is False)"""
         print(f"\n📁 Processing directory: {directory}")
         
-        # Find image files
-        image_extensions = ['.jpg', '.jpeg', '.png', '.bmp', '.tiff']
-        image_files = []
+        # Batched forward passes; files are discovered lazily and decoding and
+        # face detection run in the worker processes
+        processor = BatchProcessor()
+        try:
+            image_files = processor.scan_images(directory, recursive=recursive)
+        except ValueError as e:
+            print(f"❌ {e}")
+            return
         
-        for ext in image_extensions:
-            image_files.extend(Path(directory).glob(f"*{ext}"))
-            image_files.extend(Path(directory).glob(f"*{ext.upper()}"))
+        results = []
+        for batch_results in processor.iter_result_batches(image_files, self.batch_size, self.workers,
+                                                           face_crop=self.face_crop):
+            for result in batch_results:
+                image_file = result['image_path']
+                results.append((image_file, result))
+                
+                if result['success']:
+                    face = ""
+                    if 'face_detected' in result:
+                        face = ", face found" if result['face_detected'] else ", no face"
+                    print(f"✅ {Path(image_file).name}: {result['predicted_class']} ({result['confidence']:.2%}{face})")
+                else:
+                    print(f"❌ {Path(image_file).name}: {result['error']}")
         
-        if not image_files:
+        if not results:
             print("❌ No image files found in directory")
             return
         
-        print(f"📊 Found {len(image_files)} images to process")
-        
-        results = []
-        for i, image_file in enumerate(image_files, 1):
-            print(f"\n🔄 Processing {i}/{len(image_files)}: {image_file.name}")
-            result = self.predict_image(str(image_file))
-            results.append((str(image_file), result))
-            
-            if result['success']:
-                print(f"✅ {result['predicted_class']} ({result['confidence']:.2%})")
-            else:
-                print(f"❌ Error: {result['error']}")
-        
         # Summary
         successful = [r for _, r in results if r['success']]
         print(f"\n📈 BATCH PROCESSING SUMMARY")
@@ -303,7 +340,7 @@ class OnePieceCLI:
             # Character distribution
             char_counts = {}
             confidences = []
-            for _, result in successful:
+            for result in successful:
                 char = result['predicted_class']
                 char_counts[char] = char_counts.get(char, 0) + 1
                 confidences.append(result['confidence'])
@@ -375,10 +412,17 @@ def main():
     parser.add_argument('--list', action='store_true', help='List all available characters')
     parser.add_argument('--stats', action='store_true', help='Show model statistics')
     parser.add_argument('--interactive', action='store_true', help='Run in interactive mode')
+    parser.add_argument('--face-crop', action='store_true',
+                        help='Crop images to the detected face before classifying, as the web app does')
+    parser.add_argument('--batch-size', type=int, default=32, help='Images per forward pass in batch mode')
+    parser.add_argument('--workers', type=int, default=min(8, os.cpu_count() or 1),
+                        help='Decode/face detection processes in batch mode (0 = in process)')
+    parser.add_argument('--no-recursive', action='store_true',
+                        help='In batch mode, skip images in subdirectories')
     
     args = parser.parse_args()
     
-    cli = OnePieceCLI()
+    cli = OnePieceCLI(face_crop=args.face_crop, batch_size=args.batch_size, workers=args.workers)
     
     if args.interactive:
         cli.interactive_mode()
@@ -386,7 +430,7 @@ def main():
         result = cli.predict_image(args.image)
         cli.display_prediction(args.image, result)
     elif args.batch:
-        cli.batch_process(args.batch)
+        cli.batch_process(args.batch, recursive=not args.no_recursive)
     elif args.info:
         cli.show_character_info(args.info)
     elif args.list:
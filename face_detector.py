@@ -2,11 +2,151 @@
 import cv2
 import numpy as np
 import os
+import time
+import queue
+import threading
+from contextlib import contextmanager
+from concurrent.futures import ThreadPoolExecutor
+
+
+def merge_detections(boxes, scores=None, pass_ids=None, overlap_threshold=0.5):
+    """Merge overlapping (x, y, w, h) boxes into one box per face (non-maximum suppression)
+
+    Two boxes overlap when their intersection covers more than overlap_threshold
+    of the smaller box. Without explicit scores, each box is scored by how many
+    detector passes (pass_ids, or individual boxes if omitted) produced an
+    overlapping box, so the best-supported box wins rather than the first seen.
+    Ties go to the larger box. Returns (boxes, scores) ordered best first.
+
+    No pairwise matrix is built: support is counted against the boxes whose
+    x range can reach each box (found by binary search on sorted lefts), and
+    suppression compares each kept box only against the boxes still alive.
+    """
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    n = len(boxes)
+    if n == 0:
+        return [], []
+    
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+    
+    def overlapping(i, others):
+        overlap_x = np.clip(np.minimum(x2[i], x2[others]) - np.maximum(x1[i], x1[others]), 0, None)
+        overlap_y = np.clip(np.minimum(y2[i], y2[others]) - np.maximum(y1[i], y1[others]), 0, None)
+        return overlap_x * overlap_y > overlap_threshold * np.minimum(areas[i], areas[others])
+    
+    if scores is None:
+        by_left = np.argsort(x1, kind='stable')
+        lefts = x1[by_left]
+        widest = boxes[:, 2].max()
+        if pass_ids is not None:
+            _, pass_index = np.unique(np.asarray(pass_ids), return_inverse=True)
+        scores = np.empty(n)
+        for i in range(n):
+            # Only boxes starting within one box width to the left can reach box i
+            lo = np.searchsorted(lefts, x1[i] - widest, side='left')
+            hi = np.searchsorted(lefts, x2[i], side='left')
+            neighbours = by_left[lo:hi]
+            neighbours = neighbours[overlapping(i, neighbours)]
+            # Count distinct passes agreeing with each box
+            scores[i] = len(neighbours) if pass_ids is None else len(np.unique(pass_index[neighbours]))
+    scores = np.asarray(scores, dtype=np.float64).reshape(-1)
+    
+    # Greedy suppression: each kept box knocks out its overlaps among the survivors
+    remaining = np.lexsort((-areas, -scores))
+    keep = []
+    while len(remaining):
+        i = remaining[0]
+        keep.append(i)
+        rest = remaining[1:]
+        remaining = rest[~overlapping(i, rest)]
+    
+    kept_boxes = [tuple(int(v) for v in boxes[i]) for i in keep]
+    return kept_boxes, scores[keep].tolist()
+
+
+# Shared thread pool for running cascade passes of one image in parallel
+_pass_executor = None
+_pass_executor_workers = os.cpu_count() or 1
+_pass_executor_lock = threading.Lock()
+
+# Cascade classifiers are not safe to share between threads, so each pool
+# thread keeps its own copy of every cascade it has run
+_thread_cascades = threading.local()
+
+
+def configure_pass_executor(max_workers):
+    """Set the size of the thread pool shared by all parallel cascade sweeps"""
+    global _pass_executor, _pass_executor_workers
+    with _pass_executor_lock:
+        _pass_executor_workers = max(1, int(max_workers))
+        if _pass_executor is not None:
+            _pass_executor.shutdown(wait=False)
+            _pass_executor = None
+
+
+def _get_pass_executor():
+    global _pass_executor
+    with _pass_executor_lock:
+        if _pass_executor is None:
+            _pass_executor = ThreadPoolExecutor(max_workers=_pass_executor_workers,
+                                                thread_name_prefix='face-pass')
+        return _pass_executor
+
+
+def _thread_cascade(path):
+    """This thread's own CascadeClassifier for a cascade file"""
+    cascades = getattr(_thread_cascades, 'cascades', None)
+    if cascades is None:
+        cascades = _thread_cascades.cascades = {}
+    if path not in cascades:
+        cascades[path] = cv2.CascadeClassifier(path)
+    return cascades[path]
+
 
 class FaceDetector:
-    def __init__(self):
+    # Parameter sets swept by the exhaustive cascade mode
+    CASCADE_PARAMETERS = [
+        {'scaleFactor': 1.1, 'minNeighbors': 5, 'minSize': (30, 30)},
+        {'scaleFactor': 1.05, 'minNeighbors': 3, 'minSize': (20, 20)},
+        {'scaleFactor': 1.2, 'minNeighbors': 4, 'minSize': (25, 25)},
+        {'scaleFactor': 1.15, 'minNeighbors': 6, 'minSize': (35, 35)},
+        {'scaleFactor': 1.08, 'minNeighbors': 4, 'minSize': (40, 40)},
+        {'scaleFactor': 1.12, 'minNeighbors': 7, 'minSize': (50, 50)}
+    ]
+    
+    # Fast mode: one cascade, one parameter set, on a bounded-size copy
+    FAST_CASCADE = 'haarcascade_frontalface_default.xml'
+    FAST_PARAMETERS = {'scaleFactor': 1.05, 'minNeighbors': 3, 'minSize': (20, 20)}
+    FAST_MAX_SIDE = 480
+    
+    MODES = ('exhaustive', 'fast')
+    
+    # Relative per-window cost of each cascade, used to order budgeted passes
+    CASCADE_COST = {
+        'haarcascade_frontalface_alt2.xml': 0.8,
+        'haarcascade_frontalface_default.xml': 1.0,
+        'haarcascade_frontalface_alt.xml': 1.0,
+        'haarcascade_frontalface_alt_tree.xml': 1.6
+    }
+    
+    def __init__(self, mode='exhaustive', budget_ms=None, parallelism=1):
+        if mode not in self.MODES:
+            raise ValueError(f"Unknown face detection mode '{mode}', expected one of {self.MODES}")
+        self.mode = mode
+        # Per-call face detection time budget; None runs the full sweep
+        self.budget_ms = budget_ms
+        # Number of threads one exhaustive sweep may use (1 = serial)
+        self.parallelism = max(1, int(parallelism))
+        # Cascade speed in ms per unit of pass cost per megapixel, measured by
+        # earlier budgeted calls (calibrated on the first one)
+        self._ms_per_cost_mp = None
+        
         # Load multiple pre-trained face detection models for better detection
         self.face_cascades = []
+        self.cascade_names = []
+        self.cascade_paths = []
         self.face_net = None
         
         # Try to load different cascade classifiers
@@ -22,6 +162,8 @@ class FaceDetector:
                 cascade = cv2.CascadeClassifier(path)
                 if not cascade.empty():
                     self.face_cascades.append(cascade)
+                    self.cascade_names.append(os.path.basename(path))
+                    self.cascade_paths.append(path)
         
         # Try to load DNN-based face detection (more accurate)
         try:
@@ -42,6 +184,8 @@ class FaceDetector:
                 cascade = cv2.CascadeClassifier('haarcascade_frontalface_default.xml')
                 if not cascade.empty():
                     self.face_cascades.append(cascade)
+                    self.cascade_names.append('haarcascade_frontalface_default.xml')
+                    self.cascade_paths.append('haarcascade_frontalface_default.xml')
             except:
                 pass
         
@@ -49,6 +193,8 @@ class FaceDetector:
         if not self.face_cascades:
             print("Warning: No face cascade classifiers found. Face detection will be disabled.")
             self.face_cascades = []
+            self.cascade_names = []
+            self.cascade_paths = []
     
     def detect_faces_dnn(self, image):
         """Detect faces using DNN-based model (more accurate)"""
@@ -68,6 +214,7 @@ class FaceDetector:
             detections = self.face_net.forward()
             
             faces = []
+            confidences = []
             for i in range(detections.shape[2]):
                 confidence = detections[0, 0, i, 2]
                 
@@ -84,72 +231,234 @@ class FaceDetector:
                     
                     if w > 0 and h > 0:
                         faces.append((x, y, w, h))
+                        confidences.append(float(confidence))
             
+            faces, _ = merge_detections(faces, scores=confidences)
             return faces
             
         except Exception as e:
             print(f"DNN face detection error: {e}")
             return []
     
-    def detect_faces_cascade(self, image):
-        """Detect faces using cascade classifiers"""
+    def detect_faces_cascade(self, image, mode=None):
+        """Detect faces using cascade classifiers
+
+        mode='exhaustive' sweeps every loaded cascade with every parameter set
+        on the full-resolution image; mode='fast' runs a single tuned cascade
+        once on a copy downscaled to at most FAST_MAX_SIDE pixels and maps the
+        boxes back to original coordinates. Defaults to the detector's mode.
+        """
         if not self.face_cascades:
             return []
         
+        if (mode or self.mode) == 'fast':
+            return self._detect_faces_cascade_fast(image)
+        
         gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
         all_faces = []
         
         # Try different parameters for each cascade
-        parameters_list = [
-            {'scaleFactor': 1.1, 'minNeighbors': 5, 'minSize': (30, 30)},
-            {'scaleFactor': 1.05, 'minNeighbors': 3, 'minSize': (20, 20)},
-            {'scaleFactor': 1.2, 'minNeighbors': 4, 'minSize': (25, 25)},
-            {'scaleFactor': 1.15, 'minNeighbors': 6, 'minSize': (35, 35)},
-            {'scaleFactor': 1.08, 'minNeighbors': 4, 'minSize': (40, 40)},
-            {'scaleFactor': 1.12, 'minNeighbors': 7, 'minSize': (50, 50)}
-        ]
+        pass_ids = []
+        if self.parallelism > 1:
+            results = self._run_passes_parallel(self._cascade_passes(), gray)
+        else:
+            results = ((cascade_pass, self._run_pass(cascade_pass, gray))
+                       for cascade_pass in self._cascade_passes())
         
-        for cascade in self.face_cascades:
-            for params in parameters_list:
-                faces = cascade.detectMultiScale(
-                    gray,
-                    scaleFactor=params['scaleFactor'],
-                    minNeighbors=params['minNeighbors'],
-                    minSize=params['minSize']
-                )
-                
-                if len(faces) > 0:
-                    all_faces.extend(faces)
+        for cascade_pass, faces in results:
+            if len(faces) > 0:
+                all_faces.extend(faces)
+                pass_ids.extend([cascade_pass['id']] * len(faces))
+        
+        # Merge duplicate detections, preferring boxes most passes agree on
+        faces, _ = merge_detections(all_faces, pass_ids=pass_ids)
+        return faces
+    
+    def _cascade_passes(self):
+        """Every (cascade, parameter set) combination of the exhaustive sweep"""
+        passes = []
+        for cascade_index, (cascade, name) in enumerate(zip(self.face_cascades, self.cascade_names)):
+            for params_index, params in enumerate(self.CASCADE_PARAMETERS):
+                # Image pyramid work is roughly proportional to 1 / (1 - scaleFactor^-2)
+                cost = self.CASCADE_COST.get(name, 1.0) / (1.0 - params['scaleFactor'] ** -2)
+                passes.append({
+                    'id': cascade_index * len(self.CASCADE_PARAMETERS) + params_index,
+                    'name': f"{os.path.splitext(name)[0].replace('haarcascade_', '')}"
+                            f"[sf={params['scaleFactor']},mn={params['minNeighbors']},min={params['minSize'][0]}]",
+                    'cascade': cascade,
+                    'cascade_path': self.cascade_paths[cascade_index],
+                    'params': params,
+                    'cost': cost
+                })
+        return passes
+    
+    def _run_passes_parallel(self, passes, gray):
+        """Fan the passes out over the shared pool, returning (pass, faces) pairs in pass order"""
+        # merge_detections breaks ties by input order, so results must come
+        # back in the serial sweep's order to give the same faces
+        position = {id(cascade_pass): i for i, cascade_pass in enumerate(passes)}
+        # Deal passes round-robin by cost so every group takes about as long
+        passes = sorted(passes, key=lambda p: p['cost'], reverse=True)
+        groups = [passes[i::self.parallelism] for i in range(self.parallelism)]
+        groups = [group for group in groups if group]
+        
+        def run_group(group, own_cascades):
+            results = []
+            for cascade_pass in group:
+                cascade = cascade_pass['cascade'] if own_cascades else _thread_cascade(cascade_pass['cascade_path'])
+                results.append((cascade_pass, self._run_pass(cascade_pass, gray, cascade)))
+            return results
+        
+        # The calling thread works through the first group with this detector's
+        # own cascades while pool threads use their private copies
+        executor = _get_pass_executor()
+        futures = [executor.submit(run_group, group, False) for group in groups[1:]]
+        results = run_group(groups[0], True)
+        for future in futures:
+            results.extend(future.result())
+        results.sort(key=lambda result: position[id(result[0])])
+        return results
+    
+    def _run_pass(self, cascade_pass, gray, cascade=None):
+        params = cascade_pass['params']
+        cascade = cascade if cascade is not None else cascade_pass['cascade']
+        return cascade.detectMultiScale(
+            gray,
+            scaleFactor=params['scaleFactor'],
+            minNeighbors=params['minNeighbors'],
+            minSize=params['minSize']
+        )
+    
+    def detect_faces_budgeted(self, image, budget_ms=None, min_faces=1, min_agreement=2,
+                              large_face_fraction=0.05):
+        """Detect faces within a time budget, cheapest passes first
+
+        Runs the DNN detector, then cascade passes ordered from cheapest to most
+        expensive, and stops as soon as min_faces confident faces are found or
+        the next pass would not fit in budget_ms. A face is confident when at
+        least min_agreement passes found it or it covers large_face_fraction of
+        the image. Returns (faces, report) where report lists the passes that ran.
+        
+        Pass times are predicted from the speed measured on earlier calls, so
+        the first pass is checked against the budget like the others.
+        """
+        if budget_ms is None:
+            budget_ms = self.budget_ms
+        if budget_ms is not None and self.face_cascades and self.mode != 'fast':
+            self._calibrate_pass_speed()
+        start = time.perf_counter()
+        report = {'passes_run': [], 'stopped': 'exhausted', 'budget_ms': budget_ms}
+        
+        def elapsed_ms():
+            return (time.perf_counter() - start) * 1000
+        
+        def finish(faces, stopped):
+            report['stopped'] = stopped
+            report['elapsed_ms'] = elapsed_ms()
+            return faces, report
+        
+        if self.face_net is not None:
+            faces = self.detect_faces_dnn(image)
+            report['passes_run'].append('dnn')
+            if len(faces) > 0:
+                return finish(faces, 'dnn')
         
-        # Remove duplicate detections
-        if all_faces:
-            faces_list = [tuple(face) for face in all_faces]
-            filtered_faces = []
+        if not self.face_cascades:
+            return finish([], 'exhausted')
+        
+        if self.mode == 'fast':
+            report['passes_run'].append('fast')
+            return finish(self._detect_faces_cascade_fast(image), 'exhausted')
+        
+        height, width = image.shape[:2]
+        image_area = float(height * width)
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        megapixels = image_area / 1e6
+        
+        all_faces, pass_ids = [], []
+        faces = []
+        cascade_ms = 0.0
+        cascade_cost = 0.0
+        
+        for cascade_pass in sorted(self._cascade_passes(), key=lambda p: p['cost']):
+            if budget_ms is not None:
+                # Skip the rest once the next pass is predicted not to fit
+                predicted_ms = cascade_pass['cost'] * megapixels * self._ms_per_cost_mp
+                if elapsed_ms() + predicted_ms > budget_ms:
+                    return finish(faces, 'budget')
             
-            for face in faces_list:
-                x, y, w, h = face
-                is_duplicate = False
-                
-                for existing_face in filtered_faces:
-                    ex, ey, ew, eh = existing_face
-                    # Check if faces overlap significantly
-                    overlap_x = max(0, min(x + w, ex + ew) - max(x, ex))
-                    overlap_y = max(0, min(y + h, ey + eh) - max(y, ey))
-                    overlap_area = overlap_x * overlap_y
-                    
-                    if overlap_area > 0.5 * min(w * h, ew * eh):
-                        is_duplicate = True
-                        break
-                
-                if not is_duplicate:
-                    filtered_faces.append(face)
+            pass_start = time.perf_counter()
+            found = self._run_pass(cascade_pass, gray)
+            cascade_ms += (time.perf_counter() - pass_start) * 1000
+            cascade_cost += cascade_pass['cost']
+            # This image's own speed is the best predictor for its next passes
+            self._ms_per_cost_mp = cascade_ms / (cascade_cost * megapixels)
+            report['passes_run'].append(cascade_pass['name'])
             
-            return filtered_faces
+            if len(found) > 0:
+                all_faces.extend(found)
+                pass_ids.extend([cascade_pass['id']] * len(found))
+                faces, scores = merge_detections(all_faces, pass_ids=pass_ids)
+                confident = [
+                    face for face, score in zip(faces, scores)
+                    if score >= min_agreement or face[2] * face[3] >= large_face_fraction * image_area
+                ]
+                if len(confident) >= min_faces:
+                    return finish(faces, 'confident')
+        
+        return finish(faces, 'exhausted')
+    
+    def _calibrate_pass_speed(self):
+        """Time the cheapest pass once on a noise image, if no call has measured the speed yet"""
+        if self._ms_per_cost_mp is not None:
+            return
+        sample = np.random.default_rng(0).integers(0, 256, size=(240, 320), dtype=np.uint8)
+        cheapest = min(self._cascade_passes(), key=lambda p: p['cost'])
+        start = time.perf_counter()
+        self._run_pass(cheapest, sample)
+        elapsed_ms = (time.perf_counter() - start) * 1000
+        self._ms_per_cost_mp = elapsed_ms / (cheapest['cost'] * sample.size / 1e6)
+    
+    def _fast_cascade(self):
+        """The cascade used by fast mode"""
+        if self.FAST_CASCADE in self.cascade_names:
+            return self.face_cascades[self.cascade_names.index(self.FAST_CASCADE)]
+        return self.face_cascades[0]
+    
+    def _detect_faces_cascade_fast(self, image):
+        """Single cascade pass on a bounded-size grayscale copy of the image"""
+        height, width = image.shape[:2]
+        scale = min(1.0, self.FAST_MAX_SIDE / max(height, width))
+        
+        gray = cv2.cvtColor(image, cv2.COLOR_BGR2GRAY)
+        if scale < 1.0:
+            gray = cv2.resize(gray, (max(1, int(width * scale)), max(1, int(height * scale))),
+                              interpolation=cv2.INTER_AREA)
         
-        return []
+        faces = self._fast_cascade().detectMultiScale(
+            gray,
+            scaleFactor=self.FAST_PARAMETERS['scaleFactor'],
+            minNeighbors=self.FAST_PARAMETERS['minNeighbors'],
+            minSize=self.FAST_PARAMETERS['minSize']
+        )
+        
+        # Map boxes back to original image coordinates
+        mapped = []
+        for (x, y, w, h) in faces:
+            x = int(round(x / scale))
+            y = int(round(y / scale))
+            w = min(int(round(w / scale)), width - x)
+            h = min(int(round(h / scale)), height - y)
+            if w > 0 and h > 0:
+                mapped.append((x, y, w, h))
+        return mapped
     
     def detect_faces(self, image):
         """Detect faces using DNN first, fallback to cascade"""
+        if self.budget_ms is not None:
+            faces, _ = self.detect_faces_budgeted(image)
+            return faces
+        
         # Try DNN first (more accurate)
         faces = self.detect_faces_dnn(image)
         
@@ -237,8 +546,11 @@ class FaceDetector:
         
         return image[y1:y2, x1:x2]
     
-    def crop_face(self, image_path, target_size=(300, 400), padding=0.2):
-        """Crop image to focus on the detected face with optimal positioning"""
+    def crop_face(self, image_path, target_size=(300, 400), padding=0.2, faces=None):
+        """Crop image to focus on the detected face with optimal positioning
+
+        faces can carry boxes already detected on this image to skip detection.
+        """
         try:
             # Read image
             if isinstance(image_path, str):
@@ -252,7 +564,8 @@ class FaceDetector:
                 return None
             
             # Detect faces using improved detection
-            faces = self.detect_faces(image)
+            if faces is None:
+                faces = self.detect_faces(image)
             
             # Get optimal crop with more context
             cropped = self._get_optimal_crop(image, faces)
@@ -288,4 +601,98 @@ class FaceDetector:
             
         except Exception as e:
             print(f"Error in crop_face: {e}")
-            return None 
\ No newline at end of file
+            return None 
+
+
+class FaceDetectorPool:
+    """Bounded pool of FaceDetector instances for concurrent request threads
+
+    cv2.dnn nets and cascade classifiers keep per-call state, so one detector
+    must not be used by two threads at once. Each call borrows a detector for
+    its duration; at most size detectors are ever built, and callers wait when
+    all of them are busy. OpenCV releases the GIL, so detection runs in parallel.
+    """
+
+    def __init__(self, size=None, **detector_kwargs):
+        self.size = max(1, size or min(4, os.cpu_count() or 1))
+        self.detector_kwargs = detector_kwargs
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        
+        # Build one detector up front so configuration errors surface at startup
+        self._idle.put(self._create())
+    
+    def _create(self):
+        detector = FaceDetector(**self.detector_kwargs)
+        self._created += 1
+        return detector
+    
+    @contextmanager
+    def acquire(self, timeout=None):
+        """Borrow a detector for the duration of a with-block"""
+        try:
+            detector = self._idle.get_nowait()
+        except queue.Empty:
+            detector = None
+            with self._lock:
+                if self._created < self.size:
+                    detector = self._create()
+            if detector is None:
+                try:
+                    detector = self._idle.get(timeout=timeout)
+                except queue.Empty:
+                    raise TimeoutError("No face detector became available")
+        try:
+            yield detector
+        finally:
+            self._idle.put(detector)
+    
+    def detect_faces(self, image):
+        with self.acquire() as detector:
+            return detector.detect_faces(image)
+    
+    def detect_faces_budgeted(self, image, **kwargs):
+        with self.acquire() as detector:
+            return detector.detect_faces_budgeted(image, **kwargs)
+    
+    def detect_face(self, image):
+        with self.acquire() as detector:
+            return detector.detect_face(image)
+    
+    def crop_face(self, image_path, target_size=(300, 400), padding=0.2, faces=None):
+        with self.acquire() as detector:
+            return detector.crop_face(image_path, target_size, padding, faces)
+    
+    def stats(self):
+        """Return pool usage"""
+        return {
+            'size': self.size,
+            'created': self._created,
+            'idle': self._idle.qsize()
+        }
+
+
+def detector_options_from_env():
+    """FaceDetector keyword arguments from FACE_DETECTION_MODE / _BUDGET_MS / _PARALLELISM"""
+    budget_ms = os.environ.get('FACE_DETECTION_BUDGET_MS')
+    return {
+        'mode': os.environ.get('FACE_DETECTION_MODE', 'exhaustive'),
+        'budget_ms': float(budget_ms) if budget_ms else None,
+        'parallelism': int(os.environ.get('FACE_DETECTION_PARALLELISM', 1))
+    }
+
+
+def create_detector_pool_from_env():
+    """Build a FaceDetectorPool configured by the FACE_DETECT* environment variables
+
+    FACE_DETECTOR_POOL_SIZE    detectors per process (default: min(4, CPU count))
+    FACE_DETECTION_MODE        'exhaustive' (default) or 'fast'
+    FACE_DETECTION_BUDGET_MS   per-call time budget (default: none)
+    FACE_DETECTION_PARALLELISM threads one exhaustive sweep may use (default: 1)
+    FACE_DETECTION_THREADS     size of the pool shared by all parallel sweeps
+    """
+    pool_size = os.environ.get('FACE_DETECTOR_POOL_SIZE')
+    if os.environ.get('FACE_DETECTION_THREADS'):
+        configure_pass_executor(int(os.environ['FACE_DETECTION_THREADS']))
+    return FaceDetectorPool(size=int(pool_size) if pool_size else None, **detector_options_from_env())
@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Image file discovery for One Piece Character Classifier
+Walks a directory tree with os.scandir in a single pass, yielding image files
+(and optionally the images inside zip/tar archives) as they are found instead
+of building the whole list first
+"""
+
+import os
+import hashlib
+from fnmatch import fnmatch
+from pathlib import PurePosixPath
+
+from archive_io import is_archive, iter_archive_members, member_path, MEMBER_SEPARATOR
+
+IMAGE_EXTENSIONS = ('.jpg', '.jpeg', '.png', '.bmp', '.tiff')
+
+# How symbolic links are treated
+#   'skip'    ignore every symlink
+#   'files'   include symlinked files, don't descend into symlinked directories
+#   'follow'  include symlinked files and descend into symlinked directories
+SYMLINK_POLICIES = ('skip', 'files', 'follow')
+
+
+def shard_of(relative_path, count):
+    """Stable shard of a file, from its path relative to the input directory
+
+    Independent of the host, the mount point and the Python hash seed, so every
+    node agrees on which shard owns a file.
+    """
+    digest = hashlib.sha1(PurePosixPath(relative_path).as_posix().encode('utf-8')).digest()
+    return int.from_bytes(digest[:8], 'big') % count
+
+
+def _matches(relative_path, name, patterns):
+    return any(fnmatch(relative_path, pattern) or fnmatch(name, pattern) for pattern in patterns)
+
+
+def _keep(relative_path, name, extensions, include, exclude, shard):
+    if not name.lower().endswith(extensions):
+        return False
+    if include and not _matches(relative_path, name, include):
+        return False
+    if exclude and _matches(relative_path, name, exclude):
+        return False
+    return shard is None or shard_of(relative_path, shard[1]) == shard[0]
+
+
+def _iter_archive(path, relative_path, extensions, include, exclude, shard):
+    """Yield the '<archive>!<member>' paths of the images inside an archive
+
+    Members are filtered like files, their relative path being
+    '<archive relative path>!<member>' (just '<member>' for a root archive).
+    They are listed lazily, as compressed tars are read in the same pass (see
+    archive_io.iter_archive_members).
+    """
+    prefix = relative_path + MEMBER_SEPARATOR if relative_path else ''
+    members = iter_archive_members(path)
+    while True:
+        try:
+            member, _ = next(members)
+        except StopIteration:
+            return
+        except Exception as e:
+            print(f"⚠️  Skipping unreadable archive {path}: {e}")
+            return
+        if _keep(prefix + member, PurePosixPath(member).name, extensions, include, exclude, shard):
+            yield member_path(path, member)
+
+
+def iter_image_files(root, extensions=IMAGE_EXTENSIONS, recursive=True, include=None, exclude=None,
+                     symlinks='files', shard=None, archives=False):
+    """Yield the image files under root, reading each directory exactly once
+
+    Extensions match case-insensitively. include / exclude are glob patterns
+    tested against the path relative to root (using '/') and against the bare
+    name; a file must match some include pattern, when given, and no exclude
+    pattern, and excluded directories are not entered. shard=(i, N) keeps the
+    files of shard i (see shard_of). Entries are yielded in directory order,
+    and memory stays bounded by the depth of the tree, not its size.
+
+    root may itself be a zip or tar archive, whose image members are yielded
+    as '<archive>!<member>' paths (see archive_io). With archives, the
+    archives found while walking a directory are expanded the same way.
+    """
+    if symlinks not in SYMLINK_POLICIES:
+        raise ValueError(f"Unknown symlink policy '{symlinks}', expected one of {SYMLINK_POLICIES}")
+    extensions = tuple(ext.lower() for ext in extensions)
+    include = list(include or [])
+    exclude = list(exclude or [])
+
+    if os.path.isfile(root) and is_archive(root):
+        yield from _iter_archive(root, '', extensions, include, exclude, shard)
+        return
+    if not os.path.isdir(root):
+        raise ValueError(f"Input directory {root} does not exist")
+
+    # Directories already walked, so symlink loops are entered only once
+    visited = set()
+    root_stat = os.stat(root)
+    visited.add((root_stat.st_dev, root_stat.st_ino))
+
+    stack = [(root, '')]
+    while stack:
+        directory, prefix = stack.pop()
+        try:
+            entries = os.scandir(directory)
+        except OSError as e:
+            print(f"⚠️  Skipping unreadable directory {directory}: {e}")
+            continue
+
+        subdirectories = []
+        with entries:
+            for entry in entries:
+                relative_path = prefix + entry.name
+                try:
+                    is_symlink = entry.is_symlink()
+                    if is_symlink and symlinks == 'skip':
+                        continue
+
+                    if entry.is_dir(follow_symlinks=symlinks == 'follow'):
+                        if not recursive or _matches(relative_path, entry.name, exclude):
+                            continue
+                        if is_symlink:
+                            stat = entry.stat()
+                            if (stat.st_dev, stat.st_ino) in visited:
+                                continue
+                            visited.add((stat.st_dev, stat.st_ino))
+                        subdirectories.append((entry.path, relative_path + '/'))
+                        continue
+
+                    if not entry.is_file():
+                        continue
+                except OSError:
+                    # Broken symlink or entry removed while scanning
+                    continue
+
+                if archives and is_archive(entry.name):
+                    if not _matches(relative_path, entry.name, exclude):
+                        yield from _iter_archive(entry.path, relative_path, extensions, include, exclude, shard)
+                    continue
+                if _keep(relative_path, entry.name, extensions, include, exclude, shard):
+                    yield entry.path
+
+        # Walk subdirectories in the order they were listed
+        stack.extend(reversed(subdirectories))
+
+
+class ImageFileScanner:
+    """Re-iterable, picklable view of iter_image_files()
+
+    Each iteration rescans the tree, so batch runs can list files as they need
+    them instead of materializing the file list up front.
+    """
+
+    def __init__(self, root, extensions=IMAGE_EXTENSIONS, recursive=True, include=None, exclude=None,
+                 symlinks='files', shard=None, archives=False):
+        self.root = str(root)
+        self.extensions = tuple(extensions)
+        self.recursive = recursive
+        self.include = include
+        self.exclude = exclude
+        self.symlinks = symlinks
+        self.shard = shard
+        self.archives = archives
+
+    def __iter__(self):
+        return iter_image_files(self.root, self.extensions, self.recursive, self.include, self.exclude,
+                                self.symlinks, self.shard, self.archives)
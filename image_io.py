@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+Image upload handling for One Piece Character Classifier
+Reads uploaded images from raw, multipart or base64 JSON request bodies
+"""
+
+import io
+import os
+import base64
+import hashlib
+import cv2
+import numpy as np
+from PIL import Image
+
+# Uploads larger than this are rejected from their header, before any pixels are allocated
+MAX_IMAGE_PIXELS = int(os.environ.get('IMAGE_MAX_PIXELS', 40_000_000))
+
+# PIL's own bomb check would otherwise fire first (raising above twice its
+# default of ~89M pixels), or reject images this limit allows
+Image.MAX_IMAGE_PIXELS = MAX_IMAGE_PIXELS or None
+
+# JPEGs are decoded at the smallest 1/2, 1/4 or 1/8 scale whose shorter side is
+# still at least this long: plenty for face detection, the 300x400 letterbox
+# and the 224x224 model input (0 decodes at full resolution)
+DECODE_MIN_SIDE = int(os.environ.get('IMAGE_DECODE_MIN_SIDE', 512))
+
+_REDUCED_COLOR_FLAGS = {
+    2: cv2.IMREAD_REDUCED_COLOR_2,
+    4: cv2.IMREAD_REDUCED_COLOR_4,
+    8: cv2.IMREAD_REDUCED_COLOR_8,
+}
+
+
+class ImageTooLargeError(ValueError):
+    """Upload declares more pixels than MAX_IMAGE_PIXELS"""
+
+
+def read_image_upload(request):
+    """Return a file-like object holding the uploaded image, or None if there is none
+
+    Accepted request bodies, cheapest first:
+      - raw bytes with an image/* (or application/octet-stream) content type
+      - multipart/form-data with the image in the 'image' field
+      - JSON {"image": "<base64 or data URL>"}, kept for older clients
+
+    Raises ValueError if a JSON image is not valid base64.
+    """
+    mimetype = request.mimetype or ''
+
+    if mimetype.startswith('image/') or mimetype == 'application/octet-stream':
+        data = request.get_data(cache=False)
+        return io.BytesIO(data) if data else None
+
+    if mimetype == 'multipart/form-data':
+        file = request.files.get('image')
+        if file is None or file.filename == '':
+            return None
+        # Werkzeug spools the part to a seekable file, PIL reads it in place
+        return file.stream
+
+    data = request.get_json(silent=True)
+    if not data or 'image' not in data:
+        return None
+
+    image_data = data['image']
+    if ',' in image_data:
+        image_data = image_data.split(',', 1)[1]
+    try:
+        return io.BytesIO(base64.b64decode(image_data))
+    except ValueError as e:
+        raise ValueError(f"Invalid base64 image data: {e}")
+
+
+def upload_digest(upload, chunk_size=1 << 20):
+    """SHA-256 of an uploaded image's raw bytes, leaving the stream at the start"""
+    if isinstance(upload, io.BytesIO):
+        return hashlib.sha256(upload.getbuffer()).hexdigest()
+    digest = hashlib.sha256()
+    upload.seek(0)
+    for chunk in iter(lambda: upload.read(chunk_size), b''):
+        digest.update(chunk)
+    upload.seek(0)
+    return digest.hexdigest()
+
+
+def probe_image(source, max_pixels=MAX_IMAGE_PIXELS):
+    """Read an image's header only, returns (width, height, format)
+
+    Raises ImageTooLargeError for images over max_pixels (decompression bombs).
+    """
+    try:
+        with Image.open(source) as image:
+            width, height = image.size
+            image_format = image.format
+    except Image.DecompressionBombError as e:
+        raise ImageTooLargeError(str(e))
+    finally:
+        source.seek(0)
+    if max_pixels and width * height > max_pixels:
+        raise ImageTooLargeError(
+            f"Image is {width}x{height} ({width * height} pixels), the limit is {max_pixels}"
+        )
+    return width, height, image_format
+
+
+def reduction_factor(width, height, min_side=DECODE_MIN_SIDE):
+    """Largest JPEG decode scale (1, 2, 4 or 8) keeping the shorter side at least min_side"""
+    if not min_side:
+        return 1
+    for factor in (8, 4, 2):
+        if min(width, height) // factor >= min_side:
+            return factor
+    return 1
+
+
+def decode_image(source, min_side=None, max_pixels=MAX_IMAGE_PIXELS):
+    """Decode an uploaded image into an RGB PIL image
+
+    With min_side, JPEGs are decoded at a reduced scale (see reduction_factor).
+    """
+    width, height, image_format = probe_image(source, max_pixels)
+    image = Image.open(source)
+    factor = reduction_factor(width, height, min_side) if image_format == 'JPEG' else 1
+    if factor > 1:
+        image.draft('RGB', (width // factor, height // factor))
+    return image.convert("RGB")
+
+
+def _upload_bytes(source):
+    """Raw bytes of an upload without copying in-memory bodies"""
+    if isinstance(source, io.BytesIO):
+        return source.getbuffer()
+    source.seek(0)
+    data = source.read()
+    source.seek(0)
+    return data
+
+
+def decode_image_array(source, min_side=DECODE_MIN_SIDE, max_pixels=MAX_IMAGE_PIXELS):
+    """Decode an uploaded image straight into a BGR uint8 array for OpenCV
+
+    Skips the PIL image and the RGB -> BGR copy of decode_image(). The header
+    is checked against max_pixels first, and JPEGs are decoded directly at a
+    reduced scale (see reduction_factor). EXIF orientation is ignored, as PIL
+    does, so both decoders agree pixel for pixel; formats OpenCV can't read
+    (e.g. GIF) go through PIL instead.
+    """
+    width, height, image_format = probe_image(source, max_pixels)
+    flags = cv2.IMREAD_COLOR
+    if image_format == 'JPEG':
+        flags = _REDUCED_COLOR_FLAGS.get(reduction_factor(width, height, min_side), flags)
+
+    data = np.frombuffer(_upload_bytes(source), dtype=np.uint8)
+    image = cv2.imdecode(data, flags | cv2.IMREAD_IGNORE_ORIENTATION)
+    if image is not None:
+        return image
+    return cv2.cvtColor(np.asarray(decode_image(source, min_side, max_pixels)), cv2.COLOR_RGB2BGR)
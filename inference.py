@@ -0,0 +1,152 @@
+#!/usr/bin/env python3
+"""
+Inference entry point for One Piece Character Classifier
+Loads only the model architecture, the trained checkpoint and the class list,
+without scanning the dataset or training. Serving code should import from here
+instead of model.py.
+"""
+
+import os
+import argparse
+import hashlib
+import torch
+from model import (
+    load_classifier,
+    build_transform,
+    transform_spec,
+    load_model_bundle,
+    save_model_bundle,
+    bundle_path_for,
+    export_safetensors,
+    predict,
+    data_dir,
+    model_path as default_model_path,
+)
+
+device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
+
+
+def resolve_model_path(path=default_model_path):
+    """Prefer a memory-mappable safetensors export of the checkpoint when it is up to date
+
+    Training only rewrites the .pth, so an export older than it is stale and
+    the .pth is served instead.
+    """
+    safetensors_path = os.path.splitext(path)[0] + '.safetensors'
+    if not os.path.exists(safetensors_path):
+        return path
+    if os.path.exists(path) and os.path.getmtime(path) > os.path.getmtime(safetensors_path):
+        print(f"⚠️  {safetensors_path} is older than {path}, serving the checkpoint instead")
+        print(f"   Run 'python inference.py --export-safetensors {safetensors_path}' to refresh it.")
+        return path
+    return safetensors_path
+
+
+# Checkpoint to serve (.pth or .safetensors), overridable via MODEL_PATH
+model_path = os.environ.get('MODEL_PATH') or resolve_model_path()
+
+
+def load_class_names(data_dir=data_dir):
+    """Return class names in the same order ImageFolder assigns labels"""
+    # Only the top-level class folders are listed, the images are never touched
+    return sorted(entry.name for entry in os.scandir(data_dir) if entry.is_dir())
+
+
+def load_model(model_path=model_path, device=device):
+    """Build the classifier from its checkpoint bundle and load the trained weights
+
+    Returns (model, class_names, transform).
+    """
+    if not os.path.exists(model_path):
+        raise FileNotFoundError(
+            f"No trained model found at {os.path.abspath(model_path)}. "
+            "Run train_model.py first."
+        )
+
+    bundle = load_model_bundle(model_path)
+    if bundle is None:
+        # Older checkpoints carry no metadata, fall back to the dataset folders
+        print(f"⚠️  No model bundle found at {bundle_path_for(model_path)}, "
+              f"reading class names from {data_dir}")
+        print("   Run 'python inference.py --write-bundle' to create one.")
+        class_names = load_class_names()
+        model = load_classifier(model_path, num_classes=len(class_names), device=device)
+        transform = build_transform(transform_spec)
+    else:
+        class_names = bundle['class_names']
+        model = load_classifier(
+            model_path,
+            num_classes=bundle['num_classes'],
+            device=device,
+            backbone_name=bundle['backbone'],
+            feature_size=bundle['feature_size']
+        )
+        transform = build_transform(bundle['transform'])
+
+    model.to(device)
+    model.eval()
+    return model, class_names, transform
+
+
+def load_transform_spec(model_path=model_path):
+    """Preprocessing spec the checkpoint was trained with"""
+    bundle = load_model_bundle(model_path)
+    return bundle['transform'] if bundle is not None else transform_spec
+
+
+def compute_model_version(model_path=model_path):
+    """Short version id of the checkpoint and its bundle, used to version cached predictions
+
+    Built from the checkpoint's size and mtime plus the (small) bundle's
+    contents, so it costs a stat rather than a read of the weights at every
+    worker start; rewriting either file changes it. Set MODEL_VERSION to pin
+    the version explicitly, e.g. to share caches between hosts whose copies
+    of the checkpoint have different mtimes.
+    """
+    if os.environ.get('MODEL_VERSION'):
+        return os.environ['MODEL_VERSION']
+    digest = hashlib.sha256()
+    if os.path.exists(model_path):
+        stat = os.stat(model_path)
+        digest.update(f"{os.path.basename(model_path)}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    bundle_path = bundle_path_for(model_path)
+    if os.path.exists(bundle_path):
+        with open(bundle_path, 'rb') as f:
+            digest.update(f.read())
+    return digest.hexdigest()[:16]
+
+
+print(f"Using device: {device}")
+print(f"Loading model from: {os.path.abspath(model_path)}")
+model, class_names, transform = load_model()
+model_transform_spec = load_transform_spec()
+model_version = compute_model_version()
+print(f"✅ Model loaded successfully (version {model_version})")
+
+
+def main():
+    parser = argparse.ArgumentParser(description='One Piece Character Classifier model utilities')
+    parser.add_argument('--write-bundle', action='store_true',
+                        help='Write the metadata bundle for the current checkpoint')
+    parser.add_argument('--export-safetensors', metavar='PATH',
+                        help='Export the current checkpoint as a memory-mappable safetensors file')
+    parser.add_argument('--fp16', action='store_true',
+                        help='Store exported weights as float16 (upcast to float32 on load)')
+
+    args = parser.parse_args()
+
+    if args.write_bundle:
+        bundle_path = save_model_bundle(model, class_names, model_path)
+        print(f"📦 Model bundle saved as: {bundle_path}")
+    elif args.export_safetensors:
+        dtype = torch.float16 if args.fp16 else torch.float32
+        export_safetensors(model, args.export_safetensors, dtype=dtype)
+        bundle_path = save_model_bundle(model, class_names, args.export_safetensors)
+        print(f"💾 Model exported as: {args.export_safetensors} ({str(dtype).replace('torch.', '')})")
+        print(f"📦 Model bundle saved as: {bundle_path}")
+    else:
+        parser.print_help()
+
+
+if __name__ == "__main__":
+    main()
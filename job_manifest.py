@@ -0,0 +1,168 @@
+#!/usr/bin/env python3
+"""
+Batch job manifest for One Piece Character Classifier
+Records every classified file (path, size, mtime, content hash, result) in a
+SQLite file next to the reports, so an interrupted or repeated batch run only
+classifies new or changed files
+"""
+
+import os
+import json
+import hashlib
+import sqlite3
+import threading
+
+from archive_io import split_member_path, read_source, source_stat
+
+
+def file_digest(path, chunk_size=1 << 20):
+    """SHA-256 of a file's or archive member's contents"""
+    if split_member_path(path) is not None:
+        return hashlib.sha256(read_source(path)).hexdigest()
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(chunk_size), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class JobManifest:
+    """Processed-file manifest of a batch output directory
+
+    A file is skipped when the manifest holds a result for the same path from
+    the same model version and its size and mtime are unchanged. If only the
+    mtime moved, the content hash decides. Failed files are not recorded, so
+    they are retried on the next run.
+    """
+
+    def __init__(self, db_path, model_version):
+        self.db_path = str(db_path)
+        self.model_version = model_version
+        self._local = threading.local()
+        # (pid, connection) of every connection opened, for close()
+        self._connections = []
+        self._connect()
+
+    def _connect(self):
+        """This thread's connection; DataLoader workers and the folder watcher query the manifest too"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        # Only ever used by this thread, but close() may run on another
+        conn = sqlite3.connect(self.db_path, timeout=30.0, check_same_thread=False)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS files ("
+            " path TEXT PRIMARY KEY,"
+            " size INTEGER NOT NULL,"
+            " mtime_ns INTEGER NOT NULL,"
+            " sha256 TEXT NOT NULL,"
+            " model_version TEXT NOT NULL,"
+            " result TEXT NOT NULL)"
+        )
+        conn.commit()
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        self._connections.append((os.getpid(), conn))
+        return conn
+
+    def __getstate__(self):
+        # Connections can't cross processes, each one opens its own
+        state = self.__dict__.copy()
+        state['_local'] = None
+        state['_connections'] = []
+        return state
+
+    def __setstate__(self, state):
+        self.__dict__.update(state)
+        self._local = threading.local()
+
+    @staticmethod
+    def _key(path):
+        # abspath keeps '<archive>!<member>' intact, only the archive part is resolved
+        return os.path.abspath(path)
+
+    def lookup(self, image_file, stat=None, data=None):
+        """Stored result for image_file if it is still valid, else None
+
+        stat, its (size, mtime_ns), and data, its bytes, save a second stat or
+        read when the caller already has them, e.g. for compressed tar members.
+        """
+        key = self._key(image_file)
+        if stat is None:
+            try:
+                stat = source_stat(image_file)
+            except OSError:
+                return None
+        size, mtime_ns = stat
+
+        conn = self._connect()
+        row = conn.execute(
+            "SELECT size, mtime_ns, sha256, model_version, result FROM files WHERE path = ?", (key,)
+        ).fetchone()
+        if row is None or row[3] != self.model_version or row[0] != size:
+            return None
+
+        _, stored_mtime_ns, sha256, _, result = row
+        if stored_mtime_ns != mtime_ns:
+            # Touched but possibly unchanged, e.g. copied or restored from backup
+            digest = hashlib.sha256(data).hexdigest() if data is not None else file_digest(image_file)
+            if digest != sha256:
+                return None
+            with conn:
+                conn.execute("UPDATE files SET mtime_ns = ? WHERE path = ?", (mtime_ns, key))
+        return json.loads(result)
+
+    def holds(self, image_file, size, mtime_ns):
+        """Whether a result is stored for image_file at exactly this size and mtime
+
+        A cheap check for pollers, without lookup()'s content hash: a touched
+        but unchanged file is not held.
+        """
+        row = self._connect().execute(
+            "SELECT 1 FROM files WHERE path = ? AND size = ? AND mtime_ns = ? AND model_version = ?",
+            (self._key(image_file), size, mtime_ns, self.model_version)
+        ).fetchone()
+        return row is not None
+
+    def record(self, results):
+        """Store the successful results of a finished batch
+
+        Each result needs the 'sha256', 'file_size' and 'file_mtime_ns' captured
+        when its bytes were read (see ImageFileDataset), not a fresh stat: a
+        file rewritten since would otherwise be stored as unchanged with the
+        old hash and result.
+        """
+        rows = []
+        for result in results:
+            if not result['success'] or not all(k in result for k in ('sha256', 'file_size', 'file_mtime_ns')):
+                continue
+            size, mtime_ns = result['file_size'], result['file_mtime_ns']
+            rows.append((self._key(result['image_path']), size, mtime_ns, result['sha256'],
+                         self.model_version, json.dumps(result)))
+        conn = self._connect()
+        with conn:
+            conn.executemany(
+                "INSERT OR REPLACE INTO files (path, size, mtime_ns, sha256, model_version, result)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                rows
+            )
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM files").fetchone()[0]
+
+    def close(self):
+        """Close the connections this process opened, from any of its threads"""
+        pid = os.getpid()
+        for owner, conn in self._connections:
+            if owner == pid:
+                conn.close()
+        self._connections = [(owner, conn) for owner, conn in self._connections if owner != pid]
+        self._local = threading.local()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
@@ -6,12 +6,13 @@ from torch.utils.data import Dataset, DataLoader, random_split
 import torchvision.transforms as transforms
 from torchvision.datasets import ImageFolder
 import timm
-import matplotlib.pyplot as plt
 import numpy as np
 from PIL import Image
 import time
-from tqdm import tqdm
 import datetime
+import json
+import mmap
+import struct
 
 # Custom Dataset Class
 class OnePieceDataset(Dataset):
@@ -33,40 +34,50 @@ class OnePieceDataset(Dataset):
 # Data directory
 data_dir = 'static/op_dateset/Data/Data'
 
-# Image Transformations - optimized for faster training
-transform = transforms.Compose([
-    transforms.Resize((224, 224)),  # Standard size for better performance
-    transforms.ToTensor(),
-    transforms.Normalize(mean=[0.485, 0.456, 0.406], std=[0.229, 0.224, 0.225])  # ImageNet normalization
-])
+# Path to save/load model
+model_path = 'One_Piece_Model.pth'
 
-# Full Dataset
-dataset = OnePieceDataset(data_dir, transform)
+# Backbone used by the classifier (timm model name)
+backbone_name = 'mobilenetv2_100'
 
-# Split Dataset into Train, Validation, and Test
-train_size = int(0.7 * len(dataset))  # 70% for training
-val_size = int(0.15 * len(dataset))   # 15% for validation
-test_size = len(dataset) - train_size - val_size
+# Preprocessing spec shared by training, serving and the checkpoint bundle
+transform_spec = {
+    'resize': [224, 224],  # Standard size for better performance
+    'mean': [0.485, 0.456, 0.406],  # ImageNet normalization
+    'std': [0.229, 0.224, 0.225]
+}
 
-train_dataset, val_dataset, test_dataset = random_split(dataset, [train_size, val_size, test_size])
+def build_transform(spec):
+    """Build the preprocessing pipeline described by a transform spec"""
+    return transforms.Compose([
+        transforms.Resize(tuple(spec['resize'])),
+        transforms.ToTensor(),
+        transforms.Normalize(mean=spec['mean'], std=spec['std'])
+    ])
 
-# DataLoaders with optimized batch size (num_workers=0 to avoid multiprocessing issues)
-train_loader = DataLoader(train_dataset, batch_size=16, shuffle=True, num_workers=0)
-val_loader = DataLoader(val_dataset, batch_size=16, shuffle=False, num_workers=0)
-test_loader = DataLoader(test_dataset, batch_size=16, shuffle=False, num_workers=0)
+# Image Transformations - optimized for faster training
+transform = build_transform(transform_spec)
 
 # Enhanced Model Definition - Using MobileNetV2 for even faster training
 class FastOnePieceClassifier(nn.Module):
-    def __init__(self, num_classes=17):
+    def __init__(self, num_classes=17, backbone_name=backbone_name, feature_size=None, pretrained=True):
         super(FastOnePieceClassifier, self).__init__()
-        # Use MobileNetV2 for even faster training
-        self.base_model = timm.create_model('mobilenetv2_100', pretrained=True, num_classes=0)
+        # Use MobileNetV2 for even faster training. ImageNet weights are only
+        # needed for training; pass pretrained=False when a trained checkpoint
+        # will be loaded so construction never touches the network.
+        self.backbone_name = backbone_name
+        self.base_model = timm.create_model(backbone_name, pretrained=pretrained, num_classes=0)
         
-        # Get the actual output size from the base model
-        with torch.no_grad():
-            dummy_input = torch.randn(1, 3, 224, 224)
-            features = self.base_model(dummy_input)
-            feature_size = features.shape[1]
+        # Get the actual output size from the base model (known up front when
+        # rebuilding from a checkpoint bundle)
+        if feature_size is None:
+            feature_size = getattr(self.base_model, 'num_features', None)
+        if feature_size is None:
+            with torch.no_grad():
+                dummy_input = torch.randn(1, 3, 224, 224)
+                features = self.base_model(dummy_input)
+                feature_size = features.shape[1]
+        self.feature_size = feature_size
         
         # Add a simple classifier head (no pooling/flatten needed)
         self.classifier = nn.Sequential(
@@ -80,30 +91,181 @@ class FastOnePieceClassifier(nn.Module):
         return x
 
 
-device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
-print(f"Using device: {device}")
+def build_training_components(data_dir=data_dir, device=None):
+    """Build the dataset, loaders, model and optimizer used for training"""
+    if device is None:
+        device = torch.device("cuda:0" if torch.cuda.is_available() else "cpu")
 
-# Model, Loss Function, and Optimizer
-num_classes = len(dataset.data.classes)
-model = FastOnePieceClassifier(num_classes=num_classes)
-model.to(device)
-criterion = nn.CrossEntropyLoss()
-optimizer = optim.AdamW(model.parameters(), lr=0.001, weight_decay=0.01)  # AdamW for better convergence
-scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=2)
+    # Full Dataset
+    dataset = OnePieceDataset(data_dir, transform)
+
+    # Split Dataset into Train, Validation, and Test
+    train_size = int(0.7 * len(dataset))  # 70% for training
+    val_size = int(0.15 * len(dataset))   # 15% for validation
+    test_size = len(dataset) - train_size - val_size
+
+    train_dataset, val_dataset, test_dataset = random_split(dataset, [train_size, val_size, test_size])
+
+    # DataLoaders with optimized batch size (num_workers=0 to avoid multiprocessing issues)
+    train_loader = DataLoader(train_dataset, batch_size=16, shuffle=True, num_workers=0)
+    val_loader = DataLoader(val_dataset, batch_size=16, shuffle=False, num_workers=0)
+    test_loader = DataLoader(test_dataset, batch_size=16, shuffle=False, num_workers=0)
+
+    # Model, Loss Function, and Optimizer
+    num_classes = len(dataset.data.classes)
+    model = FastOnePieceClassifier(num_classes=num_classes)
+    model.to(device)
+    criterion = nn.CrossEntropyLoss()
+    optimizer = optim.AdamW(model.parameters(), lr=0.001, weight_decay=0.01)  # AdamW for better convergence
+    scheduler = optim.lr_scheduler.ReduceLROnPlateau(optimizer, mode='min', factor=0.5, patience=2)
+
+    return {
+        'dataset': dataset,
+        'train_loader': train_loader,
+        'val_loader': val_loader,
+        'test_loader': test_loader,
+        'num_classes': num_classes,
+        'model': model,
+        'criterion': criterion,
+        'optimizer': optimizer,
+        'scheduler': scheduler,
+        'device': device,
+    }
+
+
+def bundle_path_for(model_path):
+    """Path of the metadata bundle stored next to a checkpoint"""
+    return os.path.splitext(model_path)[0] + '.json'
+
+
+def save_model_bundle(model, class_names, model_path=model_path, transform_spec=transform_spec):
+    """Write the metadata needed to rebuild the model next to its checkpoint"""
+    bundle = {
+        'format_version': 1,
+        'architecture': type(model).__name__,
+        'backbone': model.backbone_name,
+        'feature_size': model.feature_size,
+        'num_classes': len(class_names),
+        'class_names': list(class_names),
+        'transform': transform_spec,
+        'weights': os.path.basename(model_path)
+    }
+    bundle_path = bundle_path_for(model_path)
+    with open(bundle_path, 'w') as f:
+        json.dump(bundle, f, indent=2)
+    return bundle_path
+
+
+def load_model_bundle(model_path=model_path):
+    """Read the metadata bundle for a checkpoint, or None if it has none"""
+    bundle_path = bundle_path_for(model_path)
+    if not os.path.exists(bundle_path):
+        return None
+    with open(bundle_path) as f:
+        bundle = json.load(f)
+    if len(bundle['class_names']) != bundle['num_classes']:
+        raise ValueError(f"Corrupt model bundle {bundle_path}: class list does not match num_classes")
+    return bundle
+
+
+# safetensors dtype codes understood by load_safetensors_state_dict
+_SAFETENSORS_DTYPES = {
+    'F64': torch.float64,
+    'F32': torch.float32,
+    'F16': torch.float16,
+    'BF16': torch.bfloat16,
+    'I64': torch.int64,
+    'I32': torch.int32,
+    'I16': torch.int16,
+    'I8': torch.int8,
+    'U8': torch.uint8,
+    'BOOL': torch.bool
+}
+
+
+def export_safetensors(model, output_path, dtype=torch.float32):
+    """Save the model weights as a safetensors file
+
+    Pass dtype=torch.float16 to halve the file size; floating point tensors are
+    upcast back to float32 by load_safetensors_state_dict.
+    """
+    from safetensors.torch import save_file
+
+    tensors = {}
+    for name, tensor in model.state_dict().items():
+        tensor = tensor.detach().cpu()
+        if tensor.is_floating_point():
+            tensor = tensor.to(dtype)
+        tensors[name] = tensor.contiguous()
+    save_file(tensors, output_path, metadata={'storage_dtype': str(dtype).replace('torch.', '')})
+    return output_path
+
+
+def load_safetensors_state_dict(path, dtype=torch.float32):
+    """Load a safetensors file as a state dict backed by a memory map
+
+    The file is mapped copy-on-write, so float32 weights are read straight from
+    the page cache and shared between every process that loads the same file.
+    Tensors stored in another floating point dtype (e.g. fp16 exports) are
+    upcast to dtype, which gives the process its own copy of those weights.
+    """
+    with open(path, 'rb') as f:
+        header_size = struct.unpack('<Q', f.read(8))[0]
+        header = json.loads(f.read(header_size))
+        buffer = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_COPY)
+
+    data_start = 8 + header_size
+    header.pop('__metadata__', None)
+
+    state_dict = {}
+    for name, info in header.items():
+        tensor_dtype = _SAFETENSORS_DTYPES[info['dtype']]
+        begin, end = info['data_offsets']
+        count = (end - begin) // torch.empty((), dtype=tensor_dtype).element_size()
+        if count == 0:
+            tensor = torch.empty(info['shape'], dtype=tensor_dtype)
+        else:
+            tensor = torch.frombuffer(buffer, dtype=tensor_dtype, count=count,
+                                      offset=data_start + begin).reshape(info['shape'])
+        if tensor.is_floating_point() and tensor.dtype != dtype:
+            tensor = tensor.to(dtype)
+        state_dict[name] = tensor
+    return state_dict
+
+
+def load_state_dict_file(path, device='cpu'):
+    """Load a checkpoint saved either with torch.save or as safetensors"""
+    if path.endswith('.safetensors'):
+        return load_safetensors_state_dict(path)
+    return torch.load(path, map_location=device, weights_only=True)
+
+
+def load_classifier(model_path=model_path, num_classes=17, device='cpu', **kwargs):
+    """Build the classifier for a trained checkpoint without downloading weights
+
+    The model is allocated on the meta device and its parameters are taken
+    directly from the checkpoint, so nothing is initialized only to be overwritten.
+    """
+    with torch.device('meta'):
+        model = FastOnePieceClassifier(num_classes=num_classes, pretrained=False, **kwargs)
+    state_dict = load_state_dict_file(model_path, device)
+    model.load_state_dict(state_dict, assign=True)
+    return model
 
-# Path to save/load model
-model_path = 'One_Piece_Model.pth'
 
 # Training function with progress tracking
-def train_model(model, train_loader, val_loader, num_epochs, device, optimizer, criterion, scheduler):
+def train_model(model, train_loader, val_loader, num_epochs, device, optimizer, criterion, scheduler,
+                model_path=model_path, class_names=None):
     """Train the model with detailed progress tracking"""
+    from tqdm import tqdm
+
     best_val_loss = float('inf')
     train_losses, val_losses = [], []
     
     print(f"\n🚀 Starting training for {num_epochs} epochs...")
     print(f"📊 Training samples: {len(train_loader.dataset)}")
     print(f"📊 Validation samples: {len(val_loader.dataset)}")
-    print(f"🎯 Classes: {num_classes}")
+    print(f"🎯 Classes: {model.classifier[-1].out_features}")
     print(f"⚡ Device: {device}")
     print("=" * 60)
     
@@ -185,6 +347,8 @@ def train_model(model, train_loader, val_loader, num_epochs, device, optimizer,
         if avg_val_loss < best_val_loss:
             best_val_loss = avg_val_loss
             torch.save(model.state_dict(), model_path)
+            if class_names is not None:
+                save_model_bundle(model, class_names, model_path)
             print(f"💾 Best model saved! (Val Loss: {avg_val_loss:.4f})")
         
         # Calculate time estimates
@@ -213,39 +377,10 @@ def train_model(model, train_loader, val_loader, num_epochs, device, optimizer,
     
     return train_losses, val_losses
 
-# Check if model exists
-model_exists = False
-print(f"Looking for model file at: {os.path.abspath(model_path)}")
-if os.path.exists(model_path):
-    try:
-        model.load_state_dict(torch.load(model_path, weights_only=True))
-        model.eval()
-        print("✅ Model loaded successfully. Skipping training...")
-        model_exists = True
-    except Exception as e:
-        print(f"❌ Error loading model: {e}")
-        print("🔄 Will train a new model...")
-else:
-    print("📝 No trained model found. Will train a new model...")
-
-# Only train if no model exists or loading failed
-if not model_exists:
-    print("\n🚀 Starting model training...")
-    print("=" * 60)
-    
-    # Train the model
-    train_losses, val_losses = train_model(
-        model=model,
-        train_loader=train_loader,
-        val_loader=val_loader,
-        num_epochs=10,  # Increased epochs for better performance
-        device=device,
-        optimizer=optimizer,
-        criterion=criterion,
-        scheduler=scheduler
-    )
-    
-    # Plot training curves
+def plot_training_curves(train_losses, val_losses, output_path='training_curves.png'):
+    """Save loss/accuracy curves from a training run"""
+    import matplotlib.pyplot as plt
+
     plt.figure(figsize=(12, 4))
     
     plt.subplot(1, 2, 1)
@@ -265,8 +400,8 @@ if not model_exists:
     plt.legend()
     
     plt.tight_layout()
-    plt.savefig('training_curves.png', dpi=300, bbox_inches='tight')
-    print("📊 Training curves saved as 'training_curves.png'")
+    plt.savefig(output_path, dpi=300, bbox_inches='tight')
+    print(f"📊 Training curves saved as '{output_path}'")
 
 # Preprocessing and Prediction Functions
 def preprocess_image(image_path, transform):
@@ -282,6 +417,8 @@ def predict(model, image_tensor, device):
     return probabilities
 
 def visualize_predictions(original_image, probabilities, class_names):
+    import matplotlib.pyplot as plt
+
     fig, axarr = plt.subplots(1, 2, figsize=(14, 7))
 
     # Display original image
@@ -304,10 +441,57 @@ def visualize_predictions(original_image, probabilities, class_names):
     plt.tight_layout()
     plt.show()
 
-# Test Inference (uncomment to test)
-# test_image = '/Users/jeremycheng/Downloads/OnePieceDataset/Data/Data/Shanks/1.png'
-# if os.path.exists(test_image):
-#     original_image, image_tensor = preprocess_image(test_image, transform)
-#     probabilities = predict(model, image_tensor, device)
-#     class_names = dataset.data.classes
-#     visualize_predictions(original_image, probabilities, class_names)
+def main():
+    """Load the trained model, or train a new one if no checkpoint exists"""
+    components = build_training_components()
+    model = components['model']
+    device = components['device']
+    print(f"Using device: {device}")
+
+    # Check if model exists
+    model_exists = False
+    print(f"Looking for model file at: {os.path.abspath(model_path)}")
+    if os.path.exists(model_path):
+        try:
+            model.load_state_dict(torch.load(model_path, weights_only=True))
+            model.eval()
+            print("✅ Model loaded successfully. Skipping training...")
+            model_exists = True
+        except Exception as e:
+            print(f"❌ Error loading model: {e}")
+            print("🔄 Will train a new model...")
+    else:
+        print("📝 No trained model found. Will train a new model...")
+
+    # Only train if no model exists or loading failed
+    if not model_exists:
+        print("\n🚀 Starting model training...")
+        print("=" * 60)
+        
+        # Train the model
+        train_losses, val_losses = train_model(
+            model=model,
+            train_loader=components['train_loader'],
+            val_loader=components['val_loader'],
+            num_epochs=10,  # Increased epochs for better performance
+            device=device,
+            optimizer=components['optimizer'],
+            criterion=components['criterion'],
+            scheduler=components['scheduler'],
+            class_names=components['dataset'].data.classes
+        )
+        
+        # Plot training curves
+        plot_training_curves(train_losses, val_losses)
+
+    # Test Inference (uncomment to test)
+    # test_image = '/Users/jeremycheng/Downloads/OnePieceDataset/Data/Data/Shanks/1.png'
+    # if os.path.exists(test_image):
+    #     original_image, image_tensor = preprocess_image(test_image, transform)
+    #     probabilities = predict(model, image_tensor, device)
+    #     class_names = components['dataset'].data.classes
+    #     visualize_predictions(original_image, probabilities, class_names)
+
+
+if __name__ == "__main__":
+    main()
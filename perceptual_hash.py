@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Near-duplicate detection for One Piece Character Classifier
+64-bit difference hashes (dHash) of a small grayscale thumbnail, which survive
+re-encoding and resizing, and a multi-index hash table that finds a stored
+hash within a Hamming distance without comparing against every entry
+"""
+
+import os
+import threading
+from collections import OrderedDict
+
+import cv2
+import numpy as np
+from PIL import Image
+
+HASH_BITS = 64
+
+
+def dhash(image, hash_size=8):
+    """Difference hash of an image as a 64-bit int
+
+    image is a BGR (or grayscale) uint8 array, as decoded by OpenCV, or a PIL
+    image. The image is area-averaged down to (hash_size + 1) x hash_size
+    grayscale pixels and each bit records whether a pixel is brighter than its
+    right neighbour.
+    """
+    if isinstance(image, Image.Image):
+        image = cv2.cvtColor(np.asarray(image.convert('RGB')), cv2.COLOR_RGB2GRAY)
+    elif image.ndim == 3:
+        image = cv2.cvtColor(image, cv2.COLOR_BGRA2GRAY if image.shape[2] == 4 else cv2.COLOR_BGR2GRAY)
+    thumbnail = cv2.resize(image, (hash_size + 1, hash_size), interpolation=cv2.INTER_AREA)
+    bits = (thumbnail[:, 1:] > thumbnail[:, :-1]).ravel()
+    return int.from_bytes(np.packbits(bits).tobytes(), 'big')
+
+
+def hamming_distance(a, b):
+    return (a ^ b).bit_count()
+
+
+class MultiIndexHashIndex:
+    """Hash -> value store answering "closest entry within max_distance bits"
+
+    The 64 bits are split into max_distance + 1 chunks, each with its own
+    table. Two hashes within max_distance bits agree exactly on at least one
+    chunk, so a query only compares against the entries sharing one of its
+    chunks instead of the whole index. Buckets stay small while chunks are
+    long, i.e. for distances up to about 10 bits.
+
+    With max_entries, the oldest entries are evicted first. Thread-safe.
+    """
+
+    def __init__(self, max_distance, max_entries=None):
+        if not 0 <= max_distance < HASH_BITS:
+            raise ValueError(f"max_distance must be between 0 and {HASH_BITS - 1}, got {max_distance}")
+        self.max_distance = max_distance
+        self.max_entries = max_entries
+        chunks = max_distance + 1
+        bounds = [round(i * HASH_BITS / chunks) for i in range(chunks + 1)]
+        # (shift, mask) of each chunk
+        self._chunks = [(HASH_BITS - end, (1 << (end - start)) - 1) for start, end in zip(bounds, bounds[1:])]
+        self._tables = [{} for _ in self._chunks]
+        self._entries = OrderedDict()
+        self._next_id = 0
+        self._lock = threading.Lock()
+
+    def _keys(self, value_hash):
+        return [(value_hash >> shift) & mask for shift, mask in self._chunks]
+
+    def add(self, value_hash, value):
+        """Store value under value_hash"""
+        with self._lock:
+            entry_id = self._next_id
+            self._next_id += 1
+            self._entries[entry_id] = (value_hash, value)
+            for table, key in zip(self._tables, self._keys(value_hash)):
+                table.setdefault(key, []).append(entry_id)
+            if self.max_entries is not None and len(self._entries) > self.max_entries:
+                self._evict_oldest()
+
+    def _evict_oldest(self):
+        entry_id, (value_hash, _) = self._entries.popitem(last=False)
+        for table, key in zip(self._tables, self._keys(value_hash)):
+            bucket = table[key]
+            bucket.remove(entry_id)
+            if not bucket:
+                del table[key]
+
+    def find(self, value_hash):
+        """Return (value, distance) of the closest entry within max_distance, or None"""
+        best = None
+        with self._lock:
+            seen = set()
+            for table, key in zip(self._tables, self._keys(value_hash)):
+                for entry_id in table.get(key, ()):
+                    if entry_id in seen:
+                        continue
+                    seen.add(entry_id)
+                    stored_hash, value = self._entries[entry_id]
+                    distance = hamming_distance(value_hash, stored_hash)
+                    if distance <= self.max_distance and (best is None or distance < best[1]):
+                        best = (value, distance)
+                        if distance == 0:
+                            return best
+        return best
+
+    def __len__(self):
+        return len(self._entries)
+
+
+def create_near_duplicate_index_from_env():
+    """Build the /predict near-duplicate index from NEAR_DUPLICATE_* environment variables
+
+    NEAR_DUPLICATE_DISTANCE    largest Hamming distance (bits of 64) at which an
+                               upload reuses an earlier prediction; unset or
+                               negative disables the index
+    NEAR_DUPLICATE_INDEX_SIZE  predictions remembered per process
+    """
+    max_distance = int(os.environ.get('NEAR_DUPLICATE_DISTANCE', -1))
+    if max_distance < 0:
+        return None
+    max_entries = int(os.environ.get('NEAR_DUPLICATE_INDEX_SIZE', 100000))
+    return MultiIndexHashIndex(max_distance, max_entries=max_entries)
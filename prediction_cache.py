@@ -0,0 +1,213 @@
+#!/usr/bin/env python3
+"""
+Prediction cache for One Piece Character Classifier
+Content-addressed LRU cache of /predict responses with TTL expiry and an
+optional SQLite store shared by every worker process on a host
+"""
+
+import os
+import json
+import time
+import sqlite3
+import threading
+from collections import OrderedDict
+
+
+def make_cache_key(image_digest, model_version):
+    """Cache key for an uploaded image under a specific model version"""
+    return f"{model_version}:{image_digest}"
+
+
+class SQLiteCacheBackend:
+    """Prediction store in a local SQLite file, shared between processes"""
+
+    def __init__(self, db_path, max_entries=100000, ttl_seconds=3600):
+        self.db_path = db_path
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self._local = threading.local()
+        self._writes = 0
+        # put() runs on every request thread sharing this backend
+        self._writes_lock = threading.Lock()
+        self._connect()
+
+    def _connect(self):
+        """Return this thread's connection (sqlite3 connections can't be shared)"""
+        conn = getattr(self._local, 'conn', None)
+        if conn is not None and self._local.pid == os.getpid():
+            return conn
+        conn = sqlite3.connect(self.db_path, timeout=5.0, isolation_level=None)
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.execute("PRAGMA synchronous=NORMAL")
+        conn.execute(
+            "CREATE TABLE IF NOT EXISTS predictions ("
+            " key TEXT PRIMARY KEY,"
+            " value TEXT NOT NULL,"
+            " created REAL NOT NULL,"
+            " accessed REAL NOT NULL)"
+        )
+        conn.execute("CREATE INDEX IF NOT EXISTS predictions_accessed ON predictions (accessed)")
+        self._local.conn = conn
+        self._local.pid = os.getpid()
+        return conn
+
+    def get(self, key):
+        """Return (value, created) for a key, created as a time.time() timestamp, or None"""
+        conn = self._connect()
+        now = time.time()
+        row = conn.execute("SELECT value, created FROM predictions WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        value, created = row
+        if self.ttl_seconds and now - created > self.ttl_seconds:
+            conn.execute("DELETE FROM predictions WHERE key = ?", (key,))
+            return None
+        conn.execute("UPDATE predictions SET accessed = ? WHERE key = ?", (now, key))
+        return json.loads(value), created
+
+    def put(self, key, value):
+        conn = self._connect()
+        now = time.time()
+        conn.execute(
+            "INSERT OR REPLACE INTO predictions (key, value, created, accessed) VALUES (?, ?, ?, ?)",
+            (key, json.dumps(value), now, now)
+        )
+        # Trim periodically rather than on every write
+        with self._writes_lock:
+            self._writes += 1
+            trim = self._writes % 100 == 0
+        if trim:
+            self.evict()
+
+    def evict(self):
+        """Drop expired entries and the least recently used ones beyond max_entries"""
+        conn = self._connect()
+        if self.ttl_seconds:
+            conn.execute("DELETE FROM predictions WHERE created < ?", (time.time() - self.ttl_seconds,))
+        conn.execute(
+            "DELETE FROM predictions WHERE key IN ("
+            " SELECT key FROM predictions ORDER BY accessed DESC LIMIT -1 OFFSET ?)",
+            (self.max_entries,)
+        )
+
+    def __len__(self):
+        return self._connect().execute("SELECT COUNT(*) FROM predictions").fetchone()[0]
+
+
+class PredictionCache:
+    """Bounded in-memory LRU cache of prediction responses with TTL expiry
+
+    Lookups check process memory first, then the optional shared backend.
+    All methods are thread-safe.
+    """
+
+    def __init__(self, model_version, max_entries=1024, ttl_seconds=3600, backend=None):
+        self.model_version = model_version
+        self.max_entries = max_entries
+        self.ttl_seconds = ttl_seconds
+        self.backend = backend
+
+        self._entries = OrderedDict()  # key -> (created, value)
+        self._lock = threading.Lock()
+
+        # Statistics
+        self.hits = 0
+        self.backend_hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    @property
+    def enabled(self):
+        return self.max_entries > 0
+
+    def key_for(self, image_digest):
+        return make_cache_key(image_digest, self.model_version)
+
+    def get(self, image_digest):
+        """Return the cached response for an image digest, or None"""
+        if not self.enabled:
+            return None
+        key = self.key_for(image_digest)
+        now = time.monotonic()
+
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                created, value = entry
+                if self.ttl_seconds and now - created > self.ttl_seconds:
+                    del self._entries[key]
+                else:
+                    self._entries.move_to_end(key)
+                    self.hits += 1
+                    return value
+
+        row = self.backend.get(key) if self.backend is not None else None
+
+        with self._lock:
+            if row is None:
+                self.misses += 1
+                return None
+            value, created = row
+            self.hits += 1
+            self.backend_hits += 1
+            # Keep the entry's age, so the TTL runs from when it was first cached
+            self._store(key, value, now - max(0.0, time.time() - created))
+        return value
+
+    def put(self, image_digest, value):
+        """Cache a response for an image digest"""
+        if not self.enabled:
+            return
+        key = self.key_for(image_digest)
+        with self._lock:
+            self._store(key, value, time.monotonic())
+        if self.backend is not None:
+            self.backend.put(key, value)
+
+    def _store(self, key, value, created):
+        self._entries[key] = (created, value)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+            self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self):
+        """Return hit/miss counters"""
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                'enabled': self.enabled,
+                'model_version': self.model_version,
+                'entries': len(self._entries),
+                'max_entries': self.max_entries,
+                'ttl_seconds': self.ttl_seconds,
+                'hits': self.hits,
+                'backend_hits': self.backend_hits,
+                'misses': self.misses,
+                'evictions': self.evictions,
+                'hit_rate': self.hits / lookups if lookups else 0,
+                'shared_backend': self.backend.db_path if self.backend is not None else None
+            }
+
+
+def create_cache_from_env(model_version):
+    """Build a PredictionCache configured by the PREDICTION_CACHE_* environment variables
+
+    PREDICTION_CACHE_SIZE  in-memory entries per process (0 disables the cache)
+    PREDICTION_CACHE_TTL   seconds before an entry expires (0 = never)
+    PREDICTION_CACHE_DB    SQLite file shared by all workers on the host (optional)
+    PREDICTION_CACHE_DB_SIZE  entries kept in that file (default: PREDICTION_CACHE_SIZE)
+    """
+    max_entries = int(os.environ.get('PREDICTION_CACHE_SIZE', 1024))
+    ttl_seconds = float(os.environ.get('PREDICTION_CACHE_TTL', 3600))
+    db_path = os.environ.get('PREDICTION_CACHE_DB')
+    db_entries = int(os.environ.get('PREDICTION_CACHE_DB_SIZE', max_entries))
+
+    backend = None
+    if db_path and max_entries > 0:
+        backend = SQLiteCacheBackend(db_path, max_entries=db_entries, ttl_seconds=ttl_seconds)
+    return PredictionCache(model_version, max_entries=max_entries, ttl_seconds=ttl_seconds, backend=backend)
@@ -0,0 +1,325 @@
+#!/usr/bin/env python3
+"""
+Preprocessing for One Piece Character Classifier
+Turns a decoded BGR image into the normalized model input in one pass:
+face crop (a view), a single resize straight to the model resolution and
+normalization written directly into a caller-supplied tensor. Also holds
+the dataset used to decode image files for batched inference.
+"""
+
+import io
+import time
+import queue
+import hashlib
+from contextlib import contextmanager
+
+import cv2
+import numpy as np
+import torch
+from torch.utils.data import Dataset
+
+from image_io import decode_image, decode_image_array, DECODE_MIN_SIDE
+from archive_io import MEMBER_SEPARATOR, is_streamed_archive, read_source, source_stat, split_member_path
+from perceptual_hash import dhash, MultiIndexHashIndex
+from face_detector import FaceDetector, detector_options_from_env
+
+
+class FusedPreprocessor:
+    """Face crop -> letterbox -> resize -> normalize without intermediate images
+
+    Equivalent to running FaceDetector.crop_face() (or detect_face()), converting
+    back to an RGB PIL image and applying the model transform, but the crop is
+    never copied, the letterbox canvas is never materialized and the two
+    resizes of that chain collapse into one. Results match the transform
+    chain to within resampling differences.
+
+    letterbox_size   (width, height) canvas the crop is fitted into before the
+                     model resize, as crop_face() does; None stretches the crop
+                     to the model resolution like the plain transform
+    crop_without_face  when no face is found, still use the detector's center
+                       crop (crop_face behaviour) instead of the full image
+    """
+
+    def __init__(self, transform_spec, face_detector=None, letterbox_size=(300, 400),
+                 crop_without_face=True):
+        self.height, self.width = (int(v) for v in transform_spec['resize'])
+        self.face_detector = face_detector
+        self.letterbox_size = tuple(letterbox_size) if letterbox_size else None
+        self.crop_without_face = crop_without_face
+
+        # (pixel / 255 - mean) / std == pixel * scale + bias
+        mean = np.asarray(transform_spec['mean'], dtype=np.float32)
+        std = np.asarray(transform_spec['std'], dtype=np.float32)
+        self.scale = (1.0 / (255.0 * std)).astype(np.float32)
+        self.bias = (-mean / std).astype(np.float32)
+
+    @property
+    def shape(self):
+        """Shape of one preprocessed image tensor"""
+        return (3, self.height, self.width)
+
+    def new_tensor(self):
+        return torch.empty(self.shape, dtype=torch.float32)
+
+    def crop(self, image):
+        """Return (face_detected, region) where region is a view into image"""
+        if self.face_detector is None:
+            return False, image
+        try:
+            face_detected, cropped = self.face_detector.detect_face(image)
+        except Exception as e:
+            print(f"Face detection error: {e}, using original image")
+            return False, image
+        if cropped is None or cropped.size == 0:
+            return False, image
+        if face_detected or self.crop_without_face:
+            return face_detected, cropped
+        return False, image
+
+    def _placement(self, h, w):
+        """Size and offset of the image inside the output, after letterboxing"""
+        if self.letterbox_size is None:
+            return self.width, self.height, 0, 0
+
+        # Same integer geometry as crop_face(), then scaled to the model size
+        target_w, target_h = self.letterbox_size
+        scale = min(target_w / w, target_h / h)
+        new_w, new_h = int(w * scale), int(h * scale)
+        x_offset = (target_w - new_w) // 2
+        y_offset = (target_h - new_h) // 2
+
+        sx, sy = self.width / target_w, self.height / target_h
+        left, top = round(x_offset * sx), round(y_offset * sy)
+        right = min(self.width, round((x_offset + new_w) * sx))
+        bottom = min(self.height, round((y_offset + new_h) * sy))
+        return max(1, right - left), max(1, bottom - top), left, top
+
+    def __call__(self, image, out=None):
+        """Preprocess a BGR uint8 image, returns (tensor, face_detected)
+
+        The (3, H, W) float32 result is written into out when given, e.g. a
+        pooled buffer or one row of a batch tensor.
+        """
+        face_detected, region = self.crop(image)
+        return self.render(region, out), face_detected
+
+    def render(self, region, out=None):
+        """Letterbox, resize and normalize an already cropped BGR region into out"""
+        if out is None:
+            out = self.new_tensor()
+        h, w = region.shape[:2]
+        new_w, new_h, left, top = self._placement(h, w)
+        # Area averaging when shrinking matches the antialiased PIL resize
+        interpolation = cv2.INTER_AREA if new_w < w and new_h < h else cv2.INTER_LINEAR
+        resized = cv2.resize(region, (new_w, new_h), interpolation=interpolation)
+
+        planes = out.numpy()
+        if (new_w, new_h) != (self.width, self.height):
+            # Letterbox padding is black, i.e. the normalized value of 0
+            planes[:] = self.bias[:, None, None]
+        window = planes[:, top:top + new_h, left:left + new_w]
+        for channel in range(3):
+            # Output is RGB, the image is BGR
+            np.multiply(resized[:, :, 2 - channel], self.scale[channel],
+                        out=window[channel], casting='unsafe')
+            window[channel] += self.bias[channel]
+        return out
+
+
+class TensorPool:
+    """Reusable preprocessed-image buffers, so requests don't allocate a fresh input each time"""
+
+    def __init__(self, shape, size=8):
+        self.shape = tuple(shape)
+        self._free = queue.LifoQueue(maxsize=size)
+
+    @contextmanager
+    def acquire(self):
+        """Borrow a buffer; it is returned to the pool (or dropped if full) afterwards"""
+        try:
+            tensor = self._free.get_nowait()
+        except queue.Empty:
+            tensor = torch.empty(self.shape, dtype=torch.float32)
+        try:
+            yield tensor
+        finally:
+            try:
+                self._free.put_nowait(tensor)
+            except queue.Full:
+                pass
+
+
+class PathBatches:
+    """DataLoader batch_sampler handing ImageFileDataset lists of (position, path)
+
+    paths is any iterable of file paths, e.g. a list or a lazy
+    file_discovery.ImageFileScanner. It is iterated once, in the main process,
+    as the loader asks for more batches, and each worker only gets the paths of
+    the batches it is given, so the tree is listed once per run whatever the
+    number of workers and a file added or removed meanwhile can't make
+    workers disagree on positions.
+
+    Members of compressed tars are read here, by the same front-to-back pass
+    that lists them (see archive_io), and their items carry the (size,
+    mtime_ns) and bytes as (position, path, stat, data): workers reading them
+    out of their own copies would each decompress the archive again.
+    """
+
+    def __init__(self, paths, batch_size=1):
+        self.paths = paths
+        self.batch_size = max(1, batch_size)
+
+    def __iter__(self):
+        batch = []
+        for position, path in enumerate(self.paths):
+            batch.append(self._item(position, path))
+            if len(batch) == self.batch_size:
+                yield batch
+                batch = []
+        if batch:
+            yield batch
+
+    @staticmethod
+    def _item(position, path):
+        split = split_member_path(path) if MEMBER_SEPARATOR in str(path) else None
+        if split is None or not is_streamed_archive(split[0]):
+            return position, path
+        try:
+            return position, path, source_stat(path), read_source(path)
+        except Exception:
+            # The worker reports the error
+            return position, path
+
+
+class ImageFileDataset(Dataset):
+    """Image files decoded and transformed for batched inference
+
+    Indexed by the (position, path[, stat, data]) items of PathBatches. Paths
+    may be '<archive>!<member>' paths, whose bytes are read straight out of the
+    archive; each DataLoader worker keeps its own archive handles, so files and
+    zip members are read in parallel.
+
+    Items are (position, path, tensor, error, info); a file that can't be
+    decoded yields a None tensor and the error message instead of failing the
+    whole batch. info holds the file's sha256 (free from the bytes already
+    read), its 'file_size' and 'file_mtime_ns' as stat'ed just before that
+    read, and the per-stage 'timings' in seconds. When lookup(path, stat, data)
+    returns a stored result the file is not decoded at all and info['result']
+    carries it.
+
+    With dedup_distance, info also holds the image's perceptual 'dhash' (hex).
+    Each worker remembers the hashes it has decoded, and an image within
+    dedup_distance bits of one of them is not preprocessed (nor face
+    detected): info['near_duplicate'] is set and the caller reuses the earlier
+    image's result, which comes in the same or an earlier batch.
+
+    With face_crop, a dict of FusedPreprocessor options, images are cropped to
+    the face like the web server does instead of going through transform, and
+    info records 'face_detected'. Each worker process builds its own
+    FaceDetector (configured by the FACE_DETECTION_* variables) on first use,
+    so detection runs in the workers, ahead of and overlapping the forward pass.
+    """
+
+    def __init__(self, transform, min_side=DECODE_MIN_SIDE, face_crop=None, transform_spec=None,
+                 lookup=None, dedup_distance=None):
+        self.transform = transform
+        self.min_side = min_side
+        self.face_crop = face_crop
+        self.transform_spec = transform_spec
+        self.lookup = lookup
+        self.dedup_distance = dedup_distance
+        self._preprocessor = None
+        self._seen_hashes = None
+
+    def __getstate__(self):
+        # Detectors hold OpenCV objects that can't be pickled, workers build their own
+        state = self.__dict__.copy()
+        state['_preprocessor'] = None
+        state['_seen_hashes'] = None
+        return state
+
+    def __getitem__(self, item):
+        return self.load(*item)
+
+    def _face_preprocessor(self):
+        if self._preprocessor is None:
+            detector = FaceDetector(**detector_options_from_env())
+            self._preprocessor = FusedPreprocessor(self.transform_spec, detector, **self.face_crop)
+        return self._preprocessor
+
+    def _near_duplicate(self, image, info):
+        """Hash image into info, True if this worker already decoded a near-duplicate"""
+        start = time.perf_counter()
+        image_hash = dhash(image)
+        info['dhash'] = f"{image_hash:016x}"
+        if self._seen_hashes is None:
+            self._seen_hashes = MultiIndexHashIndex(self.dedup_distance)
+        duplicate = self._seen_hashes.find(image_hash) is not None
+        if not duplicate:
+            self._seen_hashes.add(image_hash, True)
+        else:
+            info['near_duplicate'] = True
+        info['timings']['perceptual_hash'] = time.perf_counter() - start
+        return duplicate
+
+    def load(self, position, path, stat=None, data=None):
+        """Decode one file; stat and data are its (size, mtime_ns) and bytes when already read"""
+        info = {'timings': {}}
+        timings = info['timings']
+        try:
+            if self.lookup is not None:
+                start = time.perf_counter()
+                result = self.lookup(path, stat, data)
+                timings['lookup'] = time.perf_counter() - start
+                if result is not None:
+                    info['result'] = result
+                    return position, path, None, None, info
+
+            start = time.perf_counter()
+            # A file rewritten after this stat looks modified on the next lookup, never unchanged
+            info['file_size'], info['file_mtime_ns'] = stat if stat is not None else source_stat(path)
+            if data is None:
+                data = read_source(path)
+            info['sha256'] = hashlib.sha256(data).hexdigest()
+
+            if not self.face_crop:
+                image = decode_image(io.BytesIO(data), min_side=self.min_side)
+                timings['decode'] = time.perf_counter() - start
+                if self.dedup_distance is not None and self._near_duplicate(image, info):
+                    return position, path, None, None, info
+                start = time.perf_counter()
+                tensor = self.transform(image)
+                timings['preprocess'] = time.perf_counter() - start
+                return position, path, tensor, None, info
+
+            preprocessor = self._face_preprocessor()
+            image = decode_image_array(io.BytesIO(data), min_side=self.min_side)
+            timings['decode'] = time.perf_counter() - start
+            if self.dedup_distance is not None and self._near_duplicate(image, info):
+                return position, path, None, None, info
+            start = time.perf_counter()
+            info['face_detected'], region = preprocessor.crop(image)
+            timings['face_detection'] = time.perf_counter() - start
+            start = time.perf_counter()
+            tensor = preprocessor.render(region)
+            timings['preprocess'] = time.perf_counter() - start
+            return position, path, tensor, None, info
+        except Exception as e:
+            return position, path, None, str(e), info
+
+
+def collate_images(samples):
+    """Collate ImageFileDataset items into (batch tensor or None, items)
+
+    items keeps every sample's (position, path, error, info) in order, the
+    rows of the batch tensor being those with a tensor, i.e. without an error,
+    a stored result or a near_duplicate flag.
+    """
+    tensors = [tensor for _, _, tensor, _, _ in samples if tensor is not None]
+    items = [(position, path, error, info) for position, path, _, error, info in samples]
+    return torch.stack(tensors) if tensors else None, items
+
+
+def limit_worker_threads(worker_id):
+    """DataLoader worker_init_fn: one intra-op thread per decode worker, so workers don't oversubscribe the cores"""
+    torch.set_num_threads(1)
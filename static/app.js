@@ -205,17 +205,16 @@ function handleFile(file) {
     return;
   }
 
-  const reader = new FileReader();
-  reader.onload = function (e) {
-    preview.src = e.target.result;
-    previewContainer.style.display = "block";
-    resultContainer.style.display = "none";
+  // Preview straight from the file, no base64 round trip
+  if (preview.src.startsWith("blob:")) {
+    URL.revokeObjectURL(preview.src);
+  }
+  preview.src = URL.createObjectURL(file);
+  previewContainer.style.display = "block";
+  resultContainer.style.display = "none";
 
-    // Auto-predict when file is loaded
-    const imageData = e.target.result.split(",")[1]; // Remove data URL prefix
-    predictCharacter(imageData);
-  };
-  reader.readAsDataURL(file);
+  // Auto-predict when file is loaded
+  predictCharacter(file);
 }
 
 // Drag and drop functionality
@@ -260,16 +259,17 @@ function hideLoading() {
 }
 
 // Predict character
-async function predictCharacter(imageData) {
+async function predictCharacter(file) {
   try {
     showLoading();
 
+    // Upload the raw image bytes instead of base64 inside JSON
     const response = await fetch("/predict", {
       method: "POST",
       headers: {
-        "Content-Type": "application/json",
+        "Content-Type": file.type,
       },
-      body: JSON.stringify({ image: imageData }),
+      body: file,
     });
 
     const result = await response.json();
@@ -152,7 +152,7 @@ const characterData = {
 };
 
 // Global variables
-let currentImageData = null;
+let currentImageFile = null;
 let currentResult = null;
 
 // Initialize mobile app
@@ -222,37 +222,29 @@ function handleFileSelect(event) {
 
 // Handle file processing
 function handleFile(file) {
-  const reader = new FileReader();
+  currentImageFile = file;
 
-  reader.onload = (e) => {
-    const imageData = e.target.result;
-    currentImageData = imageData;
-
-    // Show preview
-    const preview = document.getElementById("preview");
-    preview.src = imageData;
-
-    // Show preview section
-    document.getElementById("preview-section").style.display = "block";
-    document.getElementById("result-section").style.display = "none";
-
-    // Scroll to preview
-    document.getElementById("preview-section").scrollIntoView({
-      behavior: "smooth",
-      block: "center",
-    });
-  };
+  // Show preview straight from the file, no base64 round trip
+  const preview = document.getElementById("preview");
+  if (preview.src.startsWith("blob:")) {
+    URL.revokeObjectURL(preview.src);
+  }
+  preview.src = URL.createObjectURL(file);
 
-  reader.onerror = () => {
-    showNotification("Error reading the file.", "error");
-  };
+  // Show preview section
+  document.getElementById("preview-section").style.display = "block";
+  document.getElementById("result-section").style.display = "none";
 
-  reader.readAsDataURL(file);
+  // Scroll to preview
+  document.getElementById("preview-section").scrollIntoView({
+    behavior: "smooth",
+    block: "center",
+  });
 }
 
 // Analyze image
 function analyzeImage() {
-  if (!currentImageData) {
+  if (!currentImageFile) {
     showNotification("No image to analyze.", "error");
     return;
   }
@@ -261,11 +253,11 @@ function analyzeImage() {
   const loadingOverlay = document.getElementById("loading-overlay");
   loadingOverlay.style.display = "flex";
 
-  // Send to server
+  // Send the raw image bytes to the server
   fetch("http://127.0.0.1:5000/predict", {
     method: "POST",
-    headers: { "Content-Type": "application/json" },
-    body: JSON.stringify({ image: currentImageData }),
+    headers: { "Content-Type": currentImageFile.type },
+    body: currentImageFile,
   })
     .then((res) => res.json())
     .then((data) => {
@@ -399,7 +391,7 @@ function createProbabilityChart(probabilities) {
 function closePreview() {
   document.getElementById("preview-section").style.display = "none";
   document.getElementById("result-section").style.display = "none";
-  currentImageData = null;
+  currentImageFile = null;
   currentResult = null;
 }
 
@@ -70,12 +70,12 @@ def test_model_loading():
     print("\n🤖 Testing model loading...")
     
     try:
-        from model import model, dataset, transform, device
+        from inference import model, class_names, transform, device
         
         print(f"✅ Model loaded successfully")
         print(f"✅ Device: {device}")
-        print(f"✅ Number of classes: {len(dataset.data.classes)}")
-        print(f"✅ Classes: {dataset.data.classes}")
+        print(f"✅ Number of classes: {len(class_names)}")
+        print(f"✅ Classes: {class_names}")
         
         return True
     except Exception as e:
@@ -0,0 +1,38 @@
+import os
+import sys
+
+import pytest
+
+# Modules live at the repository root
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+
+
+@pytest.fixture(scope='session')
+def model_checkpoint(tmp_path_factory):
+    """A tiny random-weight checkpoint and bundle, served instead of any trained model
+
+    inference (and app, server and batch_processor through it) loads the model
+    at import, so tests import those modules only after requesting this.
+    """
+    import torch
+    from model import FastOnePieceClassifier, save_model_bundle, data_dir
+
+    if os.path.isdir(data_dir):
+        class_names = sorted(entry.name for entry in os.scandir(data_dir) if entry.is_dir())
+    else:
+        class_names = ['Luffy', 'Nami', 'Zoro']
+    torch.manual_seed(0)
+    model = FastOnePieceClassifier(num_classes=len(class_names), backbone_name='mobilenetv2_035',
+                                   pretrained=False)
+    path = str(tmp_path_factory.mktemp('model') / 'One_Piece_Model.pth')
+    torch.save(model.state_dict(), path)
+    save_model_bundle(model, class_names, path)
+    # Left set for the session: modules imported from here on keep this model
+    os.environ['MODEL_PATH'] = path
+    return path
+
+
+@pytest.fixture(scope='session')
+def inference(model_checkpoint):
+    import inference
+    return inference
@@ -0,0 +1,138 @@
+import io
+import os
+import tarfile
+import zipfile
+
+import pytest
+import torchvision.transforms as transforms
+from PIL import Image
+from torch.utils.data import DataLoader
+
+import archive_io
+from archive_io import read_source, source_stat, split_member_path
+from file_discovery import ImageFileScanner
+from job_manifest import JobManifest
+from preprocessing import ImageFileDataset, PathBatches, collate_images
+
+MEMBERS = ['a.png', 'sub/b.png', 'sub/c.png', 'notes.txt']
+
+
+def image_bytes(i):
+    buffer = io.BytesIO()
+    Image.new('RGB', (16, 12), (i * 40, 0, 0)).save(buffer, format='PNG')
+    return buffer.getvalue()
+
+
+def contents(member):
+    return b'text' if member.endswith('.txt') else image_bytes(MEMBERS.index(member))
+
+
+def write_archive(path):
+    if path.suffix == '.zip':
+        with zipfile.ZipFile(path, 'w') as archive:
+            for member in MEMBERS:
+                archive.writestr(member, contents(member))
+    else:
+        with tarfile.open(path, 'w:gz' if path.suffix == '.gz' else 'w') as archive:
+            for member in MEMBERS:
+                data = contents(member)
+                info = tarfile.TarInfo(member)
+                info.size = len(data)
+                archive.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+@pytest.fixture
+def count_tar_passes(monkeypatch):
+    passes = []
+    tar_open = tarfile.open
+
+    def counting_open(name, mode='r', *args, **kwargs):
+        if mode.startswith('r'):
+            passes.append(name)
+        return tar_open(name, mode, *args, **kwargs)
+
+    monkeypatch.setattr(archive_io.tarfile, 'open', counting_open)
+    return passes
+
+
+@pytest.mark.parametrize('name', ['images.zip', 'images.tar', 'images.tar.gz'])
+def test_members_are_discovered_and_read(tmp_path, name):
+    archive = write_archive(tmp_path / name)
+    paths = list(ImageFileScanner(archive))
+    assert paths == [archive_io.member_path(archive, member) for member in MEMBERS[:3]]
+    # Read back out of order, as a caller holding a path list may
+    for member in reversed(MEMBERS):
+        path = archive_io.member_path(archive, member)
+        assert split_member_path(path) == (archive, member)
+        assert read_source(path) == contents(member)
+        assert source_stat(path) == (len(contents(member)), os.stat(archive).st_mtime_ns)
+
+
+def test_missing_members_are_file_not_found(tmp_path):
+    archive = write_archive(tmp_path / 'images.tar.gz')
+    with pytest.raises(FileNotFoundError):
+        source_stat(archive_io.member_path(archive, 'missing.png'))
+
+
+def test_plain_paths_with_the_separator_are_not_members(tmp_path):
+    path = tmp_path / 'wow!.png'
+    path.write_bytes(b'')
+    assert split_member_path(str(path)) is None
+    assert split_member_path(str(tmp_path / 'missing.zip') + '!a.png') is None
+
+
+def test_archives_found_while_walking(tmp_path):
+    write_archive(tmp_path / 'images.zip')
+    assert list(ImageFileScanner(str(tmp_path))) == []
+    assert len(list(ImageFileScanner(str(tmp_path), archives=True))) == 3
+
+
+def test_compressed_tars_are_read_in_one_pass(tmp_path, count_tar_passes):
+    archive = write_archive(tmp_path / 'images.tar.gz')
+    batches = list(PathBatches(ImageFileScanner(archive), 2))
+    assert len(count_tar_passes) == 1
+    items = [item for batch in batches for item in batch]
+    assert [len(item) for item in items] == [4, 4, 4]
+    assert [item[3] for item in items] == [contents(member) for member in MEMBERS[:3]]
+
+
+def test_workers_decode_compressed_members(tmp_path):
+    archive = write_archive(tmp_path / 'images.tar.gz')
+    dataset = ImageFileDataset(transforms.ToTensor())
+    loader = DataLoader(dataset, batch_sampler=PathBatches(ImageFileScanner(archive), 2), num_workers=2,
+                        collate_fn=collate_images)
+    items = [item for _, batch_items in loader for item in batch_items]
+    assert [error for _, _, error, _ in items] == [None] * 3
+    assert [info['file_size'] for _, _, _, info in items] == [len(contents(m)) for m in MEMBERS[:3]]
+
+
+def test_oversized_members_are_refused(tmp_path, monkeypatch):
+    monkeypatch.setattr(archive_io, 'MAX_MEMBER_BYTES', 10)
+    for name in ['images.zip', 'images.tar', 'images.tar.gz']:
+        archive = write_archive(tmp_path / name)
+        with pytest.raises(ValueError):
+            read_source(archive_io.member_path(archive, 'a.png'))
+
+
+def test_resume_reuses_compressed_members_without_reading_them_again(tmp_path, count_tar_passes):
+    archive = write_archive(tmp_path / 'images.tar.gz')
+    manifest = JobManifest(tmp_path / 'manifest.sqlite', 'v1')
+    dataset = ImageFileDataset(transforms.ToTensor(), lookup=manifest.lookup)
+    results = []
+    for batch in PathBatches(ImageFileScanner(archive), 2):
+        for item in batch:
+            _, path, _, error, info = dataset[item]
+            assert error is None
+            info.pop('timings')
+            results.append(dict(info, image_path=path, success=True))
+    manifest.record(results)
+
+    # Touched: the lookups compare the hash of the bytes read by the listing pass
+    stat = os.stat(archive)
+    os.utime(archive, ns=(stat.st_atime_ns, stat.st_mtime_ns + 10 ** 10))
+    del count_tar_passes[:]
+    for batch in PathBatches(ImageFileScanner(archive), 2):
+        for item in batch:
+            assert 'result' in dataset[item][4]
+    assert len(count_tar_passes) == 1
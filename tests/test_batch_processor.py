@@ -0,0 +1,126 @@
+import numpy as np
+import pytest
+from PIL import Image
+
+
+@pytest.fixture(scope='module')
+def batch_processor(model_checkpoint):
+    import batch_processor
+    return batch_processor
+
+
+@pytest.fixture(scope='module')
+def processor(batch_processor):
+    return batch_processor.BatchProcessor()
+
+
+def write_images(directory, count):
+    rng = np.random.default_rng(0)
+    paths = []
+    for i in range(count):
+        # Mixed sizes, so decode workers finish out of order
+        size = (64 + 48 * (i % 4), 48 + 32 * (i % 3))
+        path = directory / f'{i:02d}.png'
+        Image.fromarray(rng.integers(0, 256, (size[1], size[0], 3), dtype=np.uint8)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def assert_same_prediction(result, expected):
+    assert result['success'] and result['image_path'] == expected['image_path']
+    assert result['predicted_class'] == expected['predicted_class']
+    np.testing.assert_allclose(result['probabilities'], expected['probabilities'], atol=1e-4)
+
+
+def test_results_keep_input_order_with_workers(processor, tmp_path):
+    paths = write_images(tmp_path, 10)
+    expected = [processor.process_image(path) for path in paths]
+    batches = list(processor.iter_result_batches(paths, batch_size=3, workers=2))
+    assert [len(batch) for batch in batches] == [3, 3, 3, 1]
+    results = [result for batch in batches for result in batch]
+    for result, single in zip(results, expected):
+        assert_same_prediction(result, single)
+
+
+def test_decode_errors_only_fail_their_own_file(processor, tmp_path):
+    paths = write_images(tmp_path, 3)
+    broken = tmp_path / 'broken.png'
+    broken.write_bytes(b'not an image')
+    missing = str(tmp_path / 'missing.png')
+    files = [paths[0], str(broken), paths[1], missing, paths[2]]
+
+    results = processor.process_files(files, batch_size=5)
+    assert [result['image_path'] for result in results] == files
+    assert [result['success'] for result in results] == [True, False, True, False, True]
+    assert results[1]['error'] and results[3]['error']
+    for result, path in zip(results[::2], paths):
+        assert_same_prediction(result, processor.process_image(path))
+
+
+def test_failed_forward_pass_fails_only_its_batch(batch_processor, processor, tmp_path, monkeypatch):
+    paths = write_images(tmp_path, 6)
+    predict = batch_processor.predict
+    calls = []
+
+    def flaky_predict(*args):
+        calls.append(len(args[1]))
+        if len(calls) == 2:
+            raise RuntimeError("CUDA out of memory")
+        return predict(*args)
+
+    monkeypatch.setattr(batch_processor, 'predict', flaky_predict)
+    results = processor.process_files(paths, batch_size=2)
+    assert calls == [2, 2, 2]
+    assert [result['success'] for result in results] == [True, True, False, False, True, True]
+    assert results[2]['error'] == results[3]['error'] == "CUDA out of memory"
+    assert [result['image_path'] for result in results] == paths
+
+
+def report_results(count):
+    results = []
+    for i in range(count):
+        if i % 4 == 3:
+            results.append({'image_path': f'<img {i}>.png', 'success': False, 'error': 'cannot identify image'})
+        else:
+            results.append({'image_path': f'{i:02d}.png', 'success': True, 'predicted_class': 'Luffy',
+                            'confidence': 0.5 + i / 100})
+    return results
+
+
+def test_html_report_is_paginated(processor, tmp_path):
+    results = report_results(5)
+    processor.generate_report(results, tmp_path, rows_per_page=2)
+    index, = tmp_path.glob('report_*.html')
+    pages = sorted((tmp_path / f'{index.stem}_pages').iterdir())
+    assert [page.name for page in pages] == ['page-00001.html', 'page-00002.html', 'page-00003.html']
+
+    # The index holds the summary and links, the pages hold the rows
+    text = index.read_text()
+    assert '00.png' not in text
+    assert f'{index.stem}_pages/page-00003.html">Page 3 (images 5-5)' in text
+    rows = [page.read_text().count('.png</td>') for page in pages]
+    assert rows == [2, 2, 1]
+    assert '&lt;img 3&gt;.png' in pages[1].read_text()
+    assert 'href="page-00002.html">Next' in pages[0].read_text()
+    assert 'href="page-00002.html">Previous' in pages[2].read_text()
+
+
+def test_small_html_reports_stay_on_one_page(processor, tmp_path):
+    processor.generate_report(report_results(3), tmp_path, rows_per_page=5)
+    index, = tmp_path.glob('report_*.html')
+    assert index.read_text().count('.png</td>') == 3
+    assert not (tmp_path / f'{index.stem}_pages').exists()
+
+
+@pytest.mark.parametrize('summary_only', [False, True])
+def test_text_summary_only(processor, tmp_path, summary_only):
+    processor.generate_report(report_results(5), tmp_path, text_summary_only=summary_only)
+    report, = tmp_path.glob('report_*.txt')
+    text = report.read_text()
+    assert 'Total images: 5' in text and 'Failed predictions: 1' in text
+    assert 'Luffy: 4 (100.0%)' in text
+    assert ('DETAILED RESULTS' in text) != summary_only
+    assert ('00.png' in text) != summary_only
+    # The CSV keeps every row either way
+    csv, = tmp_path.glob('detailed_results_*.csv')
+    assert len(csv.read_text().splitlines()) == 6
@@ -0,0 +1,56 @@
+import json
+
+from batch_results import JsonlResultsWriter, SummaryStats, read_results
+
+
+def result(path, character='Luffy', confidence=0.9):
+    return {'image_path': path, 'predicted_class': character, 'confidence': confidence,
+            'probabilities': [[confidence]], 'success': True}
+
+
+def test_append_and_read_back(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    with JsonlResultsWriter(path) as writer:
+        writer.write_batch([result('a.jpg'), result('b.jpg')])
+    with JsonlResultsWriter(path, append=True) as writer:
+        writer.write_batch([result('c.jpg')])
+        assert writer.stats.total == 1
+    assert [r['image_path'] for r in read_results(path)] == ['a.jpg', 'b.jpg', 'c.jpg']
+
+
+def test_replace_when_not_appending(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    with JsonlResultsWriter(path) as writer:
+        writer.write_batch([result('a.jpg')])
+    with JsonlResultsWriter(path, append=False) as writer:
+        writer.write_batch([result('b.jpg')])
+    assert [r['image_path'] for r in read_results(path)] == ['b.jpg']
+
+
+def test_append_after_a_killed_run_drops_only_the_partial_line(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    complete = json.dumps(result('a.jpg')) + '\n'
+    path.write_text(complete + json.dumps(result('b.jpg'))[:25], encoding='utf-8')
+
+    with JsonlResultsWriter(path, append=True) as writer:
+        writer.write_batch([result('c.jpg')])
+
+    assert [r['image_path'] for r in read_results(path)] == ['a.jpg', 'c.jpg']
+
+
+def test_read_results_skips_a_partial_last_line(tmp_path):
+    path = tmp_path / 'results.jsonl'
+    path.write_text(json.dumps(result('a.jpg')) + '\n{"image_path": "b', encoding='utf-8')
+    assert [r['image_path'] for r in read_results(path)] == ['a.jpg']
+
+
+def test_summary_stats():
+    stats = SummaryStats()
+    stats.update([result('a.jpg', 'Luffy', 0.5), result('b.jpg', 'Zoro', 0.9),
+                  {'image_path': 'c.jpg', 'error': 'bad', 'success': False}])
+    summary = stats.to_summary('now')
+    assert summary['total_images'] == 3
+    assert summary['failed_predictions'] == 1
+    assert summary['character_distribution'] == {'Luffy': 1, 'Zoro': 1}
+    assert summary['min_confidence'] == 0.5 and summary['max_confidence'] == 0.9
+    assert abs(summary['average_confidence'] - 0.7) < 1e-9
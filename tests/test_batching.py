@@ -0,0 +1,85 @@
+import threading
+import time
+from concurrent.futures import CancelledError, ThreadPoolExecutor
+
+import pytest
+import torch
+
+from batching import MicroBatcher
+
+
+class RecordingModel(torch.nn.Module):
+    """Logits that identify each input row, with a hook to hold or fail forward passes"""
+
+    def __init__(self):
+        super().__init__()
+        self.batch_sizes = []
+        self.gate = None
+        self.error = None
+
+    def forward(self, x):
+        self.batch_sizes.append(x.shape[0])
+        if self.gate is not None:
+            self.gate.wait(timeout=5)
+        if self.error is not None:
+            raise self.error
+        return x.flatten(1)[:, :4]
+
+
+def image(label):
+    """A (1, 3, 2, 2) input whose probabilities peak at class label"""
+    tensor = torch.zeros(1, 3, 2, 2)
+    tensor.view(1, -1)[0, label] = 10.0
+    return tensor
+
+
+def test_rows_fan_out_to_their_callers():
+    model = RecordingModel()
+    batcher = MicroBatcher(model, 'cpu', max_batch_size=8, max_wait_ms=200)
+    labels = [0, 1, 2, 3, 2, 1]
+    with ThreadPoolExecutor(len(labels)) as pool:
+        results = list(pool.map(lambda label: batcher.predict(image(label), timeout=5), labels))
+
+    for label, probabilities in zip(labels, results):
+        assert probabilities.shape == (1, 4)
+        assert probabilities.argmax().item() == label
+    assert sum(model.batch_sizes) == len(labels)
+    assert batcher.batches_run < len(labels)
+    assert batcher.images_run == len(labels)
+
+
+def test_forward_errors_reach_every_caller_in_the_batch():
+    model = RecordingModel()
+    model.error = RuntimeError("CUDA out of memory")
+    batcher = MicroBatcher(model, 'cpu', max_batch_size=4, max_wait_ms=200)
+    futures = [batcher.submit(image(i)) for i in range(3)]
+    for future in futures:
+        with pytest.raises(RuntimeError, match="CUDA out of memory"):
+            future.result(timeout=5)
+    assert batcher.batches_run == 0
+
+    # The batching thread keeps serving later requests
+    model.error = None
+    assert batcher.predict(image(2), timeout=5).argmax().item() == 2
+
+
+def test_cancelled_requests_are_skipped():
+    model = RecordingModel()
+    model.gate = threading.Event()
+    batcher = MicroBatcher(model, 'cpu', max_batch_size=1, max_wait_ms=0)
+    running = batcher.submit(image(0))
+    while not model.batch_sizes:
+        time.sleep(0.01)
+
+    # Queued behind the held forward pass, then abandoned by its caller
+    abandoned = batcher.submit(image(1))
+    assert abandoned.cancel()
+    waiting = batcher.submit(image(2))
+    model.gate.set()
+
+    assert running.result(timeout=5).argmax().item() == 0
+    assert waiting.result(timeout=5).argmax().item() == 2
+    with pytest.raises(CancelledError):
+        abandoned.result()
+    assert model.batch_sizes == [1, 1]
+    assert batcher.images_run == 2
@@ -0,0 +1,106 @@
+import glob
+import os
+
+import cv2
+import numpy as np
+import pytest
+
+from face_detector import merge_detections
+
+
+def reference_merge(boxes, scores=None, pass_ids=None, overlap_threshold=0.5):
+    """The pairwise-matrix suppression merge_detections must agree with"""
+    boxes = np.asarray(boxes, dtype=np.float64).reshape(-1, 4)
+    n = len(boxes)
+    x1, y1 = boxes[:, 0], boxes[:, 1]
+    x2, y2 = x1 + boxes[:, 2], y1 + boxes[:, 3]
+    areas = boxes[:, 2] * boxes[:, 3]
+    overlap_x = np.clip(np.minimum(x2[:, None], x2[None, :]) - np.maximum(x1[:, None], x1[None, :]), 0, None)
+    overlap_y = np.clip(np.minimum(y2[:, None], y2[None, :]) - np.maximum(y1[:, None], y1[None, :]), 0, None)
+    overlaps = overlap_x * overlap_y > overlap_threshold * np.minimum(areas[:, None], areas[None, :])
+    if scores is None:
+        if pass_ids is None:
+            scores = overlaps.sum(axis=1)
+        else:
+            pass_ids = np.asarray(pass_ids)
+            scores = np.array([len(set(pass_ids[overlaps[i]])) for i in range(n)])
+    scores = np.asarray(scores, dtype=np.float64)
+    alive = np.ones(n, dtype=bool)
+    keep = []
+    for i in np.lexsort((-areas, -scores)):
+        if alive[i]:
+            keep.append(i)
+            alive &= ~overlaps[i]
+    return [tuple(int(v) for v in boxes[i]) for i in keep], scores[keep].tolist()
+
+
+def random_boxes(rng, n):
+    xy = rng.integers(0, 400, size=(n, 2))
+    wh = rng.integers(10, 120, size=(n, 2))
+    return np.hstack([xy, wh])
+
+
+def test_empty():
+    assert merge_detections([]) == ([], [])
+
+
+def test_duplicates_collapse_to_best_supported_box():
+    boxes = [(100, 100, 50, 50), (102, 101, 50, 50), (98, 99, 52, 52), (300, 300, 40, 40)]
+    kept, scores = merge_detections(boxes, pass_ids=[0, 1, 2, 0])
+    assert len(kept) == 2
+    assert kept[0] == (98, 99, 52, 52)  # three passes agree, larger box wins the tie
+    assert scores == [3.0, 1.0]
+
+
+@pytest.mark.parametrize('seed', range(20))
+def test_matches_pairwise_reference(seed):
+    rng = np.random.default_rng(seed)
+    boxes = random_boxes(rng, int(rng.integers(1, 200)))
+    pass_ids = rng.integers(0, 6, size=len(boxes))
+    assert merge_detections(boxes) == reference_merge(boxes)
+    assert merge_detections(boxes, pass_ids=pass_ids) == reference_merge(boxes, pass_ids=pass_ids)
+    scores = rng.random(len(boxes))
+    assert merge_detections(boxes, scores=scores) == reference_merge(boxes, scores=scores)
+
+
+def test_budget_applies_to_the_first_pass():
+    from face_detector import FaceDetector
+    detector = FaceDetector()
+    detector.face_net = None
+    image = np.random.default_rng(0).integers(0, 256, size=(1200, 1600, 3), dtype=np.uint8)
+
+    faces, report = detector.detect_faces_budgeted(image, budget_ms=1)
+
+    assert report['stopped'] == 'budget'
+    assert report['passes_run'] == []
+    assert report['elapsed_ms'] < 50
+
+
+SAMPLE_DIR = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), 'static', 'op_dateset')
+
+
+def sample_images(limit=6, max_side=480):
+    paths = sorted(glob.glob(os.path.join(SAMPLE_DIR, '**', '*.*'), recursive=True))
+    images = []
+    for path in paths:
+        image = cv2.imread(path)
+        if image is None:
+            continue
+        scale = max_side / max(image.shape[:2])
+        if scale < 1:
+            image = cv2.resize(image, None, fx=scale, fy=scale, interpolation=cv2.INTER_AREA)
+        images.append(image)
+        if len(images) == limit:
+            break
+    return images
+
+
+def test_parallel_sweep_matches_serial_sweep():
+    from face_detector import FaceDetector
+    images = sample_images()
+    if not images:
+        pytest.skip(f"no sample images under {SAMPLE_DIR}")
+    serial = FaceDetector(parallelism=1)
+    parallel = FaceDetector(parallelism=4)
+    for image in images:
+        assert parallel.detect_faces_cascade(image) == serial.detect_faces_cascade(image)
@@ -0,0 +1,51 @@
+import os
+
+import pytest
+
+from file_discovery import ImageFileScanner, shard_of
+
+
+@pytest.mark.parametrize('relative_path, count, expected', [
+    ('a.jpg', 7, 3),
+    ('sub/b.png', 7, 6),
+    ('deep/er/c.jpeg', 7, 0),
+    ('sub/b.png', 1000, 869),
+    ('x.zip!m/1.jpg', 1000, 284),
+])
+def test_shard_of_is_pinned(relative_path, count, expected):
+    # Changing these reassigns files between the nodes of a running job
+    assert shard_of(relative_path, count) == expected
+
+
+def test_shard_of_spreads_files():
+    counts = [0] * 4
+    for i in range(4000):
+        counts[shard_of(f"dir{i % 13}/img_{i}.jpg", 4)] += 1
+    assert min(counts) > 850
+
+
+def make_tree(root):
+    for relative_path in ['a.jpg', 'b.png', 'sub/c.jpg', 'sub/d.jpeg', 'sub/deeper/e.jpg', 'notes.txt']:
+        path = root / relative_path
+        path.parent.mkdir(parents=True, exist_ok=True)
+        path.write_bytes(b'')
+
+
+def relative_files(root, **options):
+    return sorted(os.path.relpath(path, root) for path in ImageFileScanner(root, **options))
+
+
+def test_shards_partition_the_tree(tmp_path):
+    make_tree(tmp_path)
+    everything = relative_files(tmp_path)
+    assert len(everything) == 5
+    shards = [relative_files(tmp_path, shard=(index, 3)) for index in range(3)]
+    assert sorted(sum(shards, [])) == everything
+
+
+def test_shards_do_not_depend_on_the_mount_point(tmp_path):
+    make_tree(tmp_path / 'node1' / 'mnt')
+    make_tree(tmp_path / 'node2')
+    for index in range(3):
+        assert (relative_files(tmp_path / 'node1' / 'mnt', shard=(index, 3)) ==
+                relative_files(tmp_path / 'node2', shard=(index, 3)))
@@ -0,0 +1,79 @@
+import base64
+import io
+import struct
+import zlib
+
+import pytest
+from flask import Flask, request
+from PIL import Image
+
+from image_io import ImageTooLargeError, MAX_IMAGE_PIXELS, probe_image, read_image_upload
+
+
+def png_chunk(kind, data):
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data))
+
+
+def png_header(width, height):
+    """A PNG declaring width x height but holding no pixels: enough for the header probe"""
+    ihdr = struct.pack('>IIBBBBB', width, height, 8, 2, 0, 0, 0)
+    return b'\x89PNG\r\n\x1a\n' + png_chunk(b'IHDR', ihdr) + png_chunk(b'IEND', b'')
+
+
+def test_probe_reads_header_only():
+    source = io.BytesIO(png_header(640, 480))
+    assert probe_image(source) == (640, 480, 'PNG')
+    assert source.tell() == 0
+
+
+@pytest.mark.parametrize('size', [(9000, 9000), (15000, 13000)])
+def test_probe_rejects_bombs_as_too_large(size):
+    # 15000x13000 is past PIL's own DecompressionBombError threshold
+    with pytest.raises(ImageTooLargeError):
+        probe_image(io.BytesIO(png_header(*size)))
+
+
+def test_pil_limit_follows_the_configured_limit():
+    # Otherwise IMAGE_MAX_PIXELS above PIL's hard limit (~179M) would have no effect
+    assert Image.MAX_IMAGE_PIXELS == MAX_IMAGE_PIXELS
+
+
+@pytest.mark.parametrize('module', ['app', 'server'])
+def test_predict_returns_413_for_bombs(module, model_checkpoint):
+    flask_app = pytest.importorskip(module).app
+    assert 15000 * 13000 > MAX_IMAGE_PIXELS
+    response = flask_app.test_client().post('/predict', data=png_header(15000, 13000),
+                                            content_type='image/png')
+    assert response.status_code == 413
+
+
+def read_upload(**kwargs):
+    with Flask(__name__).test_request_context('/predict', method='POST', **kwargs):
+        upload = read_image_upload(request)
+        return upload.read() if upload is not None else None
+
+
+@pytest.mark.parametrize('content_type', ['image/png', 'application/octet-stream'])
+def test_raw_uploads(content_type):
+    assert read_upload(data=png_header(4, 3), content_type=content_type) == png_header(4, 3)
+    assert read_upload(data=b'', content_type=content_type) is None
+
+
+def test_multipart_uploads():
+    data = {'image': (io.BytesIO(png_header(4, 3)), 'luffy.png')}
+    assert read_upload(data=data, content_type='multipart/form-data') == png_header(4, 3)
+    data = {'photo': (io.BytesIO(png_header(4, 3)), 'luffy.png')}
+    assert read_upload(data=data, content_type='multipart/form-data') is None
+
+
+def test_json_uploads():
+    encoded = base64.b64encode(png_header(4, 3)).decode()
+    assert read_upload(json={'image': encoded}) == png_header(4, 3)
+    assert read_upload(json={'image': f'data:image/png;base64,{encoded}'}) == png_header(4, 3)
+    assert read_upload(json={'photo': encoded}) is None
+    assert read_upload(data=b'not json', content_type='text/plain') is None
+
+
+def test_invalid_base64_is_a_value_error():
+    with pytest.raises(ValueError, match="Invalid base64"):
+        read_upload(json={'image': 'data:image/png;base64,abc'})
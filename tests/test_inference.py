@@ -0,0 +1,55 @@
+import os
+
+
+def write_checkpoint(tmp_path):
+    weights = tmp_path / 'model.safetensors'
+    weights.write_bytes(b'\0' * 1024)
+    (tmp_path / 'model.json').write_text('{"num_classes": 1}')
+    return str(weights)
+
+
+def test_model_version_follows_checkpoint_writes(inference, tmp_path, monkeypatch):
+    monkeypatch.delenv('MODEL_VERSION', raising=False)
+    weights = write_checkpoint(tmp_path)
+    version = inference.compute_model_version(weights)
+    assert version == inference.compute_model_version(weights)
+
+    stat = os.stat(weights)
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert inference.compute_model_version(weights) != version
+
+
+def test_model_version_does_not_read_the_weights(inference, tmp_path, monkeypatch):
+    monkeypatch.delenv('MODEL_VERSION', raising=False)
+    weights = write_checkpoint(tmp_path)
+    before = inference.compute_model_version(weights)
+    # Same size and mtime, different bytes: only a stat is taken
+    stat = os.stat(weights)
+    with open(weights, 'r+b') as f:
+        f.write(b'\1')
+    os.utime(weights, ns=(stat.st_atime_ns, stat.st_mtime_ns))
+    assert inference.compute_model_version(weights) == before
+
+
+def test_model_version_override(inference, tmp_path, monkeypatch):
+    monkeypatch.setenv('MODEL_VERSION', 'release-7')
+    assert inference.compute_model_version(write_checkpoint(tmp_path)) == 'release-7'
+
+
+def test_resolve_prefers_an_up_to_date_export(inference, tmp_path):
+    checkpoint = tmp_path / 'model.pth'
+    export = tmp_path / 'model.safetensors'
+    checkpoint.write_bytes(b'pth')
+    assert inference.resolve_model_path(str(checkpoint)) == str(checkpoint)
+
+    export.write_bytes(b'export')
+    stat = os.stat(checkpoint)
+    os.utime(export, ns=(stat.st_atime_ns, stat.st_mtime_ns + 1_000_000_000))
+    assert inference.resolve_model_path(str(checkpoint)) == str(export)
+
+    # Retrained after the export: the export is stale
+    os.utime(checkpoint, ns=(stat.st_atime_ns, stat.st_mtime_ns + 2_000_000_000))
+    assert inference.resolve_model_path(str(checkpoint)) == str(checkpoint)
+
+    checkpoint.unlink()
+    assert inference.resolve_model_path(str(checkpoint)) == str(export)
@@ -0,0 +1,97 @@
+import os
+
+from PIL import Image
+
+from job_manifest import JobManifest
+from preprocessing import ImageFileDataset
+
+
+def write_image(path, color):
+    Image.new('RGB', (32, 32), color).save(path, format='BMP')
+    return str(path)
+
+
+def classify(path):
+    """The result iter_result_batches would record for path"""
+    dataset = ImageFileDataset(transform=lambda image: image.size)
+    _, _, _, error, info = dataset.load(0, path)
+    assert error is None
+    info.pop('timings')
+    return dict({'image_path': path, 'success': True, 'predicted_class': 'Luffy'}, **info)
+
+
+def shift_mtime(path, seconds=10):
+    stat = os.stat(path)
+    os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns + seconds * 1_000_000_000))
+
+
+def test_resume_reuses_unchanged_files(tmp_path):
+    path = write_image(tmp_path / 'a.bmp', 'red')
+    manifest = JobManifest(tmp_path / 'manifest.sqlite', 'v1')
+    result = classify(path)
+    manifest.record([result])
+    assert len(manifest) == 1
+
+    reopened = JobManifest(tmp_path / 'manifest.sqlite', 'v1')
+    assert reopened.lookup(path) == result
+
+
+def test_failed_results_are_not_recorded(tmp_path):
+    path = write_image(tmp_path / 'a.bmp', 'red')
+    manifest = JobManifest(tmp_path / 'manifest.sqlite', 'v1')
+    manifest.record([dict(classify(path), success=False, error='boom')])
+    assert len(manifest) == 0
+    assert manifest.lookup(path) is None
+
+
+def test_other_model_version_misses(tmp_path):
+    path = write_image(tmp_path / 'a.bmp', 'red')
+    JobManifest(tmp_path / 'manifest.sqlite', 'v1').record([classify(path)])
+    assert JobManifest(tmp_path / 'manifest.sqlite', 'v2').lookup(path) is None
+
+
+def test_size_change_invalidates(tmp_path):
+    path = write_image(tmp_path / 'a.bmp', 'red')
+    manifest = JobManifest(tmp_path / 'manifest.sqlite', 'v1')
+    manifest.record([classify(path)])
+    with open(path, 'ab') as f:
+        f.write(b'\0')
+    assert manifest.lookup(path) is None
+
+
+def test_touched_file_is_reused_when_its_content_matches(tmp_path):
+    path = write_image(tmp_path / 'a.bmp', 'red')
+    manifest = JobManifest(tmp_path / 'manifest.sqlite', 'v1')
+    result = classify(path)
+    manifest.record([result])
+
+    shift_mtime(path)
+    assert manifest.lookup(path) == result
+    # The new mtime is stored, so the next lookup needs no hash
+    row = manifest._connect().execute("SELECT mtime_ns FROM files").fetchone()
+    assert row[0] == os.stat(path).st_mtime_ns
+
+
+def test_rewritten_file_with_same_size_is_reclassified(tmp_path):
+    path = write_image(tmp_path / 'a.bmp', 'red')
+    manifest = JobManifest(tmp_path / 'manifest.sqlite', 'v1')
+    manifest.record([classify(path)])
+
+    size = os.path.getsize(path)
+    write_image(path, 'blue')
+    assert os.path.getsize(path) == size
+    shift_mtime(path)
+    assert manifest.lookup(path) is None
+
+
+def test_file_rewritten_before_record_is_not_trusted(tmp_path):
+    path = write_image(tmp_path / 'a.bmp', 'red')
+    manifest = JobManifest(tmp_path / 'manifest.sqlite', 'v1')
+    result = classify(path)
+
+    # Rewritten while the batch was in flight: the stored stat must describe
+    # the classified bytes, not the new ones
+    write_image(path, 'blue')
+    shift_mtime(path)
+    manifest.record([result])
+    assert manifest.lookup(path) is None
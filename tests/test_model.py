@@ -0,0 +1,41 @@
+import pytest
+import torch
+import torch.nn as nn
+
+from model import export_safetensors, load_safetensors_state_dict
+
+
+def small_model():
+    torch.manual_seed(0)
+    model = nn.Sequential(nn.Conv2d(3, 4, 3), nn.BatchNorm2d(4), nn.Flatten(), nn.Linear(4 * 6 * 6, 5))
+    model[1].running_mean.uniform_(-1, 1)
+    model[1].num_batches_tracked.fill_(7)
+    return model
+
+
+@pytest.mark.parametrize('dtype', [torch.float32, torch.float16])
+def test_safetensors_round_trip(tmp_path, dtype):
+    pytest.importorskip('safetensors')
+    model = small_model()
+    path = str(tmp_path / 'model.safetensors')
+    export_safetensors(model, path, dtype=dtype)
+    loaded = load_safetensors_state_dict(path)
+
+    expected = model.state_dict()
+    assert loaded.keys() == expected.keys()
+    for name, tensor in loaded.items():
+        assert tensor.shape == expected[name].shape
+        if expected[name].is_floating_point():
+            # fp16 exports are upcast back to float32 on load
+            assert tensor.dtype == torch.float32
+            torch.testing.assert_close(tensor, expected[name].to(dtype).float(), rtol=0, atol=0)
+        else:
+            assert tensor.dtype == expected[name].dtype
+            assert torch.equal(tensor, expected[name])
+
+    copy = small_model()
+    copy.load_state_dict(loaded)
+    copy.eval()
+    model.eval()
+    image = torch.randn(2, 3, 8, 8)
+    torch.testing.assert_close(copy(image), model(image), rtol=0, atol=1e-2 if dtype == torch.float16 else 0)
@@ -0,0 +1,76 @@
+import random
+
+import cv2
+import numpy as np
+import pytest
+from PIL import Image
+
+from perceptual_hash import MultiIndexHashIndex, dhash, hamming_distance
+
+
+def flip_bits(value_hash, count, rng):
+    for bit in rng.sample(range(64), count):
+        value_hash ^= 1 << bit
+    return value_hash
+
+
+def brute_force(entries, query, max_distance):
+    distances = [(hamming_distance(query, stored), value) for stored, value in entries]
+    within = [(distance, value) for distance, value in distances if distance <= max_distance]
+    return min(within)[0] if within else None
+
+
+@pytest.mark.parametrize('max_distance', [0, 3, 6, 10])
+def test_find_matches_brute_force(max_distance):
+    rng = random.Random(max_distance)
+    stored = [rng.getrandbits(64) for _ in range(300)]
+    index = MultiIndexHashIndex(max_distance)
+    entries = []
+    for value, value_hash in enumerate(stored):
+        index.add(value_hash, value)
+        entries.append((value_hash, value))
+
+    queries = [flip_bits(rng.choice(stored), rng.randint(0, max_distance + 3), rng) for _ in range(300)]
+    queries += [rng.getrandbits(64) for _ in range(50)]
+    for query in queries:
+        found = index.find(query)
+        expected = brute_force(entries, query, max_distance)
+        if expected is None:
+            assert found is None
+        else:
+            value, distance = found
+            assert distance == expected
+            assert hamming_distance(query, stored[value]) == distance
+
+
+def test_eviction_drops_the_oldest_entries():
+    index = MultiIndexHashIndex(4, max_entries=2)
+    index.add(0x0, 'first')
+    index.add(0xFFFF << 48, 'second')
+    index.add(0xFFFF, 'third')
+    assert len(index) == 2
+    assert index.find(0x0) is None
+    assert index.find(0xFFFF << 48) == ('second', 0)
+    assert index.find(0xFFFF ^ 0b101) == ('third', 2)
+    assert all(key_ids for table in index._tables for key_ids in table.values())
+
+
+def test_max_distance_is_checked():
+    with pytest.raises(ValueError):
+        MultiIndexHashIndex(64)
+
+
+def test_dhash_survives_resizing_and_reencoding():
+    rng = np.random.default_rng(0)
+    image = cv2.GaussianBlur(rng.integers(0, 256, (240, 320, 3), dtype=np.uint8), (31, 31), 0)
+    original = dhash(image)
+
+    smaller = cv2.resize(image, (160, 120), interpolation=cv2.INTER_AREA)
+    _, encoded = cv2.imencode('.jpg', image, [cv2.IMWRITE_JPEG_QUALITY, 60])
+    reencoded = cv2.imdecode(encoded, cv2.IMREAD_COLOR)
+    assert hamming_distance(original, dhash(smaller)) <= 4
+    assert hamming_distance(original, dhash(reencoded)) <= 4
+
+    # A PIL image of the same pixels hashes the same as the OpenCV array
+    assert dhash(Image.fromarray(cv2.cvtColor(image, cv2.COLOR_BGR2RGB))) == original
+    assert hamming_distance(original, dhash(cv2.flip(image, 1))) > 10
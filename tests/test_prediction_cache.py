@@ -0,0 +1,61 @@
+import threading
+import time
+
+from prediction_cache import PredictionCache, SQLiteCacheBackend, create_cache_from_env
+
+
+def test_lru_eviction_and_versioned_keys():
+    cache = PredictionCache('v1', max_entries=2)
+    cache.put('a', {'character': 'Luffy'})
+    cache.put('b', {'character': 'Zoro'})
+    assert cache.get('a') == {'character': 'Luffy'}
+    cache.put('c', {'character': 'Nami'})
+    assert cache.get('b') is None
+    assert PredictionCache('v2').get('a') is None
+
+
+def test_env_bounds_the_shared_backend(tmp_path, monkeypatch):
+    monkeypatch.setenv('PREDICTION_CACHE_DB', str(tmp_path / 'cache.sqlite'))
+    monkeypatch.setenv('PREDICTION_CACHE_SIZE', '50')
+    monkeypatch.delenv('PREDICTION_CACHE_DB_SIZE', raising=False)
+    assert create_cache_from_env('v1').backend.max_entries == 50
+    monkeypatch.setenv('PREDICTION_CACHE_DB_SIZE', '500')
+    assert create_cache_from_env('v1').backend.max_entries == 500
+
+
+def test_backend_stays_bounded_under_concurrent_writes(tmp_path):
+    backend = SQLiteCacheBackend(str(tmp_path / 'cache.sqlite'), max_entries=20, ttl_seconds=0)
+
+    def write(thread):
+        for i in range(100):
+            backend.put(f"{thread}:{i}", {'i': i})
+
+    threads = [threading.Thread(target=write, args=(t,)) for t in range(4)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert backend._writes == 400
+    assert len(backend) <= 20
+
+
+def test_backend_hits_keep_their_age(tmp_path, monkeypatch):
+    backend = SQLiteCacheBackend(str(tmp_path / 'cache.sqlite'), ttl_seconds=60)
+    PredictionCache('v1', backend=backend).put('a', {'character': 'Luffy'})
+
+    # Another worker finds the entry in the shared store 50 seconds later
+    clock = time.time()
+    monkeypatch.setattr(time, 'time', lambda: clock + 50)
+    cache = PredictionCache('v1', ttl_seconds=60, backend=backend)
+    assert cache.get('a') == {'character': 'Luffy'}
+    assert cache.backend_hits == 1
+    created, _ = cache._entries[cache.key_for('a')]
+    assert time.monotonic() - created >= 50
+
+    # ...and it expires from memory with the stored entry, not 60 seconds after that hit
+    monotonic = time.monotonic()
+    monkeypatch.setattr(time, 'monotonic', lambda: monotonic + 11)
+    monkeypatch.setattr(time, 'time', lambda: clock + 61)
+    assert cache.get('a') is None
+    assert cache.misses == 1
@@ -0,0 +1,118 @@
+import io
+from pathlib import Path
+
+import cv2
+import numpy as np
+import pytest
+import torch
+import torchvision.transforms as transforms
+from PIL import Image
+from torch.utils.data import DataLoader
+
+from face_detector import FaceDetector
+from image_io import decode_image, decode_image_array
+from preprocessing import FusedPreprocessor, ImageFileDataset, PathBatches, collate_images
+
+transform = transforms.Compose([transforms.Resize((8, 8)), transforms.ToTensor()])
+
+
+class CountingPaths:
+    """Re-iterable path list that counts how often it is listed, like a rescanning ImageFileScanner"""
+
+    def __init__(self, paths):
+        self.paths = paths
+        self.scans = 0
+
+    def __iter__(self):
+        self.scans += 1
+        return iter(self.paths)
+
+
+def write_images(directory, count):
+    paths = []
+    for i in range(count):
+        path = directory / f'{i:02d}.png'
+        Image.new('RGB', (16, 12), (i * 20, 0, 0)).save(path)
+        paths.append(str(path))
+    return paths
+
+
+def test_path_batches():
+    assert list(PathBatches(['a', 'b', 'c'], 2)) == [[(0, 'a'), (1, 'b')], [(2, 'c')]]
+    assert list(PathBatches([], 2)) == []
+
+
+def test_workers_share_one_listing(tmp_path):
+    paths = CountingPaths(write_images(tmp_path, 10))
+    loader = DataLoader(ImageFileDataset(transform), batch_sampler=PathBatches(paths, 3), num_workers=2,
+                        collate_fn=collate_images)
+    positions = []
+    listed = []
+    for batch, items in loader:
+        assert batch.shape == (len(items), 3, 8, 8)
+        positions.extend(position for position, _, _, _ in items)
+        listed.extend(path for _, path, _, _ in items)
+    assert paths.scans == 1
+    assert positions == list(range(10))
+    assert listed == paths.paths
+
+
+def test_load_isolates_unreadable_files(tmp_path):
+    good, = write_images(tmp_path, 1)
+    broken = tmp_path / 'broken.png'
+    broken.write_bytes(b'not an image')
+    batch, items = collate_images([ImageFileDataset(transform)[(0, good)],
+                                   ImageFileDataset(transform)[(1, str(broken))]])
+    assert torch.is_tensor(batch) and batch.shape[0] == 1
+    assert items[0][2] is None and items[1][2]
+
+
+
+class SharedFaces(FaceDetector):
+    """Reports the boxes found once per image, so both paths crop the same region"""
+
+    faces = ()
+
+    def detect_faces(self, image):
+        return self.faces
+
+
+def sample_images():
+    from model import data_dir
+    return sorted(path for path in Path(data_dir).rglob('*')
+                  if path.suffix.lower() in ('.jpg', '.jpeg', '.png', '.bmp'))
+
+
+def chain_input(inference, detector, data, letterbox):
+    """Model input from the decode -> crop -> PIL -> transform chain /predict used before"""
+    image_cv = cv2.cvtColor(np.array(decode_image(io.BytesIO(data))), cv2.COLOR_RGB2BGR)
+    if letterbox:
+        # server.py
+        region = detector.crop_face(image_cv)
+    else:
+        # app.py
+        face_detected, cropped = detector.detect_face(image_cv)
+        region = cropped if face_detected else image_cv
+    return inference.transform(Image.fromarray(cv2.cvtColor(region, cv2.COLOR_BGR2RGB)))
+
+
+@pytest.mark.parametrize('letterbox_size', [(300, 400), None], ids=['letterbox', 'stretch'])
+def test_fused_preprocessor_matches_the_transform_chain(inference, letterbox_size):
+    paths = sample_images()
+    if not paths:
+        pytest.skip("no sample images")
+    detector = SharedFaces(mode='fast')
+    # As configured in server.py and app.py
+    preprocessor = FusedPreprocessor(inference.model_transform_spec, detector, letterbox_size=letterbox_size,
+                                     crop_without_face=letterbox_size is not None)
+    for path in paths:
+        data = path.read_bytes()
+        image = decode_image_array(io.BytesIO(data), min_side=0)
+        detector.faces = FaceDetector.detect_faces(detector, image)
+        expected = chain_input(inference, detector, data, letterbox_size)
+        actual, _ = preprocessor(image)
+        assert (actual - expected).abs().mean().item() <= 0.1, path
+
+        with torch.no_grad():
+            logits = inference.model(torch.stack([expected, actual]))
+        assert logits[0].argmax() == logits[1].argmax(), path
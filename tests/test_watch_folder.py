@@ -0,0 +1,114 @@
+import os
+import time
+
+from job_manifest import JobManifest
+from watch_folder import FolderWatcher
+
+HOUR_NS = 3600 * 1_000_000_000
+
+
+def write_file(path, age_ns=0):
+    path.write_bytes(b'\xff\xd8 not really a jpeg')
+    if age_ns:
+        stat = os.stat(path)
+        os.utime(path, ns=(stat.st_atime_ns, stat.st_mtime_ns - age_ns))
+    return str(path)
+
+
+def test_files_present_at_startup_are_queued_when_old_enough(tmp_path):
+    old = write_file(tmp_path / 'old.jpg', age_ns=HOUR_NS)
+    write_file(tmp_path / 'new.jpg')
+    watcher = FolderWatcher([str(tmp_path)], settle_seconds=60)
+    assert watcher.poll() == [old]
+    assert watcher.poll() == []
+
+
+def test_copies_with_an_old_mtime_wait_to_settle(tmp_path):
+    watcher = FolderWatcher([str(tmp_path)], settle_seconds=0.3)
+    assert watcher.poll() == []
+
+    # e.g. cp -p or rsync -t: the mtime is old but the copy may still be running
+    path = write_file(tmp_path / 'copied.jpg', age_ns=HOUR_NS)
+    assert watcher.poll() == []
+    time.sleep(0.4)
+    assert watcher.poll() == [path]
+
+
+def test_growing_files_restart_the_settle_window(tmp_path):
+    watcher = FolderWatcher([str(tmp_path)], settle_seconds=0.3)
+    watcher.poll()
+    path = write_file(tmp_path / 'upload.jpg')
+    watcher.poll()
+    time.sleep(0.2)
+    with open(path, 'ab') as f:
+        f.write(b'more')
+    time.sleep(0.2)
+    assert watcher.poll() == []
+    time.sleep(0.4)
+    assert watcher.poll() == [path]
+
+
+def record_as_handled(manifest, paths):
+    results = []
+    for path in paths:
+        stat = os.stat(path)
+        results.append({'image_path': path, 'success': True, 'sha256': '0' * 64,
+                        'file_size': stat.st_size, 'file_mtime_ns': stat.st_mtime_ns})
+    manifest.record(results)
+
+
+def test_handled_files_are_not_queued_again(tmp_path):
+    watched = tmp_path / 'watched'
+    watched.mkdir()
+    paths = [write_file(watched / f'{i}.jpg', age_ns=HOUR_NS) for i in range(10)]
+    manifest = JobManifest(tmp_path / 'manifest.sqlite', 'v1')
+    watcher = FolderWatcher([str(watched)], settle_seconds=0.1, is_handled=manifest.holds)
+    assert sorted(watcher.poll()) == sorted(paths)
+    record_as_handled(manifest, paths[:7])
+
+    # The three unhandled (e.g. failed) files stay remembered, the rest is forgotten
+    for _ in range(4):
+        assert watcher.poll() == []
+    assert sorted(watcher._queued) == sorted(paths[7:])
+    assert watcher._pending == {}
+
+    # A restarted watcher skips what the manifest holds
+    restarted = FolderWatcher([str(watched)], settle_seconds=0.1, is_handled=manifest.holds)
+    assert sorted(restarted.poll()) == sorted(paths[7:])
+
+
+def test_changed_files_are_queued_again(tmp_path):
+    path = write_file(tmp_path / 'a.jpg', age_ns=HOUR_NS)
+    watcher = FolderWatcher([str(tmp_path)], settle_seconds=0.1)
+    assert watcher.poll() == [path]
+    with open(path, 'ab') as f:
+        f.write(b'more')
+    assert watcher.poll() == []
+    time.sleep(0.2)
+    assert watcher.poll() == [path]
+
+
+def test_deleted_files_are_forgotten(tmp_path):
+    path = write_file(tmp_path / 'a.jpg', age_ns=HOUR_NS)
+    watcher = FolderWatcher([str(tmp_path)], settle_seconds=0.1)
+    assert watcher.poll() == [path]
+    os.remove(path)
+    assert watcher.poll() == []
+    assert watcher._queued == {}
+
+
+def test_background_thread_checks_the_manifest(tmp_path):
+    watched = tmp_path / 'watched'
+    watched.mkdir()
+    paths = [write_file(watched / f'{i}.jpg', age_ns=HOUR_NS) for i in range(4)]
+    manifest = JobManifest(tmp_path / 'manifest.sqlite', 'v1')
+    record_as_handled(manifest, paths[:2])
+    with FolderWatcher([str(watched)], interval=0.05, settle_seconds=0.1, is_handled=manifest.holds) as watcher:
+        queued = []
+        while len(queued) < 2:
+            files = watcher.get_files(10, timeout=5)
+            assert files
+            queued.extend(files)
+        assert sorted(queued) == sorted(paths[2:])
+        assert watcher.get_files(10, timeout=0.3) == []
+    manifest.close()
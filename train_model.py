@@ -13,17 +13,7 @@ from pathlib import Path
 # Add current directory to path for imports
 sys.path.append(os.path.dirname(os.path.abspath(__file__)))
 
-from model import (
-    FastOnePieceClassifier, 
-    train_model, 
-    train_loader, 
-    val_loader, 
-    device, 
-    optimizer, 
-    criterion, 
-    scheduler,
-    num_classes
-)
+from model import build_training_components, train_model, plot_training_curves
 
 def main():
     """Main training function"""
@@ -38,13 +28,17 @@ def main():
         return
     
     print(f"✅ Dataset found at: {data_dir}")
+    
+    # Build dataset, loaders and model
+    components = build_training_components(data_dir)
+    model = components['model']
+    device = components['device']
+    num_classes = components['num_classes']
+    train_loader = components['train_loader']
+    val_loader = components['val_loader']
     print(f"📊 Number of classes: {num_classes}")
     print(f"⚡ Using device: {device}")
     
-    # Create model
-    model = FastOnePieceClassifier(num_classes=num_classes)
-    model.to(device)
-    
     print(f"\n📋 Model Architecture:")
     print(f"   Base Model: MobileNetV3-Small")
     print(f"   Input Size: 224x224")
@@ -98,16 +92,19 @@ def main():
             val_loader=val_loader,
             num_epochs=num_epochs,
             device=device,
-            optimizer=optimizer,
-            criterion=criterion,
-            scheduler=scheduler
+            optimizer=components['optimizer'],
+            criterion=components['criterion'],
+            scheduler=components['scheduler'],
+            class_names=components['dataset'].data.classes
         )
+        plot_training_curves(train_losses, val_losses)
         
         # Training completed successfully
         total_time = time.time() - start_time
         print(f"\n🎉 Training completed successfully!")
         print(f"⏱️  Total training time: {datetime.timedelta(seconds=int(total_time))}")
         print(f"💾 Model saved as: One_Piece_Model.pth")
+        print(f"📦 Model bundle saved as: One_Piece_Model.json")
         print(f"📊 Training curves saved as: training_curves.png")
         
         # Final statistics
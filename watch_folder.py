@@ -0,0 +1,154 @@
+#!/usr/bin/env python3
+"""
+Watch folders for One Piece Character Classifier
+Polls directories for new image files and hands them to a long-running
+classifier through a bounded queue, once they have stopped changing
+"""
+
+import os
+import time
+import queue
+import threading
+
+from archive_io import source_stat
+from file_discovery import ImageFileScanner
+
+
+class FolderWatcher:
+    """Background poller queueing new image files once they are completely written
+
+    Every interval seconds each directory is rescanned (see file_discovery,
+    which takes the scan_options). A new file is queued once its size and
+    mtime have not changed for settle_seconds since it was first seen, so
+    files still being copied or uploaded are left alone, even when the copy
+    preserves an old mtime. Only files already present at the first poll are
+    queued right away when their mtime is that old.
+
+    is_handled(path, size, mtime_ns), e.g. JobManifest.holds, tells which
+    files the consumer is done with: those are never queued, and a queued
+    path is forgotten once it is handled, so memory stays bounded by the files
+    queued or in flight, not by the size of the tree. Files queued but never
+    handled, e.g. because they failed, are remembered while they exist and
+    queued again only when they change. Without is_handled every queued path
+    is remembered.
+
+    The queue holds at most queue_size paths. When the consumer falls behind,
+    polling pauses until there is room again, so memory stays bounded however
+    many files land at once. Polling works on any filesystem, including
+    network mounts where inotify events are not delivered.
+    """
+
+    def __init__(self, directories, interval=2.0, settle_seconds=2.0, queue_size=1024, is_handled=None,
+                 **scan_options):
+        for directory in directories:
+            if not os.path.isdir(directory):
+                raise ValueError(f"Input directory {directory} does not exist")
+        self.scanners = [ImageFileScanner(directory, **scan_options) for directory in directories]
+        self.interval = interval
+        self.settle_seconds = settle_seconds
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.is_handled = is_handled
+        # Paths queued and not handled yet -> (size, mtime_ns) when queued
+        self._queued = {}
+        # Paths seen but possibly still being written -> (size, mtime_ns, unchanged since)
+        self._pending = {}
+        self._first_poll = True
+        self._stop = threading.Event()
+        self._thread = None
+
+    def poll(self):
+        """Scan once, returning the new files that are ready to classify"""
+        return list(self._iter_ready())
+
+    def _handled(self, path, signature):
+        return self.is_handled is not None and self.is_handled(path, *signature)
+
+    def _iter_ready(self):
+        """Scan once, yielding new files as soon as they are found ready"""
+        now = time.time()
+        # Remembered paths still present; the rest of the tree is not kept
+        seen = set()
+        for scanner in self.scanners:
+            for path in scanner:
+                ready = self._check(path, now)
+                if path in self._pending or path in self._queued:
+                    seen.add(path)
+                if ready:
+                    yield path
+        # Forget files that were deleted or renamed
+        for paths in (self._pending, self._queued):
+            for path in [p for p in paths if p not in seen]:
+                del paths[path]
+        self._first_poll = False
+
+    def _check(self, path, now):
+        """Track path, True when it is ready to be queued"""
+        try:
+            signature = source_stat(path)
+        except OSError:
+            return False
+        queued = self._queued.get(path)
+        if queued == signature:
+            if self._handled(path, signature):
+                del self._queued[path]
+            return False
+        if queued is not None:
+            # Changed since it was queued: a new version to classify
+            del self._queued[path]
+        elif path not in self._pending and self._handled(path, signature):
+            return False
+        previous = self._pending.get(path)
+        if previous is None or previous[:2] != signature:
+            # New or still growing. A copy can carry an old mtime, so only
+            # files that were there before the watcher started may count as
+            # settled already
+            since = min(now, signature[1] / 1e9) if self._first_poll else now
+            self._pending[path] = signature + (since,)
+            previous = self._pending[path]
+        if signature[0] == 0 or now - previous[2] < self.settle_seconds:
+            return False
+        del self._pending[path]
+        self._queued[path] = signature
+        return True
+
+    def _run(self):
+        while not self._stop.is_set():
+            # Lazily, so a full queue pauses the scan itself
+            for path in self._iter_ready():
+                while not self._stop.is_set():
+                    try:
+                        self.queue.put(path, timeout=self.interval)
+                        break
+                    except queue.Full:
+                        continue
+            self._stop.wait(self.interval)
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name='folder-watcher', daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+            self._thread = None
+
+    def get_files(self, max_files, timeout=None):
+        """Wait up to timeout for a queued file, then take whatever else is queued, up to max_files"""
+        try:
+            files = [self.queue.get(timeout=timeout)]
+        except queue.Empty:
+            return []
+        while len(files) < max_files:
+            try:
+                files.append(self.queue.get_nowait())
+            except queue.Empty:
+                break
+        return files
+
+    def __enter__(self):
+        self.start()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.stop()